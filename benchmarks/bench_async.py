@@ -0,0 +1,109 @@
+"""Load-tests asynchronous retrieval (``AnseriniRetriever.asearch``) with simulated concurrent clients.
+
+Each client is an asyncio task that sends its requests one after another (waiting for each response, plus an optional
+think time), as the handlers of a web service would. The following ways of serving the requests are compared:
+
+- ``blocking``: calls ``retriever.search()`` from the event loop, which blocks it for the duration of each search.
+  (Its latencies exclude the time that requests wait for the blocked event loop, so only its throughput compares.)
+- ``executor``: runs ``retriever.search()`` on a single worker thread, so the event loop is not blocked, but each
+  request is searched separately.
+- ``asearch``: ``AnseriniAsyncSearcher``, which combines concurrent requests into batches.
+
+Usage::
+
+    python benchmarks/bench_async.py [--clients 32] [--requests 20] [--max-batch-size 32] [--max-wait 0.002]
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pyterrier as pt
+from bench_suite import sample_topics
+
+import pyterrier_anserini
+
+FIXTURE = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'tests', 'fixtures', 'vaswani.tar.lz4')
+
+
+async def load_test(
+    search: Callable[[str], Awaitable[pd.DataFrame]],
+    queries: List[str],
+    clients: int,
+    requests: int,
+    think_time: float,
+) -> Tuple[List[float], float]:
+    """Runs the clients concurrently, providing the latency of each request and the total elapsed time."""
+    latencies = []
+
+    async def client(i: int) -> None:
+        for j in range(requests):
+            query = queries[(i * requests + j) % len(queries)]
+            start = time.perf_counter()
+            await search(query)
+            latencies.append(time.perf_counter() - start)
+            if think_time:
+                await asyncio.sleep(think_time)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(i) for i in range(clients)])
+    return latencies, time.perf_counter() - start
+
+
+async def run_variant(variant: str, retriever: pyterrier_anserini.AnseriniRetriever, queries: List[str],
+        args: argparse.Namespace) -> Tuple[List[float], float]:
+    """Load-tests a way of serving the requests (see :func:`load_test`)."""
+    if variant == 'blocking':
+        async def search(query: str) -> pd.DataFrame:
+            return retriever.search(query)
+        return await load_test(search, queries, args.clients, args.requests, args.think_time)
+    if variant == 'executor':
+        executor = ThreadPoolExecutor(1)
+        loop = asyncio.get_running_loop()
+        async def search(query: str) -> pd.DataFrame:
+            return await loop.run_in_executor(executor, retriever.search, query)
+        try:
+            return await load_test(search, queries, args.clients, args.requests, args.think_time)
+        finally:
+            executor.shutdown()
+    async with retriever.async_searcher(max_batch_size=args.max_batch_size, max_wait=args.max_wait,
+            threads=args.threads) as searcher:
+        return await load_test(searcher.search, queries, args.clients, args.requests, args.think_time)
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--index', help='the index to search (defaults to the vaswani test fixture)')
+    parser.add_argument('--clients', type=int, default=32, help='the number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=20, help='the number of requests sent by each client')
+    parser.add_argument('--think-time', type=float, default=0., help='the time (s) each client waits between requests')
+    parser.add_argument('--num-results', type=int, default=100)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait', type=float, default=0.002)
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    pt.java.init()
+    if args.index is None:
+        index = pyterrier_anserini.AnseriniIndex.from_url(FIXTURE)
+    else:
+        index = pyterrier_anserini.AnseriniIndex(args.index)
+    retriever = index.bm25(num_results=args.num_results)
+    queries = list(sample_topics(index, 500)['query'])
+    retriever(sample_topics(index, 50, seed=1)) # warm-up
+
+    print(f'{args.clients} clients x {args.requests} requests, num_results={args.num_results}')
+    print(f'{"variant":<10}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}')
+    for variant in ['blocking', 'executor', 'asearch']:
+        latencies, elapsed = asyncio.run(run_variant(variant, retriever, queries, args))
+        print(f'{variant:<10}{len(latencies) / elapsed:>10.1f}{np.percentile(latencies, 50) * 1000:>10.1f}'
+              f'{np.percentile(latencies, 99) * 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Benchmarks the cold-start time of pyterrier_anserini: from a fresh interpreter to the results of a first query.
+
+Each run is a separate Python process, which times the import of pyterrier_anserini, the start of the JVM (including
+the Anserini initializer), opening the index, and a first BM25 query. The ``pyserini`` variant additionally imports
+``pyserini.search.lucene`` once the JVM has started, as the Anserini initializer previously did (which also imports
+pyserini's dense retrieval dependencies, e.g., torch and transformers).
+
+Usage::
+
+    python benchmarks/bench_cold_start.py [--runs 5] [--index INDEX_PATH]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+FIXTURE = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'tests', 'fixtures', 'vaswani.tar.lz4')
+
+RUN = '''
+import json, sys, time
+start = time.perf_counter()
+import pyterrier as pt
+import pyterrier_anserini
+imported = time.perf_counter()
+pt.java.init()
+if sys.argv[2] == 'pyserini':
+    import pyserini.search.lucene
+started = time.perf_counter()
+index = pyterrier_anserini.AnseriniIndex(sys.argv[1])
+index._searcher()
+opened = time.perf_counter()
+index.bm25(num_results=10).search('chemical reactions')
+searched = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'java_init': started - imported,
+    'open_index': opened - started,
+    'first_query': searched - opened,
+    'total': searched - start,
+}))
+'''
+
+
+def run(index_path: str, variant: str) -> dict:
+    """Runs a fresh interpreter and provides the time taken by each phase."""
+    out = subprocess.run([sys.executable, '-c', RUN, index_path, variant], check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--index', help='the index to search (defaults to the vaswani test fixture)')
+    args = parser.parse_args()
+
+    index_path = args.index
+    if index_path is None:
+        import pyterrier_anserini
+        index_path = pyterrier_anserini.AnseriniIndex.from_url(FIXTURE).path
+
+    phases = ['import', 'java_init', 'open_index', 'first_query', 'total']
+    print(f'median of {args.runs} runs (seconds)')
+    print(f'{"variant":<10}' + ''.join(f'{p:>13}' for p in phases))
+    for variant in ['lean', 'pyserini']:
+        results = [run(index_path, variant) for _ in range(args.runs)]
+        print(f'{variant:<10}' + ''.join(f'{statistics.median(r[p] for r in results):>13.2f}' for p in phases))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Compares the latency of impact retrieval with and without early termination (``early_termination=True``).
+
+Without early termination, Lucene scores every document that matches a query. With it, Lucene skips the documents
+that cannot enter the top ``num_results`` (using block-max WAND or MaxScore), which mostly helps long queries over
+large indexes with a small ``num_results``, such as the ``query_toks`` of learned sparse encoders over impact indexes.
+
+By default, an impact index is built from a synthetic corpus (a Zipfian vocabulary, with a random integer impact for
+each term of each document). Two sets of ``query_toks`` are sampled from the vocabulary of the index (weighted by
+document frequency): ``short`` (4 terms) and ``long`` (``--long-terms`` terms), each with random weights.
+
+For each ``num_results``, the p50/p99 latency (of single-query calls) of each variant is reported, along with the mean
+total hits (which become a lower bound under early termination) and the overlap of the results of the two variants.
+
+Usage::
+
+    python benchmarks/bench_pruning.py [--index path/to/impact/index] [--docs 50000] [--queries 200] [--long-terms 64]
+"""
+import argparse
+import tempfile
+import time
+from typing import Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pyterrier as pt
+from bench_suite import synthetic_corpus
+
+import pyterrier_anserini
+
+
+def impact_corpus(num_docs: int, *, seed: int = 0) -> Iterator[dict]:
+    """Generates documents with ``toks`` (a random integer impact for each distinct term) from a synthetic corpus."""
+    rng = np.random.default_rng(seed)
+    for doc in synthetic_corpus(num_docs, seed=seed):
+        terms = set(doc['text'].split())
+        yield {'docno': doc['docno'], 'toks': dict(zip(terms, rng.integers(1, 100, size=len(terms)).tolist()))}
+
+
+def sample_toks(index: pyterrier_anserini.AnseriniIndex, num_queries: int, num_terms: int, *,
+        seed: int = 0) -> pd.DataFrame:
+    """Samples ``query_toks`` of ``num_terms`` terms from the index's vocabulary, weighted by document frequency."""
+    rng = np.random.default_rng(seed)
+    terms, df, _ = index.vocab_stats()
+    probs = df / df.sum()
+    query_toks = []
+    for _ in range(num_queries):
+        sampled = rng.choice(len(terms), size=min(num_terms, len(terms)), replace=False, p=probs)
+        query_toks.append({terms[t].decode(): float(w) for t, w in zip(sampled, rng.uniform(0.1, 3., len(sampled)))})
+    return pd.DataFrame({'qid': [str(i) for i in range(num_queries)], 'query_toks': query_toks})
+
+
+def bench(retriever: pt.Transformer, topics: pd.DataFrame) -> Tuple[pd.DataFrame, List[float]]:
+    """Searches for each query on its own, providing the results and the latency of each query."""
+    retriever(topics.head(10)) # warm-up
+    latencies, results = [], []
+    for i in range(len(topics)):
+        start = time.perf_counter()
+        results.append(retriever(topics.iloc[i:i+1]))
+        latencies.append(time.perf_counter() - start)
+    return pd.concat(results, ignore_index=True), latencies
+
+
+def overlap(a: pd.DataFrame, b: pd.DataFrame) -> float:
+    """The mean fraction of the results of ``a`` that are also in ``b`` (for each query)."""
+    a = a.groupby('qid')['docno'].apply(set)
+    b = b.groupby('qid')['docno'].apply(set)
+    return float(np.mean([len(a[q] & b.get(q, set())) / len(a[q]) for q in a.index])) if len(a) else 1.
+
+
+def run(index: pyterrier_anserini.AnseriniIndex, args: argparse.Namespace) -> None:
+    """Reports the latency of each set of queries, with and without early termination."""
+    query_sets = {
+        'short': sample_toks(index, args.queries, 4),
+        'long': sample_toks(index, args.queries, args.long_terms, seed=1),
+    }
+    print(f'{"queries":<8}{"k":>6}{"variant":>8}{"p50 ms":>10}{"p99 ms":>10}{"hits":>10}{"overlap":>9}')
+    for name, topics in query_sets.items():
+        for num_results in [10, 100, 1000]:
+            exact = None
+            for variant in ['exact', 'pruned']:
+                retriever = index.impact(num_results=num_results, include_total_hits=True,
+                                         early_termination=variant == 'pruned')
+                res, latencies = bench(retriever, topics)
+                if exact is None:
+                    exact = res
+                hits = res.groupby('qid')['total_hits'].first().mean() if len(res) else 0.
+                print(f'{name:<8}{num_results:>6}{variant:>8}{np.percentile(latencies, 50) * 1000:>10.2f}'
+                      f'{np.percentile(latencies, 99) * 1000:>10.2f}{hits:>10.0f}{overlap(res, exact):>9.3f}')
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--index', help='the impact index to search (defaults to one built from a synthetic corpus)')
+    parser.add_argument('--docs', type=int, default=50_000, help='the documents of the synthetic corpus')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--long-terms', type=int, default=64, help='the terms of the long queries')
+    args = parser.parse_args()
+
+    pt.java.init()
+    if args.index is not None:
+        run(pyterrier_anserini.AnseriniIndex(args.index), args)
+        return
+    with tempfile.TemporaryDirectory() as d:
+        index = pyterrier_anserini.AnseriniIndex(f'{d}/index')
+        index.indexer(threads=4).index(impact_corpus(args.docs))
+        run(index, args)
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
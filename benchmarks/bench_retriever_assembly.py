@@ -0,0 +1,86 @@
+"""Benchmarks AnseriniRetriever result assembly against the per-hit loop it replaced.
+
+The per-hit loop searched with pyserini's ``LuceneSearcher`` and then accessed ``docid``, ``score`` (and
+``lucene_document`` for each of the ``include_fields``) of every hit individually. This script runs both over the
+vaswani fixture, checks that they produce the same results, and reports the throughput of each.
+
+Usage::
+
+    python benchmarks/bench_retriever_assembly.py [--num_results 1000] [--include_fields] [--repeats 3]
+"""
+import argparse
+import os
+import time
+from typing import Any, Callable, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pyterrier as pt
+import pyterrier_alpha as pta
+
+import pyterrier_anserini
+from pyterrier_anserini import AnseriniSimilarity
+
+FIXTURE = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'tests', 'fixtures', 'vaswani.tar.lz4')
+
+
+def per_hit_retrieve(index: pyterrier_anserini.AnseriniIndex, topics: pd.DataFrame, num_results: int,
+        include_fields: List[str]) -> pd.DataFrame:
+    """The original result assembly of AnseriniRetriever, which accesses the fields of each hit individually."""
+    from pyserini.search.lucene import LuceneSearcher
+    searcher = LuceneSearcher(index.path)
+    searcher.object.searcher.setSimilarity(AnseriniSimilarity.bm25.to_lucene_sim())
+    result = pta.DataFrameBuilder(['_index', 'docno', 'score', 'rank'] + include_fields)
+    for i, query in enumerate(topics['query']):
+        hits = searcher.search(query, k=num_results)
+        records = {
+            '_index': i,
+            'docno': [h.docid for h in hits],
+            'score': [h.score for h in hits],
+            'rank': np.arange(len(hits)),
+        }
+        records.update({f: [h.lucene_document.get(f) for h in hits] for f in include_fields})
+        result.extend(records)
+    return result.to_df(merge_on_index=topics)
+
+
+def timed(fn: Callable[[], Any], repeats: int) -> Tuple[Any, float]:
+    """Calls ``fn`` ``repeats`` times, providing its result and the fastest time taken."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        res = fn()
+        times.append(time.perf_counter() - start)
+    return res, min(times)
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--num_results', type=int, default=1000)
+    parser.add_argument('--include_fields', action='store_true', help='also load the "contents" field of each hit')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    index = pyterrier_anserini.AnseriniIndex.from_url(FIXTURE)
+    topics = pt.get_dataset('vaswani').get_topics()
+    include_fields = ['contents'] if args.include_fields else []
+    retriever = index.bm25(num_results=args.num_results, include_fields=include_fields or None)
+
+    # warm up the JVM and the index caches
+    retriever(topics.head(10))
+    per_hit_retrieve(index, topics.head(10), args.num_results, include_fields)
+
+    baseline, baseline_time = timed(lambda: per_hit_retrieve(index, topics, args.num_results, include_fields),
+                                    args.repeats)
+    res, res_time = timed(lambda: retriever(topics), args.repeats)
+    pd.testing.assert_frame_equal(baseline, res, check_dtype=False)
+
+    print(f'{len(topics)} queries, num_results={args.num_results}, include_fields={include_fields}')
+    print(f'per-hit loop:    {baseline_time:.2f}s ({len(topics) / baseline_time:.1f} q/s)')
+    print(f'AnseriniRetriever: {res_time:.2f}s ({len(topics) / res_time:.1f} q/s)')
+    print(f'speedup:         {baseline_time / res_time:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
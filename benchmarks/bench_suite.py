@@ -0,0 +1,204 @@
+"""Benchmarks retrieval, re-ranking, text loading and indexing, and records the results as JSON.
+
+The suite runs offline over two corpora: a synthetic corpus (generated with a Zipfian vocabulary and indexed as part
+of the suite) and the vaswani index from the test fixtures. Queries are sampled from the text of the indexed
+documents, so neither corpus needs a download. The following are measured:
+
+- ``retriever``: queries/sec and p50/p99 latency (of single-query calls) of ``AnseriniRetriever``, across
+  ``num_results``, ``include_fields`` and the three query modes (``query``, ``query_lucene`` and ``query_toks``).
+- ``reranker``: rows/sec of ``AnseriniReRanker`` over the top 100 BM25 results of each query.
+- ``text_loader``: rows/sec of ``AnseriniTextLoader`` over the same results.
+- ``indexer``: docs/sec of ``AnseriniIndexer`` over the synthetic corpus.
+
+Results are written to ``--output`` (along with the git commit, Anserini version, etc.), and can be compared with
+those of another run (e.g., of an earlier commit or another Anserini jar) using ``--compare``.
+
+Usage::
+
+    python benchmarks/bench_suite.py [--output bench.json] [--compare baseline.json] [--docs 20000] [--queries 200]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyterrier as pt
+
+import pyterrier_anserini
+
+FIXTURE = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'tests', 'fixtures', 'vaswani.tar.lz4')
+
+
+def synthetic_corpus(num_docs: int, *, vocab_size: int = 50_000, mean_length: int = 60,
+        seed: int = 0) -> Iterator[Dict[str, str]]:
+    """Generates documents whose terms follow a Zipfian distribution (like natural language)."""
+    rng = np.random.default_rng(seed)
+    letters = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+    vocab = [''.join(rng.choice(letters, size=rng.integers(3, 10))) for _ in range(vocab_size)]
+    probs = 1. / np.arange(1, vocab_size + 1)
+    probs /= probs.sum()
+    for i in range(num_docs):
+        length = max(int(rng.poisson(mean_length)), 1)
+        yield {'docno': f'doc{i}', 'text': ' '.join(vocab[t] for t in rng.choice(vocab_size, size=length, p=probs))}
+
+
+def sample_topics(index: pyterrier_anserini.AnseriniIndex, num_queries: int, *, seed: int = 0) -> pd.DataFrame:
+    """Samples queries of 2-4 words from the text of random documents of the index."""
+    rng = np.random.default_rng(seed)
+    lucene_docids = rng.choice(index.num_docs(), size=num_queries, replace=num_queries > index.num_docs())
+    docs = pd.DataFrame({'qid': [str(i) for i in range(num_queries)], 'docno': index.docnos(lucene_docids)})
+    texts = index.text_loader(['contents'])(docs)['contents']
+    queries = []
+    for text in texts:
+        words = [w for w in re.findall('[a-z]+', text.lower()) if len(w) > 2] or ['the']
+        queries.append(' '.join(rng.choice(words, size=min(int(rng.integers(2, 5)), len(words)), replace=False)))
+    topics = pd.DataFrame({'qid': docs['qid'], 'query': queries})
+    topics['query_lucene'] = topics['query']
+    topics['query_toks'] = [{w: 1. for w in q.split()} for q in queries]
+    return topics
+
+
+def timed(fn: Callable[[], Any]) -> Tuple[Any, float]:
+    """Calls ``fn``, providing its result and the time taken."""
+    start = time.perf_counter()
+    res = fn()
+    return res, time.perf_counter() - start
+
+
+def bench_retriever(index: pyterrier_anserini.AnseriniIndex, topics: pd.DataFrame, *, num_results: int,
+        include_fields: Optional[List[str]], mode: str) -> Dict[str, float]:
+    """Measures the throughput and latency of BM25 retrieval over ``topics`` (using the ``mode`` column)."""
+    retriever = index.bm25(num_results=num_results, include_fields=include_fields, analyze_toks=True)
+    topics = topics[['qid', mode]]
+    retriever(topics.head(10)) # warm-up
+    latencies = []
+    for i in range(len(topics)):
+        latencies.append(timed(lambda: retriever(topics.iloc[i:i+1]))[1])
+    res, elapsed = timed(lambda: retriever(topics))
+    return {
+        'queries_per_sec': len(topics) / elapsed,
+        'p50_latency_ms': float(np.percentile(latencies, 50) * 1000),
+        'p99_latency_ms': float(np.percentile(latencies, 99) * 1000),
+        'results_per_query': len(res) / len(topics),
+    }
+
+
+def bench_rows(transformer: pt.Transformer, inp: pd.DataFrame) -> Dict[str, float]:
+    """Measures the throughput of ``transformer`` over the rows of ``inp``."""
+    transformer(inp.head(100)) # warm-up
+    _, elapsed = timed(lambda: transformer(inp))
+    return {'rows_per_sec': len(inp) / elapsed, 'rows': len(inp)}
+
+
+def bench_corpus(name: str, index: pyterrier_anserini.AnseriniIndex, num_queries: int) -> List[Dict[str, Any]]:
+    """Runs the retriever, reranker and text loader benchmarks over an index."""
+    results = []
+    topics = sample_topics(index, num_queries)
+    for mode in ['query', 'query_lucene', 'query_toks']:
+        for num_results in [10, 100, 1000]:
+            for include_fields in [None, ['contents']]:
+                params = {'mode': mode, 'num_results': num_results, 'include_fields': include_fields}
+                metrics = bench_retriever(index, topics, **params)
+                results.append({'corpus': name, 'benchmark': 'retriever', 'params': params, 'metrics': metrics})
+                print(f'{name} retriever {params}: {metrics["queries_per_sec"]:.1f} q/s, '
+                      f'p50={metrics["p50_latency_ms"]:.1f}ms p99={metrics["p99_latency_ms"]:.1f}ms')
+
+    candidates = index.bm25(num_results=100)(topics[['qid', 'query']])
+    for similarity in ['BM25', 'QLD']:
+        metrics = bench_rows(index.reranker(similarity), candidates.drop(columns=['score', 'rank']))
+        params = {'similarity': similarity}
+        results.append({'corpus': name, 'benchmark': 'reranker', 'params': params, 'metrics': metrics})
+        print(f'{name} reranker {params}: {metrics["rows_per_sec"]:.0f} rows/s')
+    for threads in [1, 4]:
+        loader = index.text_loader(['contents'], threads=threads)
+        metrics = bench_rows(loader, candidates)
+        params = {'threads': threads}
+        results.append({'corpus': name, 'benchmark': 'text_loader', 'params': params, 'metrics': metrics})
+        print(f'{name} text_loader {params}: {metrics["rows_per_sec"]:.0f} rows/s')
+    return results
+
+
+def bench_indexer(path: str, num_docs: int,
+        threads: int) -> Tuple[pyterrier_anserini.AnseriniIndex, Dict[str, float]]:
+    """Measures the throughput of indexing the synthetic corpus, providing the index along with the metrics."""
+    docs = list(synthetic_corpus(num_docs))
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    index = pyterrier_anserini.AnseriniIndex(path)
+    _, elapsed = timed(lambda: index.indexer(threads=threads).index(docs))
+    return index, {'docs_per_sec': num_docs / elapsed, 'docs': num_docs}
+
+
+def environment() -> Dict[str, Any]:
+    """Describes the environment of the run (e.g., the commit and the versions of the software)."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.realpath(__file__))).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'commit': commit,
+        'pyterrier_anserini': pyterrier_anserini.__version__,
+        'anserini': pyterrier_anserini._java._version,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any]) -> None:
+    """Prints the ratio of each metric to the matching one in ``baseline`` (>1 is faster for rates)."""
+    def key(r: Dict[str, Any]) -> Tuple[str, str, str]:
+        return r['corpus'], r['benchmark'], json.dumps(r['params'], sort_keys=True)
+    base = {key(r): r['metrics'] for r in baseline['results']}
+    print(f'\ncompared with {baseline["environment"].get("commit")} (anserini {baseline["environment"]["anserini"]})')
+    for r in results:
+        if key(r) not in base:
+            continue
+        ratios = ', '.join(f'{m}={v / base[key(r)][m]:.2f}x' for m, v in r['metrics'].items()
+                           if base[key(r)].get(m) and m.endswith(('_per_sec', '_ms')))
+        print(f'{r["corpus"]} {r["benchmark"]} {r["params"]}: {ratios}')
+
+
+def main() -> None:
+    """Runs the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--output', default='bench.json', help='the path to write the results to')
+    parser.add_argument('--compare', help='the results of an earlier run to compare with')
+    parser.add_argument('--docs', type=int, default=20_000, help='the size of the synthetic corpus')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=1, help='the indexing threads for the synthetic corpus')
+    args = parser.parse_args()
+
+    pt.java.init()
+    results = []
+    with tempfile.TemporaryDirectory() as d:
+        index, metrics = bench_indexer(os.path.join(d, 'synthetic'), args.docs, args.threads)
+        params = {'docs': args.docs, 'threads': args.threads}
+        results.append({'corpus': 'synthetic', 'benchmark': 'indexer', 'params': params, 'metrics': metrics})
+        print(f'synthetic indexer {params}: {metrics["docs_per_sec"]:.0f} docs/s')
+        results += bench_corpus('synthetic', index, args.queries)
+        index.close()
+    results += bench_corpus('vaswani', pyterrier_anserini.AnseriniIndex.from_url(FIXTURE), args.queries)
+
+    output = {'environment': environment(), 'results': results}
+    with open(args.output, 'wt') as fout:
+        json.dump(output, fout, indent=2)
+    print(f'results written to {args.output}')
+    if args.compare:
+        with open(args.compare) as fin:
+            compare(results, json.load(fin))
+
+
+if __name__ == '__main__':
+    main()
@@ -21,15 +21,24 @@ Typical usage example::
 __version__ = '0.1.1'
 
 from pyterrier_anserini._java import J, set_version, check_version # noqa: I001
+from pyterrier_anserini._text_cache import AnseriniTextCache
+from pyterrier_anserini._result_cache import AnseriniResultCache
+from pyterrier_anserini._stats import AnseriniStats
 from pyterrier_anserini._index import AnseriniIndex
 from pyterrier_anserini._indexer import AnseriniIndexer
 from pyterrier_anserini._legacy import AnseriniBatchRetrieve
 from pyterrier_anserini._reranker import AnseriniReRanker
+from pyterrier_anserini._features import AnseriniFeatures
+from pyterrier_anserini._prf import AnseriniRM3, AnseriniRocchio
 from pyterrier_anserini._retriever import AnseriniRetriever
+from pyterrier_anserini._parallel import AnseriniParallelRetriever
+from pyterrier_anserini._async import AnseriniAsyncSearcher
 from pyterrier_anserini._text_loader import AnseriniTextLoader
 from pyterrier_anserini._similarity import AnseriniSimilarity
 
 __all__ = [
-    'set_version', 'check_version', 'AnseriniIndex', 'AnseriniIndexer', 'AnseriniRetriever', 'AnseriniReRanker',
-    'AnseriniBatchRetrieve', 'AnseriniSimilarity', 'AnseriniTextLoader', 'J'
+    'set_version', 'check_version', 'AnseriniIndex', 'AnseriniIndexer', 'AnseriniRetriever',
+    'AnseriniParallelRetriever', 'AnseriniReRanker', 'AnseriniFeatures', 'AnseriniRM3', 'AnseriniRocchio',
+    'AnseriniBatchRetrieve', 'AnseriniSimilarity', 'AnseriniTextLoader', 'AnseriniTextCache', 'AnseriniResultCache',
+    'AnseriniStats', 'AnseriniAsyncSearcher', 'J'
 ]
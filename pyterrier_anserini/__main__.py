@@ -0,0 +1,36 @@
+"""Command-line tools for Anserini indexes.
+
+Usage::
+
+    python -m pyterrier_anserini build-docno-lookup INDEX_PATH [--threads THREADS]
+    python -m pyterrier_anserini build-vocab-stats INDEX_PATH [--field FIELD]
+"""
+import argparse
+
+from pyterrier_anserini import AnseriniIndex
+
+
+def main() -> None:
+    """Runs the command provided in the command-line arguments."""
+    parser = argparse.ArgumentParser(prog='python -m pyterrier_anserini', description=__doc__.split('\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_docno_lookup = commands.add_parser('build-docno-lookup',
+        help='build the docno lookup table of an existing index (see AnseriniIndex.build_docno_lookup)')
+    build_docno_lookup.add_argument('index_path')
+    build_docno_lookup.add_argument('--threads', type=int, default=1)
+    build_vocab_stats = commands.add_parser('build-vocab-stats',
+        help='build the vocabulary statistics of a field of an index (see AnseriniIndex.build_vocab_stats)')
+    build_vocab_stats.add_argument('index_path')
+    build_vocab_stats.add_argument('--field', default='contents')
+    args = parser.parse_args()
+
+    if args.command == 'build-docno-lookup':
+        with AnseriniIndex(args.index_path) as index:
+            index.build_docno_lookup(threads=args.threads)
+    elif args.command == 'build-vocab-stats':
+        with AnseriniIndex(args.index_path) as index:
+            index.build_vocab_stats(field=args.field)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import asyncio
+import queue
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+import pandas as pd
+
+import pyterrier_anserini
+from pyterrier_anserini._stats import _phase
+
+
+class _JvmThreads:
+    """A pool of long-lived threads that make calls into the JVM.
+
+    Threads are attached to the JVM on their first call and are detached when the pool is shut down (pyjnius leaks
+    threads that exit while attached).
+    """
+    def __init__(self, threads: int, name: str):
+        self._tasks = queue.SimpleQueue()
+        self._threads = [threading.Thread(target=self._run, name=f'{name}-{i}', daemon=True) for i in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self):
+        from jnius import detach
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    return
+                fn, args, future = task
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args))
+                    except BaseException as ex:
+                        future.set_exception(ex)
+        finally:
+            detach()
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        future = Future()
+        self._tasks.put((fn, args, future))
+        return future
+
+    def shutdown(self, wait: bool = True):
+        for _ in self._threads:
+            self._tasks.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+class AnseriniAsyncSearcher:
+    """Searches with a retriever from ``asyncio`` code, combining concurrent requests into batches.
+
+    Each call to :meth:`search` adds its query to a pending batch. The batch is searched once it reaches
+    ``max_batch_size`` queries, or ``max_wait`` seconds after its first query arrived, whichever comes first. Batches
+    are searched by the retriever on a dedicated pool of threads (which share the index's searcher), so the event loop
+    is never blocked, and each caller receives the results of its own query.
+
+    Searchers are provided by :meth:`AnseriniRetriever.async_searcher` (or used implicitly by
+    :meth:`AnseriniRetriever.asearch`). A searcher should only be used from a single event loop. Its threads are
+    stopped when it is closed, or (without waiting for them) when it is garbage collected.
+    """
+    def __init__(self,
+        retriever: 'pyterrier_anserini.AnseriniRetriever',
+        *,
+        max_batch_size: int = 32,
+        max_wait: float = 0.002,
+        threads: int = 1,
+    ):
+        """Initializes the searcher.
+
+        Args:
+            retriever: The retriever to search with.
+            max_batch_size: The maximum number of queries searched together. Defaults to 32.
+            max_wait: The maximum time (in seconds) that a query waits for others to join its batch. Defaults to 0.002.
+            threads: The number of batches that can be searched concurrently. Defaults to 1.
+        """
+        self.retriever = retriever
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.threads = threads
+        self._pool = None
+        self._finalizer = None
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def __repr__(self) -> str:
+        return (f'AnseriniAsyncSearcher({self.retriever!r}, max_batch_size={self.max_batch_size}, '
+                f'max_wait={self.max_wait}, threads={self.threads})')
+
+    async def search(self, query: str, qid: str = '1') -> pd.DataFrame:
+        """Searches for a query, as part of a batch.
+
+        Args:
+            query: The query text.
+            qid: The query ID given to the results. Defaults to ``'1'``.
+
+        Returns:
+            The results of the query, identical to those of :meth:`AnseriniRetriever.search`.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((qid, query, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        if self._pool is None:
+            self._pool = _JvmThreads(self.threads, 'AnseriniAsyncSearcher')
+            self._finalizer = weakref.finalize(self, self._pool.shutdown, False)
+        stats = self.retriever.index.stats
+        if stats is not None:
+            stats.add('AnseriniAsyncSearcher.batches')
+            stats.add('AnseriniAsyncSearcher.queries', len(batch))
+        task = asyncio.wrap_future(self._pool.submit(self._search_batch, [query for _, query, _ in batch]))
+        task.add_done_callback(lambda t: self._resolve(batch, t))
+
+    def _search_batch(self, queries: List[str]) -> List[pd.DataFrame]:
+        # the queries of the batch are given distinct (positional) qids, which are replaced by those of the callers
+        topics = pd.DataFrame({'qid': [str(i) for i in range(len(queries))], 'query': queries})
+        with _phase(self.retriever.index.stats, 'AnseriniAsyncSearcher.search_batch'):
+            res = self.retriever(topics)
+        groups = res.groupby('qid', sort=False).indices
+        if len(groups) == len(queries):
+            return [res.iloc[groups[qid]] for qid in topics['qid']]
+        # (queries without results get the results of no queries, which has the same column types as searching them)
+        empty = self.retriever(topics.iloc[:0])
+        return [res.iloc[groups[qid]] if qid in groups else empty for qid in topics['qid']]
+
+    @staticmethod
+    def _resolve(batch: List[Tuple[str, str, asyncio.Future]], task: asyncio.Future):
+        for i, (qid, _, future) in enumerate(batch):
+            if future.done(): # (e.g., the caller was cancelled)
+                continue
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result()[i].reset_index(drop=True).assign(qid=qid))
+
+    def close(self):
+        """Stops the threads of this searcher, once they have finished searching their batches.
+
+        Queries that are still waiting for their batch are not searched, so they should be awaited first (or use the
+        searcher as an asynchronous context manager, which searches them before closing). The threads are started again
+        automatically if this searcher is used again.
+        """
+        if self._pool is not None:
+            self._finalizer.detach()
+            self._pool.shutdown()
+            self._pool = None
+            self._finalizer = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self._flush()
+        # (closed from the default executor, so that the event loop is not blocked while the batches finish)
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
@@ -0,0 +1,100 @@
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_DIR = 'pt_docnos'
+
+
+class _DocnoLookup:
+    """A memory-mapped table that maps between the docnos of an index and Lucene's internal docids.
+
+    The table consists of the (UTF-8 encoded) docno of each Lucene docid, plus a copy of the docnos of the live (i.e.,
+    not deleted) documents in sorted order (along with their docids) for reverse lookups. Since the arrays are
+    memory-mapped, they are shared among all processes that use the index.
+
+    Lucene docids change when an index is modified, so the table records the commit ids of the index that it was
+    built from (see :class:`~pyterrier_anserini._index._Searcher`), and only applies to that commit. It also records
+    the range of docids of each segment of the index, which lets an outdated table provide the docnos of the
+    segments that are still in the index when it is rebuilt.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as fin:
+            meta = json.load(fin)
+        self.commit_ids = tuple(meta.get('commit_ids', ()))
+        self.segments = {segment_id: (doc_base, max_doc) for segment_id, doc_base, max_doc in meta.get('segments', [])}
+        self._docnos = np.load(os.path.join(path, 'docnos.npy'), mmap_mode='r')
+        self._sorted_docnos = np.load(os.path.join(path, 'sorted_docnos.npy'), mmap_mode='r')
+        self._sorted_docids = np.load(os.path.join(path, 'sorted_docids.npy'), mmap_mode='r')
+
+    @staticmethod
+    def exists(index_path: str) -> bool:
+        """Checks whether the index at ``index_path`` has a table (which may or may not be up to date)."""
+        return os.path.exists(os.path.join(index_path, _DIR, 'meta.json'))
+
+    @staticmethod
+    def load(index_path: str, commit_ids: Optional[Sequence[str]]) -> Optional['_DocnoLookup']:
+        """Loads the table of the index at ``index_path``, if it has one that matches ``commit_ids`` (if given)."""
+        if not _DocnoLookup.exists(index_path):
+            return None
+        lookup = _DocnoLookup(os.path.join(index_path, _DIR))
+        if commit_ids is not None and lookup.commit_ids != tuple(commit_ids):
+            return None
+        return lookup
+
+    @staticmethod
+    def write(
+        index_path: str,
+        docnos: List[Optional[str]],
+        commit_ids: Sequence[str],
+        segments: Sequence[Tuple[str, int, int]] = (),
+    ):
+        """Writes the table of an index, given the docno of each Lucene docid (None for deleted documents).
+
+        ``segments`` lists the (id, first docid, number of docids) of each segment of the index.
+        """
+        encoded = np.array([(d or '').encode() for d in docnos], dtype=bytes)
+        live = np.array([d is not None for d in docnos], dtype=bool)
+        live_docids = np.nonzero(live)[0].astype(np.int32)
+        order = np.argsort(encoded[live_docids], kind='stable')
+        # written to a temporary directory and then moved into place, so that readers never see a partial table
+        tmp_path = tempfile.mkdtemp(prefix=f'.{_DIR}-', dir=index_path)
+        try:
+            np.save(os.path.join(tmp_path, 'docnos.npy'), encoded)
+            np.save(os.path.join(tmp_path, 'sorted_docnos.npy'), encoded[live_docids][order])
+            np.save(os.path.join(tmp_path, 'sorted_docids.npy'), live_docids[order])
+            with open(os.path.join(tmp_path, 'meta.json'), 'wt') as fout:
+                json.dump({'commit_ids': list(commit_ids), 'num_docs': int(len(live_docids)),
+                           'segments': [list(segment) for segment in segments]}, fout)
+            os.chmod(tmp_path, 0o755) # mkdtemp only grants access to the current user
+            path = os.path.join(index_path, _DIR)
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.rename(tmp_path, path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    def docnos(self, lucene_docids: Any) -> np.ndarray:
+        """Provides the docnos of the given Lucene docids."""
+        return np.char.decode(self._docnos[np.asarray(lucene_docids, dtype=np.int64)], 'utf-8').astype(object)
+
+    def segment_docnos(self, segment_id: str) -> Optional[np.ndarray]:
+        """Provides the docnos of the documents of a segment, in docid order, if the table covers the segment."""
+        if segment_id not in self.segments:
+            return None
+        doc_base, max_doc = self.segments[segment_id]
+        return self.docnos(np.arange(doc_base, doc_base + max_doc))
+
+    def lucene_docids(self, docnos: List[str]) -> np.ndarray:
+        """Provides the Lucene docids of the given docnos (-1 for docnos that are not in the index)."""
+        if len(docnos) == 0 or len(self._sorted_docnos) == 0:
+            return np.full(len(docnos), -1, dtype=np.int32)
+        keys = np.char.encode(np.asarray(docnos, dtype=str), 'utf-8')
+        idx = np.searchsorted(self._sorted_docnos, keys).clip(max=len(self._sorted_docnos) - 1)
+        found = (self._sorted_docnos[idx] == keys) & (np.char.str_len(keys) <= self._sorted_docnos.itemsize)
+        return np.where(found, self._sorted_docids[idx], -1).astype(np.int32)
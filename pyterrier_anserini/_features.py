@@ -0,0 +1,173 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyterrier as pt
+import pyterrier_alpha as pta
+
+from pyterrier_anserini import J
+from pyterrier_anserini._index import AnseriniIndex, _norm_lengths, _snapshot
+from pyterrier_anserini._reranker import _leaves, _query_factory, _round_scores, _traverse
+from pyterrier_anserini._similarity import AnseriniSimilarity
+
+_TFeature = Union[str, AnseriniSimilarity, Tuple[Union[str, AnseriniSimilarity], Optional[Dict[str, Any]]]]
+
+_STATISTICS = ('doc_length', 'matched_terms')
+
+
+def _doc_lengths(leaves: List[Any], doc_bases: np.ndarray, lucene_docids: np.ndarray, fields: List[str]) -> np.ndarray:
+    """Provides the lengths of the documents identified by ``lucene_docids``, summed over ``fields``.
+
+    Lengths are computed like :meth:`AnseriniIndex.doc_lengths`: from the document vectors when the field has them, and
+    from the norms otherwise. Documents that are not in the index (i.e., have a docid of -1) have a length of 0.
+    """
+    result = np.zeros(len(lucene_docids), dtype=np.int64)
+    decode = _norm_lengths()
+    leaf_idx = np.searchsorted(doc_bases, lucene_docids, side='right') - 1
+    current_leaf, sources, prev = -1, [], None
+    for i in np.argsort(lucene_docids, kind='stable'):
+        if lucene_docids[i] < 0:
+            continue
+        if prev is not None and lucene_docids[prev] == lucene_docids[i]:
+            result[i] = result[prev] # norms cannot be read twice for the same document
+            continue
+        prev = i
+        if leaf_idx[i] != current_leaf:
+            current_leaf = leaf_idx[i]
+            leaf = leaves[current_leaf]
+            leaf_reader = leaf.reader()
+            field_infos = leaf_reader.getFieldInfos()
+            sources = []
+            for field in fields:
+                field_info = field_infos.fieldInfo(field)
+                if field_info is not None and field_info.hasVectors():
+                    sources.append((field, leaf_reader.termVectors(), None))
+                elif field_info is not None and field_info.hasNorms():
+                    sources.append((field, None, leaf_reader.getNormValues(field)))
+        target = int(lucene_docids[i] - doc_bases[current_leaf])
+        for field, term_vectors, norms in sources:
+            if term_vectors is not None:
+                vector = term_vectors.get(target, field)
+                if vector is not None:
+                    result[i] += vector.getSumTotalTermFreq()
+            elif norms.advanceExact(target):
+                result[i] += decode[norms.longValue() + 128]
+    return result
+
+
+def _query_terms(query: Any) -> List[Any]:
+    """Provides the (distinct) terms of a Lucene query."""
+    terms = J.HashSet()
+    visitor = J.QueryVisitor.termCollector(terms)
+    query.visit(visitor)
+    return list(terms.toArray())
+
+
+@pt.java.required
+class AnseriniFeatures(pt.Transformer):
+    """A transformer that computes several features of the provided documents from an Anserini index.
+
+    All features of a query's documents are computed in a single pass over its documents (in index order), rather than
+    one pass per feature as when combining several :class:`~pyterrier_anserini.AnseriniReRanker` transformers with
+    ``**``. Each feature is one of:
+
+    - A similarity function (e.g., ``'BM25'`` or ``AnseriniSimilarity.qld``), or a tuple of a similarity function and
+      its arguments (e.g., ``('BM25', {'bm25.k1': 1.2})``). The feature is the document's score, which matches the
+      score provided by :class:`~pyterrier_anserini.AnseriniReRanker`.
+    - ``'doc_length'``: The length of the document (see :meth:`~pyterrier_anserini.AnseriniIndex.doc_lengths`).
+    - ``'matched_terms'``: The number of distinct query terms that appear in the document.
+    """
+    def __init__(self,
+        index: Union[AnseriniIndex, str],
+        features: List[_TFeature],
+        *,
+        fields: Optional[Dict[str, float]] = None,
+        analyze_toks: bool = False,
+        verbose: bool = False
+    ):
+        """Initializes the transformer.
+
+        Args:
+            index: The index to compute features from. If a string, an AnseriniIndex object is created for the path.
+            features: The features to compute, in the order that they appear in the ``features`` column.
+            fields: The fields to score, mapped to their weights (see :class:`~pyterrier_anserini.AnseriniRetriever`).
+                If None (default), the ``contents`` field is scored.
+                Document lengths are summed over these fields.
+            analyze_toks: Whether to analyze (e.g., stem) the tokens of ``query_toks`` inputs. Defaults to False.
+            verbose: Whether to display a progress bar when computing features.
+        """
+        self.index = index if isinstance(index, AnseriniIndex) else AnseriniIndex(index)
+        self.features = list(features)
+        self.fields = fields
+        self.analyze_toks = analyze_toks
+        self.verbose = verbose
+        self._features = []
+        for feature in self.features:
+            if isinstance(feature, str) and feature in _STATISTICS:
+                self._features.append((feature, None, None))
+            elif isinstance(feature, tuple):
+                similarity, similarity_args = feature
+                self._features.append(('similarity', AnseriniSimilarity(similarity), similarity_args))
+            else:
+                self._features.append(('similarity', AnseriniSimilarity(feature), None))
+
+    __repr__ = pta.transformer_repr
+
+    @_snapshot
+    def transform(self, inp: pd.DataFrame) -> pd.DataFrame:
+        """Computes the features of the documents for each query in ``inp``.
+
+        Args:
+            inp: A DataFrame with a 'query', 'query_lucene' or 'query_toks' column containing queries and a 'docno'
+                column containing document IDs.
+
+        Returns:
+            A DataFrame with the columns of ``inp``, plus a ``features`` column containing a (float64) array of the
+            features of each document.
+        """
+        with pta.validate.any(inp) as v:
+            v.result_frame(['query_lucene'], mode='query_lucene')
+            v.result_frame(['query_toks'], mode='query_toks')
+            v.result_frame(['query'], mode='query_text')
+
+        searcher = self.index._searcher()
+        q_transform, query_col = _query_factory(v.mode, searcher.analyzer, self.fields, self.analyze_toks)
+
+        index_searchers = [self.index._index_searcher(sim, args) for kind, sim, args in self._features
+            if kind == 'similarity']
+        rewrite_searcher = index_searchers[0] if index_searchers else self.index._index_searcher('BM25')
+        with_terms = any(kind == 'matched_terms' for kind, _, _ in self._features)
+        reader = self.index._reader()
+        leaves, doc_bases = _leaves(reader)
+        lucene_docids = self.index._lucene_docids(inp['docno'])
+
+        features = np.zeros((len(inp), len(self._features)), dtype=np.float64)
+        sim_columns = [i for i, (kind, _, _) in enumerate(self._features) if kind == 'similarity']
+        if any(kind == 'doc_length' for kind, _, _ in self._features):
+            fields = list(self.fields) if self.fields is not None else ['contents']
+            doc_lengths = _doc_lengths(leaves, doc_bases, lucene_docids, fields)
+            for i, (kind, _, _) in enumerate(self._features):
+                if kind == 'doc_length':
+                    features[:, i] = doc_lengths
+
+        it = inp.groupby('qid', sort=False).indices.values()
+        if self.verbose:
+            it = pt.tqdm(it, unit='q', desc='AnseriniFeatures')
+
+        for idxs in it:
+            query = rewrite_searcher.rewrite(q_transform(inp[query_col].iloc[idxs[0]]))
+            weights = [s.createWeight(query, J.ScoreMode.COMPLETE, 1.) for s in index_searchers]
+            if with_terms:
+                for term in _query_terms(query):
+                    term_query = J.TermQuery(term)
+                    weights.append(rewrite_searcher.createWeight(term_query, J.ScoreMode.COMPLETE_NO_SCORES, 1.))
+            score = [True] * len(index_searchers) + [False] * (len(weights) - len(index_searchers))
+            values = _traverse(weights, leaves, doc_bases, lucene_docids[idxs], score)
+            features[np.ix_(idxs, sim_columns)] = _round_scores(values[:, :len(index_searchers)])
+            if with_terms:
+                matched = np.nansum(values[:, len(index_searchers):], axis=1)
+                for i, (kind, _, _) in enumerate(self._features):
+                    if kind == 'matched_terms':
+                        features[idxs, i] = matched
+
+        return inp.assign(features=list(features))
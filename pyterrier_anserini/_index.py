@@ -1,14 +1,29 @@
+import functools
+import json
 import os
-from typing import Any, Dict, List, Literal, Optional, Union
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Literal, Optional, Tuple, TypeVar, Union
 
+import numpy as np
 import pyterrier as pt
 import pyterrier_alpha as pta
 
 import pyterrier_anserini
 from pyterrier_anserini import J
+from pyterrier_anserini._docnos import _DocnoLookup
+from pyterrier_anserini._java import _jni_lock, _shared_call, _thread_map
+from pyterrier_anserini._result_cache import AnseriniResultCache
 from pyterrier_anserini._similarity import DEFAULT_WMODEL_ARGS, AnseriniSimilarity
+from pyterrier_anserini._stats import AnseriniStats, _phase
+from pyterrier_anserini._text_cache import AnseriniTextCache
+from pyterrier_anserini._vocab import _VocabStats
 
 _TFields = Union[List[str], str, Literal['*']]
+_TFn = TypeVar('_TFn', bound=Callable)
+
+# the shards of an index that have not been read yet
+_UNKNOWN = object()
 
 @pt.java.required
 class AnseriniIndex(pta.Artifact):
@@ -17,15 +32,53 @@ class AnseriniIndex(pta.Artifact):
     An Anserini index is a directory containing a Lucene index built with Anserini.
 
     This object can be used to construct retrieval transformers.
+
+    The underlying Lucene searcher is opened lazily the first time it is needed and is shared by all transformers
+    created from this object. It is re-opened automatically if the index changes on disk. Use :meth:`close` (or use
+    the index as a context manager) to release the searcher when it is no longer needed.
+
+    Text loaded from the index (by text loaders and retrievers with ``include_fields``) can be cached by providing a
+    ``text_cache``. The cache is available as the ``text_cache`` attribute, which also provides hit and miss counters.
+    Likewise, the results of retrievers can be cached by providing a ``result_cache`` (available as the
+    ``result_cache`` attribute), in which case repeated queries are answered without searching the index.
+
+    Where the time of the index's transformers goes (per phase, along with estimated JVM calls, documents scored,
+    etc.) can be recorded by providing ``stats`` (see :class:`~pyterrier_anserini.AnseriniStats`).
     """
 
-    def __init__(self, path: str):
+    def __init__(self,
+        path: str,
+        *,
+        text_cache: Optional[Union[int, AnseriniTextCache]] = None,
+        result_cache: Optional[Union[int, AnseriniResultCache]] = None,
+        stats: Optional[Union[bool, AnseriniStats]] = None,
+    ):
         """Initializes a new Anserini index.
 
         Args:
             path: The path to the index.
+            text_cache: A cache for the text loaded from this index, or the maximum size (in bytes) of a new
+                :class:`~pyterrier_anserini.AnseriniTextCache` to use. If None (default), text is not cached.
+            result_cache: A cache for the results of the retrievers of this index, or the maximum size (in bytes) of a
+                new (in-memory) :class:`~pyterrier_anserini.AnseriniResultCache` to use. If None (default), results
+                are not cached.
+            stats: Statistics to record the work of this index's transformers in, or True to record them in a new
+                :class:`~pyterrier_anserini.AnseriniStats`. If None (default), no statistics are recorded.
         """
         self.path = path
+        self.text_cache = AnseriniTextCache(text_cache) if isinstance(text_cache, int) else text_cache
+        self.result_cache = AnseriniResultCache(result_cache) if isinstance(result_cache, int) else result_cache
+        self.stats = AnseriniStats() if stats is True else (stats or None)
+        self._init_searcher_state()
+
+    def _init_searcher_state(self):
+        self._searcher_lock = threading.RLock()
+        self._searcher_obj = None
+        self._docno_lookup_obj = None
+        self._searcher_generation = None
+        self._index_searchers = {}
+        self._shard_paths_obj = _UNKNOWN
+        self._local = threading.local()
 
     def built(self) -> bool:
         """Checks if this index is built.
@@ -38,17 +91,51 @@ class AnseriniIndex(pta.Artifact):
     def indexer(self,
         *,
         fields: _TFields = '*',
+        threads: int = 1,
+        memory_buffer_mb: Optional[int] = None,
+        batch_size: int = 10_000,
+        store_contents: Optional[bool] = None,
+        store_docvectors: Optional[bool] = None,
+        append: bool = False,
+        shards: Optional[Union[int, List[str]]] = None,
+        docno_lookup: bool = True,
+        multi_field: bool = False,
         verbose: bool = False
     ) -> pt.Indexer:
         """Provides an indexer for this index.
 
+        See :class:`~pyterrier_anserini.AnseriniIndexer` for how the indexing options behave.
+
         Args:
             fields: The fields to index. If '*' (default), all fields are indexed. Otherwise, the values of the
             fields provided in this argument are concatenated and indexed.
+            threads: The number of Lucene writer threads to use when indexing. Defaults to 1.
+            memory_buffer_mb: The size of Lucene's in-memory buffer (in MB). If None (default), Anserini's default size
+            is used.
+            batch_size: The number of documents passed together to the writer threads. Defaults to 10,000.
+            store_contents: Whether to store the contents of each document. If None (default), contents are stored for
+            text documents but not for pre-tokenized (``toks``) documents.
+            store_docvectors: Whether to store the document vector of each document. If None (default), document
+            vectors are stored for text documents but not for pre-tokenized (``toks``) documents.
+            append: Whether to add the documents to this index if it already exists. Defaults to False.
+            shards: The number of shards (or the paths of the shards) of a sharded index. If None (default), a single
+            index is built.
+            docno_lookup: Whether to build the docno lookup table of the index (see :meth:`build_docno_lookup`) once
+            the documents are indexed. Defaults to True.
+            multi_field: Whether to also index each field separately. Defaults to False.
             verbose: Whether to display a progress bar when indexing.
         """
         return pyterrier_anserini.AnseriniIndexer(self,
             fields=fields,
+            threads=threads,
+            memory_buffer_mb=memory_buffer_mb,
+            batch_size=batch_size,
+            store_contents=store_contents,
+            store_docvectors=store_docvectors,
+            append=append,
+            shards=shards,
+            docno_lookup=docno_lookup,
+            multi_field=multi_field,
             verbose=verbose)
 
     def retriever(self,
@@ -57,16 +144,32 @@ class AnseriniIndex(pta.Artifact):
         *,
         num_results: int = 1000,
         include_fields: Optional[_TFields] = None,
+        fields: Optional[Dict[str, float]] = None,
+        analyze_toks: bool = False,
+        early_termination: bool = False,
+        total_hits_threshold: Optional[int] = None,
+        include_total_hits: bool = False,
+        threads: int = 1,
+        batch_size: int = 1000,
         verbose: bool = False
     ) -> pt.Transformer:
         """Provides a retriever that uses the specified similarity function.
 
+        See :class:`~pyterrier_anserini.AnseriniRetriever` for how the retrieval options behave.
+
         Args:
             similarity: The similarity function to use.
             similarity_args: The arguments to the similarity function. Defaults to None (no arguments).
             num_results: The number of results to return. Defaults to 1000.
             include_fields: A list of the fields to include in the results. If `None` (default), no extra fields are
             included. If '*', all fields are included.
+            fields: The fields to search, mapped to their weights. If `None` (default), ``contents`` is searched.
+            analyze_toks: Whether to analyze (e.g., stem) the tokens of ``query_toks`` inputs. Defaults to False.
+            early_termination: Whether to skip documents that cannot enter the top results. Defaults to False.
+            total_hits_threshold: The matching documents counted before terminating early. Defaults to None.
+            include_total_hits: Whether to include the number of matching documents (``total_hits``). Defaults to False.
+            threads: The number of threads to use when searching. Defaults to 1.
+            batch_size: The number of queries to search together when using multiple threads. Defaults to 1000.
             verbose: Output verbose logging. Defaults to False.
 
         Returns:
@@ -78,6 +181,13 @@ class AnseriniIndex(pta.Artifact):
             similarity_args=similarity_args,
             num_results=num_results,
             include_fields=self._resolve_fields(include_fields),
+            fields=fields,
+            analyze_toks=analyze_toks,
+            early_termination=early_termination,
+            total_hits_threshold=total_hits_threshold,
+            include_total_hits=include_total_hits,
+            threads=threads,
+            batch_size=batch_size,
             verbose=verbose)
 
     def bm25(self,
@@ -86,6 +196,13 @@ class AnseriniIndex(pta.Artifact):
         b: float = DEFAULT_WMODEL_ARGS['bm25.b'],
         num_results: int = 1000,
         include_fields: Optional[_TFields] = None,
+        fields: Optional[Dict[str, float]] = None,
+        analyze_toks: bool = False,
+        early_termination: bool = False,
+        total_hits_threshold: Optional[int] = None,
+        include_total_hits: bool = False,
+        threads: int = 1,
+        batch_size: int = 1000,
         verbose: bool = False
     ) -> pt.Transformer:
         """Providers a retriever that uses BM25 over this index.
@@ -96,6 +213,13 @@ class AnseriniIndex(pta.Artifact):
             num_results: The number of results to return. Defaults to 1000.
             include_fields: A list of the fields to include in the results. If `None` (default), no extra fields are
             included. If '*', all fields are included.
+            fields: The fields to search, mapped to their weights. If `None` (default), ``contents`` is searched.
+            analyze_toks: Whether to analyze (e.g., stem) the tokens of ``query_toks`` inputs. Defaults to False.
+            early_termination: Whether to skip documents that cannot enter the top results. Defaults to False.
+            total_hits_threshold: The matching documents counted before terminating early. Defaults to None.
+            include_total_hits: Whether to include the number of matching documents (``total_hits``). Defaults to False.
+            threads: The number of threads to use when searching. Defaults to 1.
+            batch_size: The number of queries to search together when using multiple threads. Defaults to 1000.
             verbose: Output verbose logging. Defaults to False.
 
         Returns:
@@ -107,6 +231,13 @@ class AnseriniIndex(pta.Artifact):
             similarity_args={'bm25.k1': k1, 'bm25.b': b},
             num_results=num_results,
             include_fields=self._resolve_fields(include_fields),
+            fields=fields,
+            analyze_toks=analyze_toks,
+            early_termination=early_termination,
+            total_hits_threshold=total_hits_threshold,
+            include_total_hits=include_total_hits,
+            threads=threads,
+            batch_size=batch_size,
             verbose=verbose)
 
     def qld(self,
@@ -114,6 +245,13 @@ class AnseriniIndex(pta.Artifact):
         mu: float = DEFAULT_WMODEL_ARGS['qld.mu'],
         num_results: int = 1000,
         include_fields: Optional[_TFields] = None,
+        fields: Optional[Dict[str, float]] = None,
+        analyze_toks: bool = False,
+        early_termination: bool = False,
+        total_hits_threshold: Optional[int] = None,
+        include_total_hits: bool = False,
+        threads: int = 1,
+        batch_size: int = 1000,
         verbose: bool = False
     ) -> pt.Transformer:
         """Providers a retriever that uses Query Likelihood with Dirichlet smoothing over this index.
@@ -123,6 +261,13 @@ class AnseriniIndex(pta.Artifact):
             num_results: The number of results to return. Defaults to 1000.
             include_fields: A list of the fields to include in the results. If `None` (default), no extra fields are
             included. If '*', all fields are included.
+            fields: The fields to search, mapped to their weights. If `None` (default), ``contents`` is searched.
+            analyze_toks: Whether to analyze (e.g., stem) the tokens of ``query_toks`` inputs. Defaults to False.
+            early_termination: Whether to skip documents that cannot enter the top results. Defaults to False.
+            total_hits_threshold: The matching documents counted before terminating early. Defaults to None.
+            include_total_hits: Whether to include the number of matching documents (``total_hits``). Defaults to False.
+            threads: The number of threads to use when searching. Defaults to 1.
+            batch_size: The number of queries to search together when using multiple threads. Defaults to 1000.
             verbose: Output verbose logging. Defaults to False.
 
         Returns:
@@ -134,12 +279,26 @@ class AnseriniIndex(pta.Artifact):
             similarity_args={'qld_mu': mu},
             num_results=num_results,
             include_fields=self._resolve_fields(include_fields),
+            fields=fields,
+            analyze_toks=analyze_toks,
+            early_termination=early_termination,
+            total_hits_threshold=total_hits_threshold,
+            include_total_hits=include_total_hits,
+            threads=threads,
+            batch_size=batch_size,
             verbose=verbose)
 
     def tfidf(self,
         *,
         num_results: int = 1000,
         include_fields: Optional[_TFields] = None,
+        fields: Optional[Dict[str, float]] = None,
+        analyze_toks: bool = False,
+        early_termination: bool = False,
+        total_hits_threshold: Optional[int] = None,
+        include_total_hits: bool = False,
+        threads: int = 1,
+        batch_size: int = 1000,
         verbose: bool = False
     ) -> pt.Transformer:
         """Provides a TF-IDF retriever over this index.
@@ -148,6 +307,13 @@ class AnseriniIndex(pta.Artifact):
             num_results: The number of results to return. Defaults to 1000.
             include_fields: A list of the fields to include in the results. If `None` (default), no extra fields are
             included. If '*', all fields are included.
+            fields: The fields to search, mapped to their weights. If `None` (default), ``contents`` is searched.
+            analyze_toks: Whether to analyze (e.g., stem) the tokens of ``query_toks`` inputs. Defaults to False.
+            early_termination: Whether to skip documents that cannot enter the top results. Defaults to False.
+            total_hits_threshold: The matching documents counted before terminating early. Defaults to None.
+            include_total_hits: Whether to include the number of matching documents (``total_hits``). Defaults to False.
+            threads: The number of threads to use when searching. Defaults to 1.
+            batch_size: The number of queries to search together when using multiple threads. Defaults to 1000.
             verbose: Output verbose logging. Defaults to False.
 
         Returns:
@@ -158,12 +324,25 @@ class AnseriniIndex(pta.Artifact):
             similarity=AnseriniSimilarity.tfidf,
             num_results=num_results,
             include_fields=self._resolve_fields(include_fields),
+            fields=fields,
+            analyze_toks=analyze_toks,
+            early_termination=early_termination,
+            total_hits_threshold=total_hits_threshold,
+            include_total_hits=include_total_hits,
+            threads=threads,
+            batch_size=batch_size,
             verbose=verbose)
 
     def impact(self,
         *,
         num_results: int = 1000,
         include_fields: Optional[_TFields] = None,
+        analyze_toks: bool = False,
+        early_termination: bool = False,
+        total_hits_threshold: Optional[int] = None,
+        include_total_hits: bool = False,
+        threads: int = 1,
+        batch_size: int = 1000,
         verbose: bool = False
     ) -> pt.Transformer:
         """Provides a retriever for pre-comptued impact scores.
@@ -174,6 +353,12 @@ class AnseriniIndex(pta.Artifact):
             num_results: The number of results to return. Defaults to 1000.
             include_fields: A list of the fields to include in the results. If `None` (default), no extra fields are
             included. If '*', all fields are included.
+            analyze_toks: Whether to analyze (e.g., stem) the tokens of ``query_toks`` inputs. Defaults to False.
+            early_termination: Whether to skip documents that cannot enter the top results. Defaults to False.
+            total_hits_threshold: The matching documents counted before terminating early. Defaults to None.
+            include_total_hits: Whether to include the number of matching documents (``total_hits``). Defaults to False.
+            threads: The number of threads to use when searching. Defaults to 1.
+            batch_size: The number of queries to search together when using multiple threads. Defaults to 1000.
             verbose: Output verbose logging. Defaults to False.
 
         Returns:
@@ -184,12 +369,20 @@ class AnseriniIndex(pta.Artifact):
             similarity=AnseriniSimilarity.impact,
             num_results=num_results,
             include_fields=self._resolve_fields(include_fields),
+            analyze_toks=analyze_toks,
+            early_termination=early_termination,
+            total_hits_threshold=total_hits_threshold,
+            include_total_hits=include_total_hits,
+            threads=threads,
+            batch_size=batch_size,
             verbose=verbose)
 
     def reranker(self,
         similarity: Union[str, AnseriniSimilarity],
         similarity_args: Optional[Dict[str, Any]] = None,
         *,
+        fields: Optional[Dict[str, float]] = None,
+        analyze_toks: bool = False,
         verbose: bool = False
     ) -> pt.Transformer:
         """Provides a reranker that uses the specified weithing model.
@@ -197,6 +390,8 @@ class AnseriniIndex(pta.Artifact):
         Args:
             similarity: The similarity function to use.
             similarity_args: The arguments to the similarity function. Defaults to None (no arguments).
+            fields: The fields to score, mapped to their weights. If `None` (default), ``contents`` is scored.
+            analyze_toks: Whether to analyze (e.g., stem) the tokens of ``query_toks`` inputs. Defaults to False.
             verbose: Output verbose logging. Defaults to False.
 
         Returns:
@@ -206,17 +401,127 @@ class AnseriniIndex(pta.Artifact):
             index=self,
             similarity=similarity,
             similarity_args=similarity_args,
+            fields=fields,
+            analyze_toks=analyze_toks,
+            verbose=verbose)
+
+    def features(self,
+        features: List[Any],
+        *,
+        fields: Optional[Dict[str, float]] = None,
+        analyze_toks: bool = False,
+        verbose: bool = False
+    ) -> pt.Transformer:
+        """Provides a transformer that computes several features of the provided documents in a single pass.
+
+        Each feature is a similarity function (optionally as a tuple with its arguments, e.g.,
+        ``('BM25', {'bm25.k1': 1.2})``), ``'doc_length'`` or ``'matched_terms'``. For instance,
+        ``index.bm25() >> index.features(['BM25', 'QLD', 'TFIDF', 'doc_length'])`` provides the same scores as
+        ``index.bm25() >> (index.reranker('BM25') ** index.reranker('QLD') ** ...)``, but scores each query's documents
+        once. See :class:`~pyterrier_anserini.AnseriniFeatures`.
+
+        Args:
+            features: The features to compute, in the order that they appear in the ``features`` column.
+            fields: The fields to score, mapped to their weights. If `None` (default), ``contents`` is scored.
+            analyze_toks: Whether to analyze (e.g., stem) the tokens of ``query_toks`` inputs. Defaults to False.
+            verbose: Output verbose logging. Defaults to False.
+
+        Returns:
+            A transformer that adds a ``features`` column to the documents.
+        """
+        return pyterrier_anserini.AnseriniFeatures(
+            index=self,
+            features=features,
+            fields=fields,
+            analyze_toks=analyze_toks,
             verbose=verbose)
 
+    def rm3(self,
+        *,
+        fb_docs: int = 10,
+        fb_terms: int = 10,
+        original_query_weight: float = 0.5,
+        filter_terms: bool = True,
+        threads: int = 1,
+    ) -> pt.Transformer:
+        """Provides a transformer that expands queries using RM3 pseudo-relevance feedback from this index.
+
+        The transformer takes the results of a first-stage retriever and provides the expanded queries as
+        ``query_toks``, e.g., ``index.bm25() >> index.rm3() >> index.bm25()``. This index must contain document vectors.
+
+        Args:
+            fb_docs: The number of feedback documents. Defaults to 10.
+            fb_terms: The number of feedback terms. Defaults to 10.
+            original_query_weight: The weight of the original query. Defaults to 0.5.
+            filter_terms: Whether to exclude terms that are unlikely to be useful for expansion. Defaults to True.
+            threads: The number of threads to use when expanding queries. Defaults to 1.
+
+        Returns:
+            A transformer that expands queries using RM3.
+        """
+        return pyterrier_anserini.AnseriniRM3(
+            index=self,
+            fb_docs=fb_docs,
+            fb_terms=fb_terms,
+            original_query_weight=original_query_weight,
+            filter_terms=filter_terms,
+            threads=threads)
+
+    def rocchio(self,
+        *,
+        fb_docs: int = 10,
+        fb_terms: int = 10,
+        alpha: float = 1.0,
+        beta: float = 0.75,
+        gamma: float = 0.0,
+        use_negative: bool = False,
+        bottom_fb_docs: int = 10,
+        bottom_fb_terms: int = 10,
+        threads: int = 1,
+    ) -> pt.Transformer:
+        """Provides a transformer that expands queries using Rocchio pseudo-relevance feedback from this index.
+
+        The transformer takes the results of a first-stage retriever and provides the expanded queries as
+        ``query_toks``, e.g., ``index.bm25() >> index.rocchio() >> index.bm25()``. This index must contain document
+        vectors.
+
+        Args:
+            fb_docs: The number of (top-ranked) feedback documents. Defaults to 10.
+            fb_terms: The number of feedback terms taken from the feedback documents. Defaults to 10.
+            alpha: The weight of the original query. Defaults to 1.0.
+            beta: The weight of the feedback documents. Defaults to 0.75.
+            gamma: The weight of the negative feedback documents. Defaults to 0.0.
+            use_negative: Whether to use the bottom-ranked documents as negative feedback. Defaults to False.
+            bottom_fb_docs: The number of (bottom-ranked) negative feedback documents. Defaults to 10.
+            bottom_fb_terms: The number of feedback terms taken from the negative feedback documents. Defaults to 10.
+            threads: The number of threads to use when expanding queries. Defaults to 1.
+
+        Returns:
+            A transformer that expands queries using Rocchio.
+        """
+        return pyterrier_anserini.AnseriniRocchio(
+            index=self,
+            fb_docs=fb_docs,
+            fb_terms=fb_terms,
+            alpha=alpha,
+            beta=beta,
+            gamma=gamma,
+            use_negative=use_negative,
+            bottom_fb_docs=bottom_fb_docs,
+            bottom_fb_terms=bottom_fb_terms,
+            threads=threads)
+
     def text_loader(self,
         fields: Union[List[str], str, Literal['*']] = '*',
         *,
+        threads: int = 1,
         verbose: bool = False,
     ) -> pt.Transformer:
         """Provides a transformer that can be used to load the text from this index for each document.
 
         Args:
             fields: The fields to extract. When the literal '*' (default), extracts all available fields.
+            threads: The number of threads to use when reading the fields from the index. Defaults to 1.
             verbose: Output verbose logging. Defaults to False.
 
         Returns:
@@ -225,15 +530,292 @@ class AnseriniIndex(pta.Artifact):
         return pyterrier_anserini.AnseriniTextLoader(
             index=self,
             fields=self._resolve_fields(fields),
+            threads=threads,
             verbose=verbose)
 
+    def _shard_paths(self) -> Optional[List[str]]:
+        # Sharded indexes list the paths of their shards (each an Anserini index, relative to this index's path unless
+        # absolute) in pt_meta.json. None indicates that the index is not sharded. The shards of an index never change,
+        # so they are only read once the index is built.
+        if self._shard_paths_obj is not _UNKNOWN:
+            return self._shard_paths_obj
+        shard_paths = None
+        meta_path = os.path.join(self.path, 'pt_meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as fin:
+                shards = json.load(fin).get('shards')
+            if shards is not None:
+                shard_paths = [os.path.join(self.path, shard) for shard in shards]
+        if self.built():
+            self._shard_paths_obj = shard_paths
+        return shard_paths
+
+    def _segments_generation(self) -> Tuple[Optional[int], ...]:
+        # Lucene writes a new segments_N file (N in base 36) each time the index is committed
+        return tuple(_segments_generation(path) for path in self._shard_paths() or [self.path])
+
+    @contextmanager
+    def _snapshot(self) -> Iterator[None]:
+        # Within the block, this thread only checks whether the index has changed once (on entry), so every call that
+        # it makes within the block uses the same searcher, reader, etc., without listing the index again.
+        if getattr(self._local, 'snapshot', False):
+            yield
+            return
+        self._searcher()
+        self._local.snapshot = True
+        try:
+            yield
+        finally:
+            self._local.snapshot = False
+
     def _searcher(self):
-        from pyserini.search.lucene import LuceneSearcher
+        if self._searcher_obj is not None and getattr(self._local, 'snapshot', False):
+            return self._searcher_obj
         assert self.built(), "a searcher object can only be created if the index is built"
-        return LuceneSearcher(self.path)
+        generation = self._segments_generation()
+        with self._searcher_lock:
+            if self._searcher_obj is None or self._searcher_generation != generation:
+                with _phase(self.stats, 'AnseriniIndex.open_searcher'):
+                    self._close_searcher()
+                    self._searcher_obj = _Searcher(self.path, self._shard_paths())
+                    self._searcher_generation = generation
+                    self._docno_lookup_obj = _DocnoLookup.load(self.path, self._searcher_obj.commit_ids)
+                    if self.text_cache is not None:
+                        self.text_cache.clear() # the cached text may be out of date
+                if self.stats is not None:
+                    self.stats.add('AnseriniIndex.searcher_opens')
+            return self._searcher_obj
+
+    def _reader(self) -> Any:
+        # The Lucene IndexReader over this index (spanning all shards, if it is sharded)
+        return self._searcher().reader
+
+    def _docno_lookup(self) -> Optional[_DocnoLookup]:
+        # The docno lookup table of this index, if it has one that is up to date
+        with self._searcher_lock:
+            self._searcher()
+            return self._docno_lookup_obj
+
+    def build_docno_lookup(self, *, threads: int = 1):
+        """Builds a table that maps between the docnos of this index and Lucene's internal docids.
+
+        The table is stored alongside the index (in ``pt_docnos``) as memory-mapped arrays, which are shared by all the
+        processes that use the index. When present, it is used to resolve docnos (e.g., when re-ranking or loading
+        text) and to provide the docnos of retrieved documents without loading them from the index.
+
+        :class:`~pyterrier_anserini.AnseriniIndexer` builds the table automatically, and it is kept up to date by
+        :meth:`delete` and :meth:`optimize`. An index that is modified by other means ignores its (outdated) table until
+        it is rebuilt. Rebuilding a table only reads the docnos of the segments of the index that it does not cover
+        already (e.g., those of appended documents or of merged segments), so the cost of keeping it up to date
+        grows with the size of each change rather than with the size of the index.
+
+        Args:
+            threads: The number of threads to use when reading the docnos from the index. Defaults to 1.
+        """
+        with self._searcher_lock:
+            commit_ids = self._searcher().commit_ids
+            reader = self._reader()
+            previous = _DocnoLookup.load(self.path, None)
+            docnos = np.full(reader.maxDoc(), None, dtype=object)
+            segments, unread = [], []
+            with _jni_lock:
+                for leaf in reader.leaves().toArray():
+                    max_doc = leaf.reader().maxDoc()
+                    segment_id = _segment_id(leaf.reader())
+                    segment_docnos = None
+                    if previous is not None and segment_id is not None:
+                        segment_docnos = previous.segment_docnos(segment_id)
+                    if segment_docnos is None:
+                        unread.append(np.arange(leaf.docBase, leaf.docBase + max_doc, dtype=np.int32))
+                    else:
+                        docnos[leaf.docBase:leaf.docBase + max_doc] = segment_docnos
+                    if segment_id is not None:
+                        segments.append((segment_id, leaf.docBase, max_doc))
+            if unread:
+                unread = np.concatenate(unread)
+                docnos[unread] = _load_stored_fields(reader, unread, ['id'], threads=threads)['id']
+            live = _live_docs(reader)
+            if live is not None:
+                docnos[~live] = None
+            _DocnoLookup.write(self.path, docnos.tolist(), commit_ids, segments)
+            self._docno_lookup_obj = _DocnoLookup.load(self.path, commit_ids)
+
+    def _index_searcher(self,
+        similarity: Union[str, AnseriniSimilarity],
+        similarity_args: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        # Lucene IndexSearchers are cheap and thread-safe, but the similarity is a property of the IndexSearcher. So
+        # we keep one per similarity configuration, all sharing the reader of the cached searcher. For sharded
+        # indexes, the IndexSearcher searches its slices (groups of segments, which Lucene forms from segments of up
+        # to 250k documents, 5 at a time) concurrently, on the thread pool of the searcher.
+        similarity = AnseriniSimilarity(similarity)
+        key = (similarity, tuple(sorted((similarity_args or {}).items())))
+        with self._searcher_lock:
+            searcher = self._searcher()
+            if key not in self._index_searchers:
+                if searcher.executor is None:
+                    index_searcher = J.IndexSearcher(searcher.reader)
+                else:
+                    index_searcher = J.IndexSearcher(searcher.reader, searcher.executor)
+                index_searcher.setSimilarity(similarity.to_lucene_sim(similarity_args))
+                self._index_searchers[key] = index_searcher
+            return self._index_searchers[key]
+
+    def _lucene_docids(self, docnos: Iterable[str], *, threads: int = 1, component: Optional[str] = None) -> np.ndarray:
+        # Resolves external docnos to Lucene's internal docids (-1 for docnos that are not in the index). Each distinct
+        # docno is only looked up once, and the lookups are split among the threads. The time and (estimated) JVM calls
+        # are attributed to the component (if any) in the index's stats.
+        with _phase(self.stats if component else None, f'{component}.resolve_docnos'):
+            return self._resolve_docnos(list(docnos), threads, component)
+
+    def _resolve_docnos(self, docnos: List[str], threads: int, component: Optional[str]) -> np.ndarray:
+        docno_lookup = self._docno_lookup()
+        if docno_lookup is not None:
+            return docno_lookup.lucene_docids(docnos)
+        reader = self._reader()
+        lookup = dict.fromkeys(docnos)
+        distinct = list(lookup)
+
+        def _resolve(chunk: List[str]) -> List[int]:
+            return [J.IndexReaderUtils.convertDocidToLuceneDocid(reader, docno) for docno in chunk]
+        chunk_size = max(-(-len(distinct) // max(threads, 1)), 1)
+        chunks = [distinct[i:i+chunk_size] for i in range(0, len(distinct), chunk_size)]
+        lucene_docids = [docid for chunk in _thread_map(_resolve, chunks, threads) for docid in chunk]
+        lookup.update(zip(distinct, lucene_docids))
+        if component and self.stats is not None:
+            self.stats.add(f'{component}.jvm_calls_est', len(distinct))
+        return np.array([lookup[docno] for docno in docnos], dtype=np.int32)
+
+    def _load_text(self,
+        docnos: List[str],
+        fields: List[str],
+        *,
+        lucene_docids: Optional[np.ndarray] = None,
+        threads: int = 1,
+        verbose: bool = False,
+        component: str = 'AnseriniIndex',
+    ) -> Dict[str, np.ndarray]:
+        # Loads the stored fields of the provided (distinct) docnos, using the text cache (if any). Values are None for
+        # docnos that are not in the index. The Lucene docids of the docnos can be provided if they are already known.
+        # The work is recorded for the component in the index's stats.
+        result = {f: np.full(len(docnos), None, dtype=object) for f in fields}
+        missing = np.arange(len(docnos))
+        stats = self.stats
+        if self.text_cache is not None:
+            self._searcher() # clears the cache if the index has changed
+            with _phase(stats, f'{component}.text_cache'):
+                cached = self.text_cache.get_many((docno, f) for docno in docnos for f in fields)
+                for f in fields:
+                    for i, docno in enumerate(docnos):
+                        if (docno, f) in cached:
+                            result[f][i] = cached[docno, f]
+                missing = np.array([i for i, docno in enumerate(docnos)
+                    if any((docno, f) not in cached for f in fields)], dtype=np.int64)
+        if len(missing) == 0:
+            return result
+
+        if lucene_docids is None:
+            missing_docids = self._lucene_docids([docnos[i] for i in missing], threads=threads, component=component)
+        else:
+            missing_docids = np.asarray(lucene_docids)[missing]
+        reader = self._reader()
+        with _phase(stats, f'{component}.read_text'):
+            loaded = _load_stored_fields(reader, missing_docids, fields, threads=threads, verbose=verbose)
+        if stats is not None:
+            # a document() call and a get() call per field for each document
+            read = int(np.count_nonzero(missing_docids >= 0))
+            stats.add(f'{component}.docs_read', read)
+            stats.add(f'{component}.jvm_calls_est', read * (1 + len(fields)))
+        for f in fields:
+            result[f][missing] = loaded[f]
+        if self.text_cache is not None:
+            self.text_cache.put_many(((docnos[i], f), loaded[f][j]) for f in fields for j, i in enumerate(missing))
+        return result
+
+    def _close_searcher(self):
+        with self._searcher_lock:
+            if self._searcher_obj is not None:
+                self._searcher_obj.close()
+            self._searcher_obj = None
+            self._docno_lookup_obj = None
+            self._searcher_generation = None
+            self._index_searchers = {}
+
+    def close(self):
+        """Closes the searcher of this index, if it is open.
+
+        The searcher is re-opened automatically if this index is used again.
+        """
+        self._close_searcher()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ['_searcher_lock', '_searcher_obj', '_docno_lookup_obj', '_searcher_generation',
+                    '_index_searchers', '_shard_paths_obj', '_local']:
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._init_searcher_state()
+
+    @contextmanager
+    def _index_writer(self, path: str) -> Iterator[Any]:
+        # A Lucene IndexWriter over the (existing) index at path. The changes are committed if the block completes, and
+        # are rolled back otherwise.
+        assert self.built(), "the index must be built before it can be modified"
+        config = J.IndexWriterConfig().setOpenMode(J.IndexWriterOpenMode.APPEND)
+        writer = J.IndexWriter(J.FSDirectory.open(J.File(path).toPath()), config)
+        try:
+            yield writer
+        except BaseException:
+            writer.rollback()
+            raise
+        writer.close()
+
+    def delete(self, docnos: Iterable[str]):
+        """Deletes documents from this index.
+
+        Docnos that are not in the index are ignored. Use :meth:`optimize` to reclaim the space used by deleted
+        documents.
+
+        Args:
+            docnos: The docnos of the documents to delete.
+        """
+        queries = [J.TermQuery(J.Term('id', docno)) for docno in docnos]
+        if not queries:
+            # (deleteDocuments without arguments is ambiguous between its Term and Query overloads)
+            return
+        for path in self._shard_paths() or [self.path]:
+            with self._index_writer(path) as writer:
+                writer.deleteDocuments(*queries)
+        if _DocnoLookup.exists(self.path):
+            self.build_docno_lookup()
+
+    def optimize(self, max_segments: int = 1):
+        """Merges the segments of this index.
+
+        Indexes built in several batches (or updated incrementally) consist of many segments. Merging them reduces
+        query latency, at the cost of some time now. Deleted documents are removed from merged segments.
+
+        Args:
+            max_segments: The maximum number of segments left after merging (in each shard, for sharded indexes).
+                Defaults to 1.
+        """
+        for path in self._shard_paths() or [self.path]:
+            with self._index_writer(path) as writer:
+                writer.forceMerge(max_segments)
+        if _DocnoLookup.exists(self.path):
+            self.build_docno_lookup()
 
     def fields(self) -> List[str]:
-        field_info = J.IndexReaderUtils.getFieldInfo(self._searcher().object.reader)
+        field_info = J.IndexReaderUtils.getFieldInfo(self._reader())
         return [k for k in field_info if k != 'id']
 
     def _resolve_fields(self, fields: Optional[_TFields]) -> Optional[List[str]]:
@@ -246,7 +828,299 @@ class AnseriniIndex(pta.Artifact):
         return fields
 
     def num_docs(self) -> int:
-        return self._searcher().object.get_total_num_docs()
+        # NB: unlike get_total_num_docs, numDocs does not count deleted documents
+        return self._reader().numDocs()
+
+    def term_stats(self, terms: List[str], *, field: str = 'contents') -> Tuple[np.ndarray, np.ndarray]:
+        """Provides the document frequency and collection frequency of each of the given terms.
+
+        The terms are matched verbatim, so they should already be analyzed (e.g., stemmed). The statistics are those
+        used by Lucene when scoring, so they include documents that are deleted but not yet merged away. If the
+        vocabulary statistics of the field have been built (see :meth:`build_vocab_stats`), they are looked up there.
+
+        Args:
+            terms: The terms to look up.
+            field: The field of the terms. Defaults to ``contents``.
+
+        Returns:
+            A tuple of (document frequencies, collection frequencies), each an int64 array aligned with ``terms``. Terms
+            that are not in the field have frequencies of 0.
+        """
+        with self._searcher_lock:
+            vocab = _VocabStats.load(self.path, field, self._searcher().commit_ids)
+        if vocab is not None:
+            return vocab.term_stats(terms)
+        reader = self._reader()
+        df = np.array([reader.docFreq(J.Term(field, term)) for term in terms], dtype=np.int64)
+        cf = np.array([reader.totalTermFreq(J.Term(field, term)) for term in terms], dtype=np.int64)
+        return df, cf
+
+    def doc_lengths(self, *, field: str = 'contents', threads: int = 1) -> np.ndarray:
+        """Provides the length (number of indexed terms) of every document in the index.
+
+        Lengths are exact when the index stores document vectors (the default for text documents). Otherwise, they
+        are decoded from Lucene's norms, which represent lengths approximately (exactly up to 40 terms, and within
+        about 12% beyond), as used by BM25.
+
+        Lucene provides lengths one document at a time, so this makes a few JVM calls per document (reading the
+        document vector or the norm of each). For large indexes, prefer computing the lengths once and keeping them.
+
+        Args:
+            field: The field to measure. Defaults to ``contents``.
+            threads: The number of threads to use when reading document vectors. Defaults to 1.
+
+        Returns:
+            An int64 array of the lengths of the documents, indexed by Lucene docid (as in :meth:`postings`). Deleted
+            documents have a length of 0.
+        """
+        reader = self._reader()
+        max_doc = reader.maxDoc()
+        lengths = np.zeros(max_doc, dtype=np.int64)
+        field_infos = J.FieldInfos.getMergedFieldInfos(reader)
+        field_info = field_infos.fieldInfo(field)
+        if field_info is not None and field_info.hasVectors():
+            def _lengths(docids: np.ndarray) -> None:
+                # (the threads share the reader, which reads term vectors using a reader of the calling thread)
+                for docid in docids.tolist():
+                    with _shared_call('IndexReader.getTermVector', reader):
+                        vector = reader.getTermVector(docid, field)
+                    if vector is not None:
+                        with _jni_lock:
+                            lengths[docid] = vector.getSumTotalTermFreq()
+            _thread_map(_lengths, np.array_split(np.arange(max_doc), max(threads, 1)), threads)
+        elif field_info is not None and field_info.hasNorms():
+            # no document vectors, so the lengths are decoded from the (one byte) norms
+            decode = _norm_lengths()
+            norms = J.MultiDocValues.getNormValues(reader, field)
+            while (docid := norms.nextDoc()) != J.DocIdSetIterator.NO_MORE_DOCS:
+                lengths[docid] = decode[norms.longValue() + 128]
+        live = _live_docs(reader)
+        if live is not None:
+            lengths[~live] = 0
+        return lengths
+
+    def postings(self, terms: List[str], *, field: str = 'contents') -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Provides the postings lists of the given terms.
+
+        The terms are matched verbatim, so they should already be analyzed (e.g., stemmed). Deleted documents are
+        excluded.
+
+        Lucene provides postings one at a time, so this makes two JVM calls per posting (for its docid and its
+        frequency). It is meant for terms with moderately sized postings lists, rather than for exporting the index.
+
+        Args:
+            terms: The terms to look up.
+            field: The field of the terms. Defaults to ``contents``.
+
+        Returns:
+            A list aligned with ``terms``, containing a tuple of (Lucene docids, term frequencies) for each term. Both
+            are arrays (int32 and int64), in increasing docid order, and are empty for terms that are not in the field.
+        """
+        reader = self._reader()
+        live = _live_docs(reader)
+        result = []
+        for term in terms:
+            docids, freqs = [], []
+            lucene_term = J.Term(field, term)
+            term_bytes = lucene_term.bytes()
+            postings = J.MultiTerms.getTermPostingsEnum(reader, field, term_bytes)
+            if postings is not None:
+                while (docid := postings.nextDoc()) != J.DocIdSetIterator.NO_MORE_DOCS:
+                    docids.append(docid)
+                    freqs.append(postings.freq())
+            docids, freqs = np.array(docids, dtype=np.int32), np.array(freqs, dtype=np.int64)
+            if live is not None:
+                mask = live[docids]
+                docids, freqs = docids[mask], freqs[mask]
+            result.append((docids, freqs))
+        return result
+
+    def docnos(self, lucene_docids: Iterable[int]) -> np.ndarray:
+        """Provides the docnos of the documents with the given Lucene docids (e.g., from :meth:`postings`).
+
+        Args:
+            lucene_docids: The Lucene docids of the documents.
+
+        Returns:
+            An object array of the docnos, aligned with ``lucene_docids``.
+        """
+        lucene_docids = np.asarray(lucene_docids, dtype=np.int32)
+        docno_lookup = self._docno_lookup()
+        if docno_lookup is not None:
+            return docno_lookup.docnos(lucene_docids)
+        distinct, inverse = np.unique(lucene_docids, return_inverse=True)
+        return _load_stored_fields(self._reader(), distinct, ['id'])['id'][inverse]
+
+    def build_vocab_stats(self, *, field: str = 'contents'):
+        """Builds a table of the statistics of every term in a field of this index.
+
+        The table is stored alongside the index (in ``pt_vocab``) as memory-mapped arrays, which are shared by all the
+        processes that use the index. It is read in a single pass over Lucene's terms dictionary, and is used by
+        :meth:`term_stats` (and provided by :meth:`vocab_stats`) until the index changes.
+
+        Args:
+            field: The field to build the table of. Defaults to ``contents``.
+        """
+        with self._searcher_lock:
+            commit_ids = self._searcher().commit_ids
+            vocab = []
+            terms = J.MultiTerms.getTerms(self._reader(), field)
+            if terms is not None:
+                terms_enum = terms.iterator()
+                while (term := terms_enum.next()) is not None:
+                    vocab.append((term.utf8ToString(), terms_enum.docFreq(), terms_enum.totalTermFreq()))
+            _VocabStats.write(self.path, field, vocab, commit_ids)
+
+    def vocab_stats(self, *, field: str = 'contents') -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Provides the statistics of every term in a field of this index, building them if needed.
+
+        See :meth:`build_vocab_stats`. The arrays are memory-mapped, so they are only read from disk as they are used.
+
+        Args:
+            field: The field to provide the statistics of. Defaults to ``contents``.
+
+        Returns:
+            A tuple of (terms, document frequencies, collection frequencies). The terms are UTF-8 encoded bytes, in
+            sorted order.
+        """
+        with self._searcher_lock:
+            commit_ids = self._searcher().commit_ids
+            vocab = _VocabStats.load(self.path, field, commit_ids)
+            if vocab is None:
+                self.build_vocab_stats(field=field)
+                vocab = _VocabStats.load(self.path, field, commit_ids)
+        return vocab.terms, vocab.df, vocab.cf
 
     def __repr__(self):
         return f"AnseriniIndex({self.path!r})"
+
+
+def _snapshot(fn: _TFn) -> _TFn:
+    """Decorates a method of a transformer so that its index (``self.index``) is checked for changes once per call."""
+    @functools.wraps(fn)
+    def wrapped(self, *args, **kwargs): # noqa: ANN001, ANN202
+        with self.index._snapshot():
+            return fn(self, *args, **kwargs)
+    return wrapped
+
+
+class _Searcher:
+    """The parts of Anserini's ``SimpleSearcher`` (like pyserini's ``LuceneSearcher``) that an index uses.
+
+    Provides the ``analyzer`` and reranker ``cascade`` of the searcher, along with a ``reader`` over the whole index
+    and the ``commit_ids`` of the index (a unique id of the commit that the reader of each shard opened, in hex).
+    For an unsharded index, the ``SimpleSearcher`` itself is also available (as ``object``). For a sharded index, the
+    analyzer and cascade come from the ``SimpleSearcher`` of the first shard, which is closed straight away (so that
+    nothing can search or read the first shard alone), ``reader`` spans all shards, ``object`` is ``None``, and
+    ``executor`` is a Java thread pool (with a thread per shard) with which searches cover the shards concurrently.
+
+    pyserini's ``LuceneSearcher`` is not used, since importing ``pyserini.search.lucene`` also imports pyserini's dense
+    retrieval dependencies (e.g., torch and transformers), which takes several seconds, and it opens a second reader
+    over the index.
+    """
+    def __init__(self, index_dir: str, shard_paths: Optional[List[str]] = None):
+        self.index_dir = index_dir
+        simple_searcher = J.SimpleSearcher(shard_paths[0] if shard_paths else index_dir)
+        self.analyzer = simple_searcher.analyzer
+        self.cascade = simple_searcher.cascade
+        self.executor = None
+        if shard_paths is None:
+            self.object = simple_searcher
+            self.object.get_total_num_docs() # (which also creates the searcher's IndexSearcher)
+            self.reader = simple_searcher.reader
+            readers = [simple_searcher.reader]
+        else:
+            self.object = None
+            simple_searcher.close()
+            readers = [J.DirectoryReader.open(J.FSDirectory.open(J.File(p).toPath())) for p in shard_paths]
+            # (cast, so that pyjnius resolves overloads that accept an IndexReader)
+            self.reader = pt.java.cast('org.apache.lucene.index.IndexReader', J.MultiReader(*readers))
+            self.executor = J.ForkJoinPool(len(shard_paths))
+        # (unlike the generation of a commit, its id differs from those of earlier indexes built at the same path)
+        self.commit_ids = [bytes(pt.java.cast('org.apache.lucene.index.StandardDirectoryReader', reader)
+            .getSegmentInfos().getId()).hex() for reader in readers]
+
+    def close(self):
+        if self.object is not None:
+            self.object.close()
+        else:
+            self.reader.close() # (which also closes the reader of each shard)
+            self.executor.shutdown()
+
+
+def _segments_generation(path: str) -> Optional[int]:
+    generations = [int(f[len('segments_'):], 36) for f in os.listdir(path) if f.startswith('segments_')]
+    return max(generations, default=None)
+
+
+@functools.lru_cache
+def _norm_lengths() -> np.ndarray:
+    """Provides the document length encoded by each (one byte) norm value, indexed by the norm plus 128."""
+    return np.array([J.SmallFloat.byte4ToInt(b) for b in range(-128, 128)], dtype=np.int64)
+
+
+def _segment_id(leaf_reader: Any) -> Optional[str]:
+    # The unique id of the segment that a leaf reader reads (None if it does not read a segment). Once written, the
+    # documents of a segment never change (only which of them are deleted), so neither do their docids within it.
+    if leaf_reader.getClass().getName() != 'org.apache.lucene.index.SegmentReader':
+        return None
+    segment_reader = pt.java.cast('org.apache.lucene.index.SegmentReader', leaf_reader)
+    return bytes(segment_reader.getSegmentInfo().info.getId()).hex()
+
+
+def _live_docs(reader: Any) -> Optional[np.ndarray]:
+    # A boolean mask of the documents that are not deleted (None if no documents are deleted)
+    if not reader.hasDeletions():
+        return None
+    live = np.ones(reader.maxDoc(), dtype=bool)
+    with _jni_lock:
+        for leaf in reader.leaves().toArray():
+            leaf_reader = leaf.reader()
+            live_docs = leaf_reader.getLiveDocs()
+            if live_docs is None:
+                continue
+            # each segment's live docs are copied into a bit set within the JVM, and then transferred in one call as
+            # words of 64 bits (the first document of each word in its lowest bit)
+            words = np.array(J.FixedBitSet.copyOf(live_docs).getBits(), dtype='<i8')
+            bits = np.unpackbits(words.view(np.uint8), bitorder='little').astype(bool)
+            live[leaf.docBase:leaf.docBase + leaf_reader.maxDoc()] = bits[:leaf_reader.maxDoc()]
+    return live
+
+
+def _load_stored_fields(
+    reader: Any,
+    lucene_docids: np.ndarray,
+    fields: List[str],
+    *,
+    threads: int = 1,
+    verbose: bool = False,
+) -> Dict[str, np.ndarray]:
+    """Loads the stored ``fields`` of the documents identified by ``lucene_docids`` (which must be distinct).
+
+    Documents are read in docid order, so that each block of the (block-compressed) stored fields only needs to be
+    decompressed once. With multiple threads, each reads a contiguous range of docids. Documents that are not in the
+    index (i.e., have a docid of -1) are given values of None.
+    """
+    result = {f: np.full(len(lucene_docids), None, dtype=object) for f in fields}
+    order = np.argsort(lucene_docids, kind='stable')
+    order = order[lucene_docids[order] >= 0]
+    pbar = pt.tqdm(total=len(order), unit='d', desc='AnseriniTextLoader') if verbose else None
+
+    def _load(idxs: np.ndarray) -> None:
+        # The threads share the reader, which reads (and decompresses) each document using a stored fields reader of
+        # the calling thread, while each thread's documents are its own (see _jni_lock).
+        for i in idxs:
+            docid = int(lucene_docids[i])
+            with _shared_call('IndexReader.document', reader):
+                doc = reader.document(docid)
+            with _jni_lock:
+                for f in fields:
+                    result[f][i] = doc.get(f)
+            if pbar is not None:
+                pbar.update(1)
+    try:
+        _thread_map(_load, np.array_split(order, max(threads, 1)), threads)
+    finally:
+        if pbar is not None:
+            pbar.close()
+    return result
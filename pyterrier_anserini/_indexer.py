@@ -1,20 +1,91 @@
+import itertools
 import json
+import multiprocessing
 import os
-from typing import Dict, Iterable, List, Literal, Union
+import shutil
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import suppress
+from typing import Any, Dict, Iterable, List, Literal, Optional, Union
 
 import pyterrier as pt
 import pyterrier_alpha as pta
 
-from pyterrier_anserini import AnseriniIndex
+import pyterrier_anserini
+from pyterrier_anserini import AnseriniIndex, J
+from pyterrier_anserini._java import configure
+
+# the state of a shard's worker process: (indexer, SimpleIndexer, toks, multi_fields, mapper), set by _init_worker
+_worker_state = None
+
+
+def _init_worker(indexer: 'AnseriniIndexer', version: Optional[str], path: str, args: List[str], toks: bool,
+        multi_fields: Optional[List[str]]):
+    global _worker_state
+    if version is not None:
+        pyterrier_anserini.set_version(version) # (the same version of Anserini as the parent process)
+    if not pt.java.started():
+        pt.java.init()
+    _worker_state = (indexer, indexer._simple_indexer(path, args), toks, multi_fields, J.ObjectMapper())
+
+
+def _worker_add_batch(batch: List[Dict]):
+    indexer, simple_indexer, toks, multi_fields, mapper = _worker_state
+    indexer._add_batch(simple_indexer, batch, toks, multi_fields, mapper)
+
+
+def _worker_prepare_commit(optimize: bool):
+    simple_indexer = _worker_state[1]
+    if optimize:
+        simple_indexer.writer.forceMerge(1)
+    simple_indexer.writer.prepareCommit()
+
+
+def _worker_close():
+    _worker_state[1].close(False) # (which completes the prepared commit)
+
+
+def _worker_rollback():
+    _worker_state[1].writer.rollback()
 
 
 @pt.java.required
 class AnseriniIndexer(pt.Indexer):
-    """An indexer for Anserini indexes."""
+    """An indexer for Anserini indexes.
+
+    Documents are usually indexed from their text fields (see ``fields``). Alternatively, documents that provide a
+    ``toks`` field (a ``{term: weight}`` dict, e.g., from a learned sparse encoder) are indexed as an impact index, like
+    Anserini's ``JsonVectorCollection``: the terms are indexed verbatim (i.e., they are not analyzed), with the integer
+    part of each weight as the term's frequency. Weights should therefore be scaled (e.g., by 100) beforehand. Impact
+    indexes can be searched using :meth:`~pyterrier_anserini.AnseriniIndex.impact`.
+
+    With ``multi_field``, each of the ``fields`` is also indexed as its own Lucene field (with the same name), in
+    addition to the concatenated ``contents`` field, so that the fields can be searched with per-field weights (see the
+    ``fields`` option of :class:`~pyterrier_anserini.AnseriniRetriever`). When ``fields`` is '*', the fields are those
+    of the first document.
+
+    When appending, documents replace any existing documents in the index (or earlier in the input) that have the same
+    docno. Unlike when creating an index, the segments of the index are not merged afterwards; see
+    :meth:`AnseriniIndex.optimize`.
+
+    A sharded index consists of several sub-indexes (relative to the index path unless absolute, e.g., to place them on
+    separate disks). Each document is assigned to a shard based on its docno, and the shards are built in parallel, each
+    by its own (spawned) worker process, which runs its own JVM.
+    """
     def __init__(self,
         index: Union[AnseriniIndex, str],
         *,
         fields: Union[List[str], Literal['*']] = '*',
+        threads: int = 1,
+        memory_buffer_mb: Optional[int] = None,
+        batch_size: int = 10_000,
+        store_contents: Optional[bool] = None,
+        store_docvectors: Optional[bool] = None,
+        append: bool = False,
+        shards: Optional[Union[int, List[str]]] = None,
+        docno_lookup: bool = True,
+        multi_field: bool = False,
         verbose: bool = False
     ):
         """Initializes the indexer.
@@ -23,10 +94,34 @@ class AnseriniIndexer(pt.Indexer):
             index: The index to index to. If a string, an AnseriniIndex object is created for the path.
             fields: The fields to index. If '*' (default), all fields are indexed. Otherwise, the values of the fields
                 provided in this argumetn are concatenated and indexed.
+            threads: The number of Lucene writer threads to use when indexing. Defaults to 1.
+            memory_buffer_mb: The size of Lucene's in-memory buffer (in MB). If None (default), Anserini's default size
+                is used.
+            batch_size: The number of documents passed together to the writer threads. Defaults to 10,000.
+            store_contents: Whether to store the contents of each document. If None (default), contents are stored for
+                text documents but not for ``toks`` documents.
+            store_docvectors: Whether to store the document vector of each document. If None (default), document vectors
+                are stored for text documents but not for ``toks`` documents.
+            append: Whether to add the documents to an existing index (creating it if it does not exist). Defaults to
+                False.
+            shards: The number of shards (or the paths of the shards) of a sharded index. If None (default), a single
+                index is built.
+            docno_lookup: Whether to build the index's docno lookup table (see
+                :meth:`AnseriniIndex.build_docno_lookup`) once the documents are indexed. Defaults to True.
+            multi_field: Whether to also index each of the ``fields`` as its own field. Defaults to False.
             verbose: Whether to display a progress bar when indexing.
         """
         self._index = index if isinstance(index, AnseriniIndex) else AnseriniIndex(index)
         self.fields = fields
+        self.threads = threads
+        self.memory_buffer_mb = memory_buffer_mb
+        self.batch_size = batch_size
+        self.store_contents = store_contents
+        self.store_docvectors = store_docvectors
+        self.append = append
+        self.shards = shards
+        self.docno_lookup = docno_lookup
+        self.multi_field = multi_field
         self.verbose = verbose
 
     __repr__ = pta.transformer_repr
@@ -34,38 +129,171 @@ class AnseriniIndexer(pt.Indexer):
     def index(self, inp: Iterable[Dict]) -> pta.Artifact:
         """Indexes the input documents to the index.
 
+        Documents are read from ``inp`` in batches of ``batch_size``, and each batch is added to the index by
+        ``threads`` concurrent Lucene writer threads. The resulting index is the same regardless of the number of
+        threads, apart from the order of the documents within it.
+
         Args:
             inp: An iterable of documents to index.
 
         Returns:
             The index that was indexed to.
         """
-        assert not self._index.built()
-        from pyserini.index.lucene import LuceneIndexer
-        args = ['-index', self._index.path, '-storeContents', '-storeDocvectors']
-        indexer = LuceneIndexer(self._index.path, args=args)
-        # create directory and metadata file
-        if not os.path.exists(os.path.join(self._index.path, 'pt_meta.json')):
-            os.makedirs(self._index.path, exist_ok=True)
-            with open(os.path.join(self._index.path, 'pt_meta.json'), 'wt') as fout:
-                json.dump({
-                    'type': 'sparse_index',
-                    'format': 'anserini',
-                    'package_hint': 'pyterrier-anserini',
-                    # TODO: other stuff (like stemmer used) in due course
-                }, fout)
+        assert self.append or not self._index.built()
+
+        # peek at the first document to find out whether the documents are pre-tokenized
+        inp = iter(inp)
+        first = next(inp, None)
+        toks = first is not None and 'toks' in first
+        if first is not None:
+            inp = itertools.chain([first], inp)
+
+        args = []
+        if self.store_contents if self.store_contents is not None else not toks:
+            args.append('-storeContents')
+        if self.store_docvectors if self.store_docvectors is not None else not toks:
+            args.append('-storeDocvectors')
+        if toks:
+            args += ['-impact', '-pretokenized']
+        if self.memory_buffer_mb is not None:
+            args += ['-memoryBuffer', str(self.memory_buffer_mb)]
+        if self.append:
+            args.append('-append')
+        multi_fields = None
+        if self.multi_field:
+            if toks:
+                raise ValueError('multi_field indexing is not supported for pre-tokenized (toks) documents')
+            multi_fields = self._multi_fields(first)
+            if multi_fields:
+                args += ['-fields'] + multi_fields
+
+        if self._index.built():
+            shards = self._index._shard_paths()
+            if self.shards is not None and shards != self._shard_paths():
+                raise ValueError(f'shards={self.shards!r} does not match the shards of {self._index!r} ({shards!r})')
+        elif self.shards is None:
+            shards = None
+        else:
+            _write_meta(self._index.path, shards=self._shard_names())
+            shards = self._shard_paths()
+        paths = shards if shards is not None else [self._index.path]
+        for path in paths:
+            _write_meta(path)
 
         if self.verbose:
             inp = pt.tqdm(inp, unit='docs', desc='AnseriniIndexer')
+        batches = iter(lambda: list(itertools.islice(inp, self.batch_size)), [])
+        batches = (self._split_batch(batch, len(paths)) for batch in batches)
 
-        for doc in inp:
-            indexer.add_doc_dict(self._map_doc(doc))
+        if len(paths) == 1:
+            indexer = self._simple_indexer(paths[0], args)
+            mapper = J.ObjectMapper()
+            for (batch,) in batches:
+                self._add_batch(indexer, batch, toks, multi_fields, mapper)
+            # commit, merging the index into a single segment (which is left to AnseriniIndex.optimize when appending)
+            indexer.close(not self.append)
+        else:
+            self._index_shards(paths, args, batches, toks, multi_fields)
 
-        # commit
-        indexer.close()
+        if self.docno_lookup:
+            self._index.build_docno_lookup(threads=self.threads)
 
         return self._index
 
+    def _shard_names(self) -> List[str]:
+        return [f'shard{i}' for i in range(self.shards)] if isinstance(self.shards, int) else list(self.shards)
+
+    def _shard_paths(self) -> List[str]:
+        # the paths of the shards given by the shards option (resolved like AnseriniIndex._shard_paths)
+        return [os.path.join(self._index.path, shard) for shard in self._shard_names()]
+
+    def _split_batch(self, batch: List[Dict], num_shards: int) -> List[List[Dict]]:
+        if self.append:
+            # a docno that appears more than once in a batch is replaced by its last copy (as by separate batches)
+            batch = list({doc['docno']: doc for doc in batch}.values())
+        if num_shards == 1:
+            return [batch]
+        # documents are assigned to shards by their docno, so that later updates go to the same shard
+        shard_batches = [[] for _ in range(num_shards)]
+        for doc in batch:
+            shard_batches[zlib.crc32(doc['docno'].encode()) % num_shards].append(doc)
+        return shard_batches
+
+    def _index_shards(self, paths: List[str], args: List[str], batches: Iterable[List[List[Dict]]], toks: bool,
+            multi_fields: Optional[List[str]]):
+        # Each shard is built by a worker process of its own (spawned, since a process with a running JVM cannot be
+        # forked safely), which is started when the shard receives its first documents. Each worker has at most one
+        # batch in flight, which bounds the documents held in memory. The shards are committed in two phases, so that
+        # if any shard fails, none of them is committed (and a new index is removed).
+        workers: Dict[int, ProcessPoolExecutor] = {}
+        pending: Dict[int, Future] = {}
+
+        def worker(i: int) -> ProcessPoolExecutor:
+            if i not in workers:
+                workers[i] = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker, initargs=(self, configure['version'], paths[i], args, toks, multi_fields))
+            return workers[i]
+
+        try:
+            for shard_batches in batches:
+                for i, shard_batch in enumerate(shard_batches):
+                    if shard_batch:
+                        if i in pending:
+                            pending.pop(i).result()
+                        pending[i] = worker(i).submit(_worker_add_batch, shard_batch)
+            for future in pending.values():
+                future.result()
+            # commit, merging each shard into a single segment (which is left to AnseriniIndex.optimize when
+            # appending). When creating the index, shards without documents are created empty.
+            shard_ids = list(workers) if self.append else range(len(paths))
+            for future in [worker(i).submit(_worker_prepare_commit, not self.append) for i in shard_ids]:
+                future.result()
+        except BaseException:
+            # discard the uncommitted changes of every shard (once its pending batch is done)
+            rollbacks = []
+            for pool in workers.values():
+                with suppress(BrokenProcessPool): # (a worker that died has no changes to discard)
+                    rollbacks.append(pool.submit(_worker_rollback))
+            wait(rollbacks)
+            for pool in workers.values():
+                pool.shutdown()
+            if not self.append:
+                shutil.rmtree(self._index.path, ignore_errors=True)
+            raise
+        else:
+            for future in [worker(i).submit(_worker_close) for i in shard_ids]:
+                future.result()
+        finally:
+            for pool in workers.values():
+                pool.shutdown()
+
+    def _simple_indexer(self, path: str, args: List[str]) -> Any:
+        # (the same arguments as pyserini's LuceneIndexer, which is not used to avoid importing pyserini.index)
+        return J.SimpleIndexer(['-index', path] + args +
+            ['-input', '', '-collection', 'JsonCollection', '-threads', str(self.threads)])
+
+    def _add_batch(self, indexer, batch: List[Dict], toks: bool, multi_fields: Optional[List[str]], mapper): # noqa: ANN001
+        if self.append:
+            # Anserini's SimpleIndexer only ever adds documents, so remove the existing versions first
+            queries = [J.TermQuery(J.Term('id', doc['docno'])) for doc in batch]
+            writer = indexer.writer
+            writer.deleteDocuments(*queries)
+        if toks:
+            docs = [self._map_toks_doc(doc, mapper) for doc in batch]
+        elif multi_fields:
+            docs = [self._map_multi_field_doc(doc, multi_fields, mapper) for doc in batch]
+        else:
+            docs = [J.JsonCollectionDocument.fromFields(d['id'], d['contents']) for d in map(self._map_doc, batch)]
+        indexer.addJsonDocuments(docs)
+
+    def _multi_fields(self, first: Optional[Dict]) -> List[str]:
+        # the fields that are indexed separately (id and contents are always indexed)
+        if self.fields == '*':
+            fields = [k for k, v in (first or {}).items() if k != 'docno' and isinstance(v, str)]
+        else:
+            fields = list(self.fields)
+        return [f for f in fields if f not in ('id', 'contents')]
+
     def _map_doc(self, doc: Dict) -> Dict:
         if self.fields == '*':
             contents = '\n'.join(v for k, v in doc.items() if k != 'docno' and isinstance(v, str))
@@ -75,3 +303,27 @@ class AnseriniIndexer(pt.Indexer):
             'id': doc['docno'],
             'contents': contents
         }
+
+    def _map_multi_field_doc(self, doc: Dict, multi_fields: List[str], mapper) -> Any: # noqa: ANN001
+        # Anserini indexes the additional fields of the JSON document that are listed in its -fields argument
+        fields = {f: str(doc.get(f, '')) for f in multi_fields}
+        return J.JsonCollectionDocument(mapper.readTree(json.dumps({**fields, **self._map_doc(doc)})))
+
+    def _map_toks_doc(self, doc: Dict, mapper) -> Any: # noqa: ANN001
+        # numpy weights are not JSON serializable, so are converted to floats
+        vector = json.dumps({'id': doc['docno'], 'vector': doc['toks']}, default=float)
+        return J.JsonVectorDocument(mapper.readTree(vector))
+
+
+def _write_meta(path: str, **extra: Any):
+    # create directory and metadata file
+    if not os.path.exists(os.path.join(path, 'pt_meta.json')):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'pt_meta.json'), 'wt') as fout:
+            json.dump({
+                'type': 'sparse_index',
+                'format': 'anserini',
+                'package_hint': 'pyterrier-anserini',
+                # TODO: other stuff (like stemmer used) in due course
+                **extra,
+            }, fout)
@@ -1,8 +1,12 @@
-import importlib.metadata
+import functools
+import importlib.util
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from glob import glob
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 from warnings import warn
 
 import pyterrier as pt
@@ -20,10 +24,9 @@ class AnseriniJavaInit(pt.java.JavaInitializer):
 
     def condition(self) -> bool:
         """Disables loading with anserini >= 0.36 since it introduces incompatible dependencies."""
-        try:
-            importlib.metadata.version('pyserini')
-        except Exception as ex:
-            warn(f'error loading anserini java: {ex}')
+        # (found without importing pyserini or reading the metadata of every installed package)
+        if importlib.util.find_spec('pyserini') is None:
+            warn('error loading anserini java: pyserini is not installed')
             return False
         return True
 
@@ -46,12 +49,14 @@ class AnseriniJavaInit(pt.java.JavaInitializer):
             jnius_config.add_classpath(jar)
 
     def post_init(self, jnius): # noqa: ANN001
-        # Temporarily disable the configure_classpath during pyserini init, otherwise it will try to reconfigure jnius
+        # Temporarily disable the configure_classpath during pyserini init, otherwise it will try to reconfigure jnius.
+        # Only pyserini's Java bindings are loaded here (which configure the classpath); the remaining pyserini modules
+        # (in particular pyserini.search, which imports torch, transformers, etc.) are not needed by this package.
         import pyserini.setup
         _configure_classpath = pyserini.setup.configure_classpath
         try:
             pyserini.setup.configure_classpath = pt.utils.noop
-            import pyserini.search.lucene  # load the package
+            import pyserini.pyclass  # noqa: F401
         finally:
             pyserini.setup.configure_classpath = _configure_classpath
 
@@ -59,11 +64,14 @@ class AnseriniJavaInit(pt.java.JavaInitializer):
         return self._message
 
 
+@functools.lru_cache(maxsize=None)
 def _get_pyserini_jar() -> Optional[Tuple[str, str]]:
-    # find the anserini jar distributed with pyserini
+    # find the anserini jar distributed with pyserini (located without importing the package)
     # Adapted from pyserini/setup.py and pyserini/pyclass.py
-    import pyserini.setup
-    jar_root = os.path.join(os.path.split(pyserini.setup.__file__)[0], 'resources/jars/')
+    spec = importlib.util.find_spec('pyserini')
+    if spec is None or not spec.submodule_search_locations:
+        return None, None
+    jar_root = os.path.join(spec.submodule_search_locations[0], 'resources/jars/')
     paths = glob(os.path.join(jar_root, 'anserini-*-fatjar.jar'))
     if not paths:
         return None, None
@@ -89,11 +97,115 @@ def check_version(min_version: str) -> bool:
     return Version(min_version) <= Version(_version)
 
 
+def _first_available_class(*names: str) -> Callable[[], str]:
+    # some classes were moved/renamed between Anserini versions; resolve to the first one that can be loaded
+    def wrapped() -> str:
+        for name in names:
+            try:
+                pt.java.autoclass(name)
+                return name
+            except Exception:
+                pass
+        raise RuntimeError(f'none of {names} are available in this version of Anserini')
+    return wrapped
+
+
+# pyjnius binds a method to the instance that most recently looked it up (a method object is shared by all the
+# instances of a class), so another thread can swap the instance of a call between its lookup and the call itself.
+# Threads can therefore concurrently call static methods and read fields, but must hold this lock while calling the
+# methods of objects of their own, and use _shared_call to call the methods of objects that they share.
+_jni_lock = threading.RLock()
+_shared_calls_cond = threading.Condition()
+_shared_calls: Dict[str, Tuple[int, int]] = {} # method -> (id of the object it is called on, calls in progress)
+
+
+@contextmanager
+def _shared_call(method: str, obj: Any) -> Iterator[None]:
+    # Within the block, the calling thread can call method (named as 'Class.method') on obj. Calls of the method on the
+    # same object (e.g., the searches of the threads of a retriever, which share an IndexSearcher) proceed
+    # concurrently, while calls on other objects (e.g., the IndexSearcher of another similarity) wait until they end.
+    with _shared_calls_cond:
+        while method in _shared_calls and _shared_calls[method][0] != id(obj):
+            _shared_calls_cond.wait()
+        _shared_calls[method] = (id(obj), _shared_calls.get(method, (None, 0))[1] + 1)
+    try:
+        yield
+    finally:
+        with _shared_calls_cond:
+            obj_id, calls = _shared_calls.pop(method)
+            if calls > 1:
+                _shared_calls[method] = (obj_id, calls - 1)
+            else:
+                _shared_calls_cond.notify_all()
+
+
+def _thread_map(fn: Callable[[Any], Any], chunks: Sequence[Any], threads: int) -> List[Any]:
+    # Applies fn to each of the chunks using a pool of threads. pyjnius releases the GIL during Java calls, so the Java
+    # portion of the work proceeds concurrently. fn must follow the rules of _jni_lock.
+    if threads <= 1 or len(chunks) <= 1:
+        return [fn(chunk) for chunk in chunks]
+    from jnius import detach
+
+    def _fn_and_detach(chunk: Any) -> Any:
+        try:
+            return fn(chunk)
+        finally:
+            detach() # we must detach jnius to prevent thread leaks through JNI
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(_fn_and_detach, chunks))
+
+
 J = pt.java.JavaClasses(
     ClassicSimilarity = 'org.apache.lucene.search.similarities.ClassicSimilarity',
     BM25Similarity = 'org.apache.lucene.search.similarities.BM25Similarity',
     LMDirichletSimilarity = 'org.apache.lucene.search.similarities.LMDirichletSimilarity',
     IndexReaderUtils = 'io.anserini.index.IndexReaderUtils',
+    SimpleSearcher = 'io.anserini.search.SimpleSearcher',
+    SimpleIndexer = 'io.anserini.index.SimpleIndexer',
     QueryParser = 'org.apache.lucene.queryparser.classic.QueryParser',
+    MultiFieldQueryParser = 'org.apache.lucene.queryparser.classic.MultiFieldQueryParser',
+    AnalyzerUtils = 'io.anserini.analysis.AnalyzerUtils',
+    Term = 'org.apache.lucene.index.Term',
+    TermQuery = 'org.apache.lucene.search.TermQuery',
+    BoostQuery = 'org.apache.lucene.search.BoostQuery',
+    BooleanQueryBuilder = 'org.apache.lucene.search.BooleanQuery$Builder',
+    BooleanClauseOccur = 'org.apache.lucene.search.BooleanClause$Occur',
     ImpactSimilarity = 'io.anserini.search.similarity.ImpactSimilarity',
+    IndexSearcher = 'org.apache.lucene.search.IndexSearcher',
+    DirectoryReader = 'org.apache.lucene.index.DirectoryReader',
+    MultiReader = 'org.apache.lucene.index.MultiReader',
+    MultiTerms = 'org.apache.lucene.index.MultiTerms',
+    MultiDocValues = 'org.apache.lucene.index.MultiDocValues',
+    FieldInfos = 'org.apache.lucene.index.FieldInfos',
+    DocIdSetIterator = 'org.apache.lucene.search.DocIdSetIterator',
+    SmallFloat = 'org.apache.lucene.util.SmallFloat',
+    FixedBitSet = 'org.apache.lucene.util.FixedBitSet',
+    IndexWriter = 'org.apache.lucene.index.IndexWriter',
+    IndexWriterConfig = 'org.apache.lucene.index.IndexWriterConfig',
+    IndexWriterOpenMode = 'org.apache.lucene.index.IndexWriterConfig$OpenMode',
+    FSDirectory = 'org.apache.lucene.store.FSDirectory',
+    File = 'java.io.File',
+    Float = 'java.lang.Float',
+    HashMap = 'java.util.HashMap',
+    HashSet = 'java.util.HashSet',
+    ScoreMode = 'org.apache.lucene.search.ScoreMode',
+    QueryVisitor = 'org.apache.lucene.search.QueryVisitor',
+    ForkJoinPool = 'java.util.concurrent.ForkJoinPool',
+    Sort = 'org.apache.lucene.search.Sort',
+    SortField = 'org.apache.lucene.search.SortField',
+    SortFieldType = 'org.apache.lucene.search.SortField$Type',
+    BagOfWordsQueryGenerator = 'io.anserini.search.query.BagOfWordsQueryGenerator',
+    RerankerContext = 'io.anserini.rerank.RerankerContext',
+    Rm3Reranker = 'io.anserini.rerank.lib.Rm3Reranker',
+    RocchioReranker = 'io.anserini.rerank.lib.RocchioReranker',
+    ScoreDoc = 'org.apache.lucene.search.ScoreDoc',
+    TopDocs = 'org.apache.lucene.search.TopDocs',
+    TopScoreDocCollector = 'org.apache.lucene.search.TopScoreDocCollector',
+    TotalHits = 'org.apache.lucene.search.TotalHits',
+    TotalHitsRelation = 'org.apache.lucene.search.TotalHits$Relation',
+    SearchArgs = 'io.anserini.search.SearchCollection$Args',
+    ObjectMapper = 'com.fasterxml.jackson.databind.ObjectMapper',
+    JsonCollectionDocument = 'io.anserini.collection.JsonCollection$Document',
+    JsonVectorDocument = 'io.anserini.collection.JsonVectorCollection$Document',
+    ScoredDocs = _first_available_class('io.anserini.search.ScoredDocs', 'io.anserini.rerank.ScoredDocuments'),
 )
@@ -0,0 +1,138 @@
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+import pyterrier as pt
+import pyterrier_alpha as pta
+
+import pyterrier_anserini
+from pyterrier_anserini._java import configure
+from pyterrier_anserini._stats import _phase
+
+# the retriever of a worker process (set by _init_worker)
+_worker_retriever = None
+
+
+def _init_worker(retriever: 'pyterrier_anserini.AnseriniRetriever', version: Optional[str]):
+    global _worker_retriever
+    if version is not None:
+        pyterrier_anserini.set_version(version) # (the same version of Anserini as the parent process)
+    _worker_retriever = retriever
+    retriever.index._searcher() # starts the JVM and opens the index up-front, rather than on the first batch
+
+
+def _worker_transform(queries: pd.DataFrame) -> Any:
+    """Retrieves for a batch of queries in a worker process, providing only the columns that the parent needs."""
+    res = _worker_retriever._transform(queries, verbose=False)
+    res = res[['_row'] + [c for c in res.columns if c not in queries.columns]]
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return res # (transferred by pickling instead)
+    # Arrow IPC stores each column (including the strings) in a few contiguous buffers, which are much cheaper to
+    # transfer between processes than pickled Python objects.
+    table = pa.Table.from_pandas(res, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def _decode(result: Any) -> pd.DataFrame:
+    if isinstance(result, pd.DataFrame):
+        return result
+    import pyarrow as pa
+    return pa.ipc.open_stream(result).read_all().to_pandas()
+
+
+class AnseriniParallelRetriever(pt.Transformer):
+    """Retrieves from an Anserini index using a pool of worker processes (see :meth:`AnseriniRetriever.parallel`).
+
+    Each worker runs its own JVM, which opens the index with Lucene's ``MMapDirectory`` (the default on 64-bit
+    platforms), so the index files are shared among the workers through the operating system's page cache. The queries
+    are split into batches, which are retrieved by the workers concurrently (including the assembly of their result
+    frames). The results are transferred back to this process as Arrow IPC streams when ``pyarrow`` is installed (and
+    by pickling otherwise), and are identical to (and in the same order as) those of the retriever.
+
+    The workers are started on first use and are kept until :meth:`close` is called (or the transformer is used as a
+    context manager). Caches and statistics of the index are not shared with the workers, apart from result caches
+    that are stored on disk.
+    """
+    def __init__(self,
+        retriever: 'pyterrier_anserini.AnseriniRetriever',
+        n_workers: int,
+        *,
+        batch_size: Optional[int] = None,
+    ):
+        """Initializes the transformer.
+
+        Args:
+            retriever: The retriever to run in the worker processes.
+            n_workers: The number of worker processes.
+            batch_size: The maximum number of queries sent to a worker at a time. Defaults to the ``batch_size`` of the
+                retriever. Smaller batches are used when there are too few queries to give every worker a batch.
+        """
+        self.retriever = retriever
+        self.n_workers = n_workers
+        self.batch_size = batch_size
+        self._pool = None
+
+    __repr__ = pta.transformer_repr
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # workers are spawned (rather than forked), since a process with a running JVM cannot be forked safely
+            self._pool = ProcessPoolExecutor(self.n_workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker, initargs=(self.retriever, configure['version']))
+        return self._pool
+
+    def transform(self, inp: pd.DataFrame) -> pd.DataFrame:
+        """Performs retrieval using the worker processes.
+
+        Args:
+            inp: The queries, as accepted by :meth:`AnseriniRetriever.transform`.
+
+        Returns:
+            The results, identical to those of :meth:`AnseriniRetriever.transform`.
+        """
+        with pta.validate.any(inp) as v:
+            v.query_frame(extra_columns=['query_lucene'], mode='query_lucene')
+            v.query_frame(extra_columns=['query_toks'], mode='query_toks')
+            v.query_frame(extra_columns=['query'], mode='query_text')
+        if len(inp) == 0:
+            return self.retriever(inp)
+
+        stats = self.retriever.index.stats
+        query_col = {'query_lucene': 'query_lucene', 'query_toks': 'query_toks', 'query_text': 'query'}[v.mode]
+        inp = inp.reset_index(drop=True)
+        # only the columns needed for retrieval are sent to the workers, along with the row of each query
+        queries = inp[['qid', query_col]].assign(_row=np.arange(len(inp)))
+        batch_size = min(self.batch_size or self.retriever.batch_size, math.ceil(len(inp) / self.n_workers))
+        batches = [queries.iloc[i:i+batch_size] for i in range(0, len(queries), batch_size)]
+
+        with _phase(stats, 'AnseriniParallelRetriever.workers'):
+            results = [_decode(r) for r in self._executor().map(_worker_transform, batches)]
+
+        with _phase(stats, 'AnseriniParallelRetriever.assemble'):
+            res = pd.concat(results, ignore_index=True)
+            rows = res.pop('_row').to_numpy()
+            out = inp[[c for c in inp.columns if c not in res.columns]].iloc[rows].reset_index(drop=True)
+            return out.assign(**{c: res[c].to_numpy() for c in res.columns})
+
+    def close(self):
+        """Shuts down the worker processes, if they are running.
+
+        They are started again automatically if this transformer is used again.
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
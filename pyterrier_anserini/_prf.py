@@ -0,0 +1,198 @@
+import abc
+from typing import Any, Dict, List, Union
+
+import numpy as np
+import pandas as pd
+import pyterrier as pt
+import pyterrier_alpha as pta
+
+from pyterrier_anserini import J
+from pyterrier_anserini._index import AnseriniIndex, _snapshot
+from pyterrier_anserini._java import _jni_lock, _shared_call, _thread_map
+
+
+@pt.java.required
+class _AnseriniPrf(pt.Transformer, abc.ABC):
+    """Base class for pseudo-relevance feedback transformers that expand queries using one of Anserini's rerankers.
+
+    Anserini's feedback rerankers estimate the expanded query from the document vectors of the feedback documents (all
+    within the JVM), record it in the ``feedbackTerms`` of the reranker context, and then search with it. Here, the
+    search is limited to a single result (since only the expanded query is needed), and the expanded query is
+    provided as ``query_toks``, which can be searched by a retriever from the same index.
+    """
+    def __init__(self, index: Union[AnseriniIndex, str], *, threads: int = 1, batch_size: int = 100):
+        self.index = index if isinstance(index, AnseriniIndex) else AnseriniIndex(index)
+        self.threads = threads
+        self.batch_size = batch_size
+
+    __repr__ = pta.transformer_repr
+
+    @abc.abstractmethod
+    def _reranker(self, analyzer: Any) -> Any:
+        """Creates the Anserini reranker that estimates the expanded queries."""
+
+    def _feedback_positions(self, count: int) -> np.ndarray:
+        """Provides the positions (among the ``count`` ranked documents of a query) of the feedback documents."""
+        return np.arange(min(count, self.fb_docs))
+
+    @_snapshot
+    def transform(self, inp: pd.DataFrame) -> pd.DataFrame:
+        """Expands the queries in ``inp`` using the documents retrieved for them.
+
+        Args:
+            inp: A result frame, containing (at least) the ``qid``, ``query``, ``docno`` and ``score`` columns.
+
+        Returns:
+            A query frame with one row per query, which includes the expanded query as ``query_toks``.
+        """
+        pta.validate.result_frame(inp, extra_columns=['query', 'score'])
+        searcher = self.index._searcher()
+        field_infos = J.FieldInfos.getMergedFieldInfos(self.index._reader())
+        field_info = field_infos.fieldInfo('contents')
+        if field_info is None or not field_info.hasVectors():
+            raise ValueError(f'{self!r} requires an index with document vectors (see store_docvectors of the indexer)')
+        analyzer = searcher.analyzer
+        reranker = self._reranker(analyzer)
+        # The reranker searches with the expanded query, but the results are not used, so only one is requested.
+        args = J.SearchArgs()
+        args.hits = 1
+        args.arbitraryScoreTieBreak = True
+        index_searcher = self.index._index_searcher('BM25')
+
+        inp = inp.reset_index(drop=True)
+        if 'rank' in inp.columns:
+            inp = inp.sort_values(['rank'], kind='stable')
+        else:
+            inp = inp.sort_values(['score'], ascending=False, kind='stable')
+        lucene_docids = self.index._lucene_docids(inp['docno'], threads=self.threads)
+        scores = inp['score'].to_numpy()
+        groups = inp.groupby('qid', sort=False).indices
+        queries = [(qid, inp['query'].iat[idxs[0]], idxs) for qid, idxs in groups.items()]
+
+        def _expand(batch: List[Any]) -> List[Dict[str, float]]:
+            # The reranker and searcher are shared by the threads, while the other objects are local to each thread
+            # (see _jni_lock). Reranking is the costly step, and proceeds concurrently.
+            result = []
+            for qid, query, idxs in batch:
+                idxs = idxs[lucene_docids[idxs] >= 0]
+                idxs = idxs[self._feedback_positions(len(idxs))]
+                score_docs = [J.ScoreDoc(d, s) for d, s in zip(lucene_docids[idxs].tolist(), scores[idxs].tolist())]
+                total_hits = J.TotalHits(len(score_docs), J.TotalHitsRelation.EQUAL_TO)
+                top_docs = J.TopDocs(total_hits, score_docs)
+                docs = J.ScoredDocs.fromTopDocs(top_docs, index_searcher)
+                query_tokens = J.AnalyzerUtils.analyze(analyzer, query)
+                context = J.RerankerContext(index_searcher, qid, None, None, query, query_tokens, None, args)
+                with _shared_call('Reranker.rerank', reranker):
+                    reranker.rerank(docs, context)
+                with _jni_lock:
+                    terms = {entry.getKey(): entry.getValue() for entry in context.feedbackTerms.entrySet().toArray()}
+                result.append(dict(sorted(terms.items(), key=lambda x: (-x[1], x[0]))))
+            return result
+
+        batches = [queries[i:i+self.batch_size] for i in range(0, len(queries), self.batch_size)]
+        query_toks = [toks for batch in _thread_map(_expand, batches, self.threads) for toks in batch]
+
+        first = np.array([idxs[0] for _, _, idxs in queries], dtype=np.int64)
+        query_columns = [c for c in pt.model.query_columns(inp) if c != 'query_toks']
+        result = inp[query_columns].iloc[first].reset_index(drop=True)
+        return result.assign(query_toks=query_toks)
+
+
+class AnseriniRM3(_AnseriniPrf):
+    """Expands queries using RM3 pseudo-relevance feedback, as implemented by Anserini.
+
+    The expanded queries (``query_toks``) are identical to those that Anserini searches when using RM3, so
+    ``index.bm25() >> index.rm3() >> index.bm25()`` reproduces Anserini's BM25+RM3. The index must contain document
+    vectors.
+    """
+    def __init__(self,
+        index: Union[AnseriniIndex, str],
+        *,
+        fb_docs: int = 10,
+        fb_terms: int = 10,
+        original_query_weight: float = 0.5,
+        filter_terms: bool = True,
+        threads: int = 1,
+        batch_size: int = 100,
+    ):
+        """Initializes the transformer.
+
+        Args:
+            index: The index to expand queries from. If a string, an AnseriniIndex object is created for the path.
+            fb_docs: The number of (top-ranked) feedback documents. Defaults to 10.
+            fb_terms: The number of feedback terms. Defaults to 10.
+            original_query_weight: The weight of the original query, when interpolated with the relevance model.
+                Defaults to 0.5.
+            filter_terms: Whether to exclude terms that are unlikely to be useful for expansion (e.g., numbers and very
+                frequent terms) from the relevance model. Defaults to True.
+            threads: The number of threads to use when expanding queries. Defaults to 1.
+            batch_size: The number of queries that each thread expands at a time. Defaults to 100.
+        """
+        super().__init__(index, threads=threads, batch_size=batch_size)
+        self.fb_docs = fb_docs
+        self.fb_terms = fb_terms
+        self.original_query_weight = original_query_weight
+        self.filter_terms = filter_terms
+
+    def _reranker(self, analyzer: Any) -> Any:
+        return J.Rm3Reranker(analyzer, None, 'contents', self.fb_terms, self.fb_docs, float(self.original_query_weight),
+            False, self.filter_terms)
+
+
+class AnseriniRocchio(_AnseriniPrf):
+    """Expands queries using Rocchio pseudo-relevance feedback, as implemented by Anserini.
+
+    The expanded queries (``query_toks``) are identical to those that Anserini searches when using Rocchio, so
+    ``index.bm25() >> index.rocchio() >> index.bm25()`` reproduces Anserini's BM25+Rocchio. The index must contain
+    document vectors.
+    """
+    def __init__(self,
+        index: Union[AnseriniIndex, str],
+        *,
+        fb_docs: int = 10,
+        fb_terms: int = 10,
+        alpha: float = 1.0,
+        beta: float = 0.75,
+        gamma: float = 0.0,
+        use_negative: bool = False,
+        bottom_fb_docs: int = 10,
+        bottom_fb_terms: int = 10,
+        threads: int = 1,
+        batch_size: int = 100,
+    ):
+        """Initializes the transformer.
+
+        Args:
+            index: The index to expand queries from. If a string, an AnseriniIndex object is created for the path.
+            fb_docs: The number of (top-ranked) feedback documents. Defaults to 10.
+            fb_terms: The number of feedback terms taken from the feedback documents. Defaults to 10.
+            alpha: The weight of the original query. Defaults to 1.0.
+            beta: The weight of the (top-ranked) feedback documents. Defaults to 0.75.
+            gamma: The weight of the (bottom-ranked) negative feedback documents. Defaults to 0.0.
+            use_negative: Whether to use the bottom-ranked documents of each query as negative feedback. Defaults to
+                False.
+            bottom_fb_docs: The number of (bottom-ranked) negative feedback documents. Defaults to 10.
+            bottom_fb_terms: The number of feedback terms taken from the negative feedback documents. Defaults to 10.
+            threads: The number of threads to use when expanding queries. Defaults to 1.
+            batch_size: The number of queries that each thread expands at a time. Defaults to 100.
+        """
+        super().__init__(index, threads=threads, batch_size=batch_size)
+        self.fb_docs = fb_docs
+        self.fb_terms = fb_terms
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.use_negative = use_negative
+        self.bottom_fb_docs = bottom_fb_docs
+        self.bottom_fb_terms = bottom_fb_terms
+
+    def _feedback_positions(self, count: int) -> np.ndarray:
+        top = np.arange(min(count, self.fb_docs))
+        if not self.use_negative:
+            return top
+        # Anserini takes the negative feedback documents from the end of the ranking
+        return np.union1d(top, np.arange(max(count - self.bottom_fb_docs, 0), count))
+
+    def _reranker(self, analyzer: Any) -> Any:
+        return J.RocchioReranker(analyzer, None, 'contents', self.fb_terms, self.fb_docs, self.bottom_fb_terms,
+            self.bottom_fb_docs, float(self.alpha), float(self.beta), float(self.gamma), False, self.use_negative)
@@ -1,12 +1,88 @@
-from typing import Dict, Union
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
 import pandas as pd
 import pyterrier as pt
 import pyterrier_alpha as pta
 
 from pyterrier_anserini import J
-from pyterrier_anserini._index import AnseriniIndex
+from pyterrier_anserini._index import AnseriniIndex, _snapshot
+from pyterrier_anserini._retriever import (
+    _bow_query_parser_factory,
+    _lucene_query_parser_factory,
+    _toks_query_factory,
+)
 from pyterrier_anserini._similarity import AnseriniSimilarity
+from pyterrier_anserini._stats import AnseriniStats, _phase
+
+
+def _query_factory(mode: str, analyzer, fields: Optional[Dict[str, float]], analyze_toks: bool) -> Tuple[Any, str]: # noqa: ANN001
+    """Provides the function that builds Lucene queries for the given validation ``mode``, and the query column."""
+    if mode == 'query_lucene':
+        return _lucene_query_parser_factory(analyzer, fields), 'query_lucene'
+    if mode == 'query_toks':
+        return _toks_query_factory(analyzer if analyze_toks else None, fields), 'query_toks'
+    return _bow_query_parser_factory(analyzer, fields), 'query'
+
+
+def _leaves(reader) -> Tuple[List[Any], np.ndarray]: # noqa: ANN001
+    """Provides the leaves (segments) of ``reader``, along with the docid of the first document of each."""
+    reader_leaves = reader.leaves()
+    leaves = [reader_leaves.get(i) for i in range(reader_leaves.size())]
+    return leaves, np.array([leaf.docBase for leaf in leaves], dtype=np.int64)
+
+
+def _traverse(weights: List[Any], leaves: List[Any], doc_bases: np.ndarray, lucene_docids: np.ndarray,
+        score: Sequence[bool], stats: Optional[AnseriniStats] = None, component: str = '') -> np.ndarray:
+    """Scores the documents identified by ``lucene_docids`` using each of the ``weights`` in a single pass.
+
+    Documents are visited in docid order, so each segment's scorers only ever need to advance forwards. The result has
+    a column for each weight, containing the scores of the documents (or 1 for matching documents when the weight's
+    entry of ``score`` is False). Documents that do not match (or are not in the index, i.e., have a docid of -1) are
+    given ``nan``. An estimate of the JVM calls made is counted for the ``component`` in ``stats`` (if provided).
+    """
+    result = np.full((len(lucene_docids), len(weights)), np.nan, dtype=np.float32)
+    leaf_idx = np.searchsorted(doc_bases, lucene_docids, side='right') - 1
+    current_leaf, scorers, iterators, positions = -1, [], [], []
+    calls = 0
+    for i in np.argsort(lucene_docids, kind='stable'):
+        if lucene_docids[i] < 0:
+            continue
+        if leaf_idx[i] != current_leaf:
+            current_leaf = leaf_idx[i]
+            leaf = leaves[current_leaf]
+            scorers = [weight.scorer(leaf) for weight in weights]
+            iterators = [scorer.iterator() if scorer is not None else None for scorer in scorers]
+            positions = [-1] * len(weights) # tracked here to avoid asking each iterator for its docID
+            calls += len(weights) + sum(iterator is not None for iterator in iterators)
+        target = int(lucene_docids[i] - doc_bases[current_leaf])
+        for j, iterator in enumerate(iterators):
+            if iterator is None:
+                continue
+            if positions[j] < target:
+                positions[j] = iterator.advance(target)
+                calls += 1
+            if positions[j] == target:
+                scorer = scorers[j]
+                result[i, j] = scorer.score() if score[j] else 1.
+    if stats is not None:
+        # (the score() calls are those of the matching documents)
+        stats.add(f'{component}.jvm_calls_est', calls + int(np.count_nonzero(~np.isnan(result[:, list(score)]))))
+    return result
+
+
+def _score_docs(weight, leaves: List[Any], doc_bases: np.ndarray, lucene_docids: np.ndarray, # noqa: ANN001
+        stats: Optional[AnseriniStats] = None, component: str = '') -> np.ndarray:
+    """Scores the documents identified by ``lucene_docids`` using ``weight`` (see :func:`_traverse`)."""
+    return _traverse([weight], leaves, doc_bases, lucene_docids, [True], stats, component)[:, 0]
+
+
+def _round_scores(scores: np.ndarray) -> np.ndarray:
+    """Rounds scores like IndexReaderUtils.computeQueryDocumentScore, and gives unmatched (nan) documents 0."""
+    # Documents were previously scored individually by IndexReaderUtils.computeQueryDocumentScore, which adds the
+    # (constant) score of 1 from a filter on the docno and then subtracts it again. This rounding is replicated so
+    # that the scores do not change.
+    return np.where(np.isnan(scores), 0., (scores.astype(np.float64) + 1.).astype(np.float32) - np.float32(1.))
 
 
 @pt.java.required
@@ -17,6 +93,8 @@ class AnseriniReRanker(pt.Transformer):
         similarity: Union[str, AnseriniSimilarity],
         similarity_args: Dict = None,
         *,
+        fields: Optional[Dict[str, float]] = None,
+        analyze_toks: bool = False,
         verbose: bool = False
     ):
         """Initializes the scorer.
@@ -25,20 +103,33 @@ class AnseriniReRanker(pt.Transformer):
             index: The index to score from. If a string, an AnseriniIndex object is created for the path.
             similarity: The similarity function to use for scoring.
             similarity_args: A dictionary of arguments to use for the similarity function.
+            fields: The fields to score, mapped to their weights (see :class:`~pyterrier_anserini.AnseriniRetriever`).
+                If None (default), the ``contents`` field is scored.
+            analyze_toks: Whether to analyze (e.g., stem) the tokens of ``query_toks`` inputs. Defaults to False.
             verbose: Whether to display a progress bar when scoring.
         """
         self.index = index if isinstance(index, AnseriniIndex) else AnseriniIndex(index)
         self.similarity = AnseriniSimilarity(similarity)
         self.similarity_args = similarity_args
+        self.fields = fields
+        self.analyze_toks = analyze_toks
         self.verbose = verbose
 
     __repr__ = pta.transformer_repr
 
+    @_snapshot
     def transform(self, inp: pd.DataFrame) -> pd.DataFrame:
         """Scores (i.e., re-ranks) documents from the index for each query in `inp`.
 
+        The documents of each query are scored together: the query is analyzed once, and its scorer is advanced over
+        the documents in index order.
+
+        Queries can be provided as text (``query``), in Lucene's query syntax (``query_lucene``), or as weighted
+        tokens (``query_toks``), which are parsed the same way as by :class:`~pyterrier_anserini.AnseriniRetriever`.
+
         Args:
-            inp: A DataFrame with a 'query' column containing queries and a 'docno' column containing document IDs.
+            inp: A DataFrame with a 'query', 'query_lucene' or 'query_toks' column containing queries and a 'docno'
+                column containing document IDs.
 
         Returns:
             A DataFrame containing the scored documents, with any columns included in `inp`, plus
@@ -49,24 +140,35 @@ class AnseriniReRanker(pt.Transformer):
             v.result_frame(['query_toks'], mode='query_toks')
             v.result_frame(['query'], mode='query_text')
 
-        sim = AnseriniSimilarity(self.similarity).to_lucene_sim(self.similarity_args)
-        index_reader = self.index._searcher().object.reader
+        stats = self.index.stats
+        searcher = self.index._searcher()
+        q_transform, query_col = _query_factory(v.mode, searcher.analyzer, self.fields, self.analyze_toks)
 
-        if v.mode == 'query_lucene':
-            raise NotImplementedError('query_lucene not yet supported for AnseriniReRanker')
-        elif v.mode == 'query_toks':
-            raise NotImplementedError('query_toks not yet supported for AnseriniReRanker')
-        elif v.mode == 'query_text':
-            it = zip(inp['docno'], inp['query'])
+        index_searcher = self.index._index_searcher(self.similarity, self.similarity_args)
+        reader = self.index._reader()
+        leaves, doc_bases = _leaves(reader)
+        lucene_docids = self.index._lucene_docids(inp['docno'], component='AnseriniReRanker')
 
+        groups = inp.groupby('qid', sort=False).indices
+        it = groups.values()
         if self.verbose:
-            it = pt.tqdm(it, unit='d', total=len(inp), desc='AnseriniScorer')
-
-        scores = [
-            J.IndexReaderUtils.computeQueryDocumentScoreWithSimilarity(index_reader, docno, query, sim)
-            for docno, query in it
-        ]
-        res = inp.assign(score=scores)
+            it = pt.tqdm(it, unit='q', desc='AnseriniScorer')
 
-        return pt.model.add_ranks(res)
+        scores = np.full(len(inp), np.nan, dtype=np.float32)
+        for idxs in it:
+            with _phase(stats, 'AnseriniReRanker.parse'):
+                query = q_transform(inp[query_col].iloc[idxs[0]])
+            with _phase(stats, 'AnseriniReRanker.score'):
+                query = index_searcher.rewrite(query)
+                weight = index_searcher.createWeight(query, J.ScoreMode.COMPLETE, 1.)
+                scores[idxs] = _score_docs(weight, leaves, doc_bases, lucene_docids[idxs], stats, 'AnseriniReRanker')
 
+        if stats is not None:
+            stats.add('AnseriniReRanker.queries', len(groups))
+            stats.add('AnseriniReRanker.docs', len(inp))
+            stats.add('AnseriniReRanker.hits_scored', int(np.count_nonzero(~np.isnan(scores))))
+            stats.add('AnseriniReRanker.jvm_calls_est', 2 * len(groups)) # rewrite and createWeight
+        with _phase(stats, 'AnseriniReRanker.assemble'):
+            scores = _round_scores(scores)
+            res = inp.assign(score=scores.astype(np.float64))
+            return pt.model.add_ranks(res)
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+# (docnos, scores, Lucene docids) of the results of a query, followed by the total hits when they are requested
+_Hits = Tuple[Any, ...]
+
+
+class AnseriniResultCache:
+    """A bounded, least-recently-used cache of the results of queries, optionally persisted to disk.
+
+    A cache can be provided to an :class:`~pyterrier_anserini.AnseriniIndex`, in which case it is used by all retrievers
+    of the index. Results are keyed by everything that affects them: the path and commit of the index, the
+    similarity function and its arguments, the query, the number of results and the options of the retriever. Since
+    each commit of an index has a unique id (which changes whenever the index is modified), results from earlier
+    versions of an index, or from an earlier index built at the same path, are never served.
+
+    When a ``path`` is provided, results are also stored in an SQLite database at that path, which persists across
+    processes (and can be shared among them). Results found on disk are added to the in-memory cache. The database is
+    not bounded by ``max_bytes``; use :meth:`clear` to empty it.
+    """
+    def __init__(self, max_bytes: int, path: Optional[str] = None):
+        """Initializes the cache.
+
+        Args:
+            max_bytes: The (approximate) maximum size of the results cached in memory, in bytes. When exceeded, the
+                least recently used entries are evicted.
+            path: The path of an SQLite database in which results are also stored. If None (default), results are only
+                cached in memory.
+        """
+        self.max_bytes = max_bytes
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.size_bytes = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # the entries are not pickled, so copies of the cache (e.g., in other processes) start empty (apart from the
+        # results on disk, which are shared)
+        return {'max_bytes': self.max_bytes, 'path': self.path}
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__init__(state['max_bytes'], state['path'])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return (f'AnseriniResultCache(max_bytes={self.max_bytes}, path={self.path!r}, size_bytes={self.size_bytes}, '
+                f'entries={len(self)}, hits={self.hits}, misses={self.misses})')
+
+    @staticmethod
+    def key(*parts: Any) -> bytes:
+        """Builds a key from (JSON-serializable) parts.
+
+        Numpy scalars (e.g., the weights of ``query_toks`` or of ``similarity_args``) are converted to the equivalent
+        Python values.
+
+        Args:
+            parts: The values that identify the results, e.g., the index, retrieval settings and query.
+
+        Returns:
+            A digest of the parts, which can be used with :meth:`get_many` and :meth:`put_many`.
+        """
+        return hashlib.sha256(json.dumps(parts, default=_json_default).encode()).digest()
+
+    def _connection(self) -> sqlite3.Connection:
+        # opened on first use (with the lock held), so that unused caches (and unpickled copies) do not open the file
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, timeout=60., check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, value TEXT NOT NULL)')
+            self._db.commit()
+        return self._db
+
+    def _insert(self, key: bytes, hits: _Hits):
+        size = sys.getsizeof(key) + sum(sys.getsizeof(docno) + 40 for docno in hits[0])
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size_bytes -= old[1]
+        self._entries[key] = (hits, size)
+        self.size_bytes += size
+        while self.size_bytes > self.max_bytes:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.size_bytes -= size
+
+    def get_many(self, keys: Iterable[bytes]) -> Dict[bytes, _Hits]:
+        """Looks up the results of several keys at once.
+
+        Args:
+            keys: The keys to look up (see :meth:`key`).
+
+        Returns:
+            The (docnos, scores, Lucene docids[, total hits]) of the keys that are in the cache. Keys that are not in
+            the cache are omitted.
+        """
+        result = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    result[key] = entry[0]
+                elif self.path is not None:
+                    row = self._connection().execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+                    if row is not None:
+                        result[key] = tuple(json.loads(row[0]))
+                        self._insert(key, result[key])
+                if key in result:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        return result
+
+    def put_many(self, items: Iterable[Tuple[bytes, _Hits]]):
+        """Adds the results of several keys to the cache, evicting entries if it becomes too large.
+
+        Args:
+            items: The (key, (docnos, scores, Lucene docids[, total hits])) pairs to add.
+        """
+        with self._lock:
+            rows = []
+            for key, (docnos, scores, lucene_docids, *rest) in items:
+                hits = ([str(d) for d in docnos], [float(s) for s in scores], [int(d) for d in lucene_docids],
+                    *(int(r) for r in rest))
+                self._insert(key, hits)
+                if self.path is not None:
+                    rows.append((key, json.dumps(hits)))
+            if rows:
+                db = self._connection()
+                db.executemany('INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)', rows)
+                db.commit()
+
+    def clear(self):
+        """Removes all entries from the cache (including those on disk). The hit and miss counters are retained."""
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+            if self.path is not None:
+                db = self._connection()
+                db.execute('DELETE FROM results')
+                db.commit()
+
+    def close(self):
+        """Closes the database of the cache, if it is open. It is re-opened automatically if the cache is used again."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
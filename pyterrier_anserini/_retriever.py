@@ -1,32 +1,247 @@
-from typing import Any, Dict, List, Optional, Union
+import asyncio
+import functools
+import itertools
+import math
+import os
+import weakref
+from typing import Any, Dict, Iterator, List, Literal, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 import pyterrier as pt
 import pyterrier_alpha as pta
 
+import pyterrier_anserini
 from pyterrier_anserini import J
-from pyterrier_anserini._index import AnseriniIndex
+from pyterrier_anserini._docnos import _DocnoLookup
+from pyterrier_anserini._index import AnseriniIndex, _snapshot
+from pyterrier_anserini._java import _jni_lock, _shared_call, _thread_map
+from pyterrier_anserini._result_cache import AnseriniResultCache, _Hits
 from pyterrier_anserini._similarity import AnseriniSimilarity
+from pyterrier_anserini._stats import AnseriniStats, _phase
 
 
-def _noop_query_parser(query: str) -> str:
-    return query
+def _field_weights(fields: Dict[str, float]) -> Any:
+    """Converts ``{field: weight}`` to the ``Map<String, Float>`` used by Anserini and Lucene."""
+    result = J.HashMap()
+    for field, weight in fields.items():
+        result.put(field, J.Float(float(weight)))
+    return result
 
 
-def _toks_query_parser_factory(parser): # noqa: ANN001
-    def wrapped(toks: Dict[str, float]) -> Any:
-        res = []
-        for tok, weight in toks.items():
-            res.append(f'{parser.escape(tok)}^{weight:f}')
-        query = ' '.join(res)
+def _bow_query_parser_factory(analyzer, fields: Optional[Dict[str, float]] = None): # noqa: ANN001
+    generator = J.BagOfWordsQueryGenerator()
+    if fields is not None:
+        # Like Anserini's -fields, each field's query is boosted by the field's weight
+        field_weights = _field_weights(fields)
+        def wrapped(query: str) -> Any:
+            return generator.buildQuery(field_weights, analyzer, query)
+        return wrapped
+    def wrapped(query: str) -> Any:
+        return generator.buildQuery('contents', analyzer, query)
+    return wrapped
+
+
+def _lucene_query_parser_factory(analyzer, fields: Optional[Dict[str, float]] = None): # noqa: ANN001
+    if fields is not None:
+        parser = J.MultiFieldQueryParser(list(fields), analyzer, _field_weights(fields))
+    else:
+        parser = J.QueryParser('contents', analyzer)
+    # wrapped (rather than returning parser.parse) so that the method is bound to the parser on each call (see
+    # _jni_lock)
+    def wrapped(query: str) -> Any:
         return parser.parse(query)
     return wrapped
 
 
+def _toks_query_factory(analyzer=None, fields: Optional[Dict[str, float]] = None): # noqa: ANN001
+    """Builds queries from ``{token: weight}`` dicts, with a boosted term clause for each token.
+
+    When an ``analyzer`` is provided, each token is analyzed first, and every resulting term receives the token's
+    weight. Otherwise, the tokens are matched verbatim. When ``fields`` are provided, the query of each field is
+    boosted by the field's weight (like the queries of :func:`_bow_query_parser_factory`).
+
+    Lucene limits the clauses of a query (over all its fields) with a limit that is global to the JVM. When a query
+    has more clauses than the limit, the limit is raised (under ``_jni_lock``) to fit it, and is not restored, since
+    queries built earlier may still be searched.
+    """
+    def field_query(field: str, terms: List[Tuple[str, float]]) -> Any:
+        builder = J.BooleanQueryBuilder()
+        for term, weight in terms:
+            clause = J.BoostQuery(J.TermQuery(J.Term(field, term)), float(weight))
+            builder.add(clause, J.BooleanClauseOccur.SHOULD)
+        return builder.build()
+
+    def wrapped(toks: Dict[str, float]) -> Any:
+        if analyzer is not None:
+            terms = [(term, weight) for tok, weight in toks.items() for term in J.AnalyzerUtils.analyze(analyzer, tok)]
+        else:
+            terms = list(toks.items())
+        clauses = len(terms) * (1 if fields is None else len(fields))
+        with _jni_lock:
+            if clauses > J.IndexSearcher.getMaxClauseCount():
+                J.IndexSearcher.setMaxClauseCount(clauses)
+        if fields is None:
+            return field_query('contents', terms)
+        builder = J.BooleanQueryBuilder()
+        for field, weight in fields.items():
+            # built before looking up builder.add, which field_query also looks up (see _jni_lock)
+            query = field_query(field, terms)
+            builder.add(J.BoostQuery(query, float(weight)), J.BooleanClauseOccur.SHOULD)
+        return builder.build()
+    return wrapped
+
+
+@functools.lru_cache(maxsize=None)
+def _search_constants() -> Tuple[Any, Any]:
+    """Provides the (sort, args) used by :func:`_search`, which are the same for every query."""
+    sort = J.Sort(J.SortField.FIELD_SCORE, J.SortField('id', J.SortFieldType.STRING_VAL))
+    return sort, J.SearchArgs()
+
+
+def _top_docs(index_searcher, query, k: int, total_hits_threshold: Optional[int] = None, # noqa: ANN001
+        stats: Optional[AnseriniStats] = None) -> Any:
+    """Searches ``index_searcher`` for the top ``k`` documents of ``query``, providing Lucene's ``TopDocs``.
+
+    When ``total_hits_threshold`` is None, every matching document is scored and ties are broken by docno (like
+    ``SimpleSearcher``). Otherwise, once more than ``total_hits_threshold`` documents have matched, Lucene skips the
+    documents that cannot enter the top ``k`` (using block-max WAND or MaxScore), so the total hits become a lower
+    bound, and ties are broken by Lucene docid instead.
+    """
+    if total_hits_threshold is None:
+        sort, _ = _search_constants()
+        with _shared_call('IndexSearcher.search', index_searcher):
+            top_docs = index_searcher.search(query, k, sort, True)
+    else:
+        manager = J.TopScoreDocCollector.createSharedManager(k, None, total_hits_threshold)
+        with _shared_call('IndexSearcher.search', index_searcher):
+            top_docs = index_searcher.search(query, manager)
+    if stats is not None:
+        stats.add('AnseriniRetriever.jvm_calls_est', 1 if total_hits_threshold is None else 2)
+    return top_docs
+
+
+def _total_hits(top_docs, stats: Optional[AnseriniStats] = None) -> int: # noqa: ANN001
+    """Provides the number of documents that matched (and were scored) in ``top_docs``, recording it in ``stats``."""
+    total_hits = top_docs.totalHits
+    value = total_hits.value
+    if stats is not None:
+        stats.add('AnseriniRetriever.hits_scored', value)
+        stats.add('AnseriniRetriever.jvm_calls_est', 2)
+    return value
+
+
+def _search(searcher, index_searcher, query, top_docs, stats: Optional[AnseriniStats] = None) -> Any: # noqa: ANN001
+    """Completes the search of ``query`` (whose ``top_docs`` are provided), like ``SimpleSearcher.search``.
+
+    Like ``SimpleSearcher``, the searcher's reranker cascade (which adjusts the scores of ties) is applied to the top
+    documents. The result is a ``ScoredDocs`` object.
+    """
+    _, args = _search_constants()
+    docs = J.ScoredDocs.fromTopDocs(top_docs, index_searcher)
+    context = J.RerankerContext(index_searcher, None, query, None, None, None, None, args)
+    cascade = searcher.cascade
+    with _shared_call('RerankerCascade.run', cascade):
+        docs = cascade.run(docs, context)
+    if stats is not None:
+        # fromTopDocs, RerankerContext, object, cascade and run
+        stats.add('AnseriniRetriever.jvm_calls_est', 5)
+    return docs
+
+
+def _adjust_score_ties(scores: np.ndarray) -> np.ndarray:
+    """Replicates the score adjustment of Anserini's ``ScoreTiesAdjusterReranker`` (the default reranker cascade).
+
+    Scores are rounded to 4 decimal places, then each score that is within 1e-4 of the (adjusted) score before it is
+    decreased by 1e-6 times its position in the run of ties. All arithmetic matches the Java implementation.
+    """
+    # Math.round rounds halves up (rather than to even)
+    scores = (np.floor(scores.astype(np.float64) * 10000. + .5) / 10000.).astype(np.float32)
+    threshold, epsilon = np.float32(1e-4), np.float32(1e-6)
+    # Runs of ties need to be adjusted sequentially, but they can only start where the rounded scores are tied
+    tied = np.nonzero(scores[:-1] - scores[1:] <= threshold)[0]
+    if len(tied) > 0:
+        dup = 0
+        prev = scores[tied[0]]
+        for i in range(tied[0] + 1, len(scores)):
+            score = scores[i]
+            if prev - score > threshold:
+                dup = 0
+            else:
+                dup += 1
+                score = score - epsilon * np.float32(dup)
+                scores[i] = score
+            prev = score
+    return scores
+
+
+def _search_docno_lookup(top_docs, docno_lookup: _DocnoLookup, stats: Optional[AnseriniStats] = None) -> _Hits: # noqa: ANN001
+    """Provides the results of a search (whose ``top_docs`` are provided), without loading them from the index.
+
+    This is equivalent to :func:`_search` with the default reranker cascade, but the docnos are provided by the
+    ``docno_lookup`` table and the adjustment of tied scores is replicated by :func:`_adjust_score_ties`. (The
+    arrays of ``ScoredDocs.fromTopDocs`` cannot be used instead, since it loads the stored document of each result.)
+    """
+    with _phase(stats, 'AnseriniRetriever.convert'):
+        score_docs = top_docs.scoreDocs
+        lucene_docids = np.array([sd.doc for sd in score_docs], dtype=np.int32)
+        scores = _adjust_score_ties(np.array([sd.score for sd in score_docs], dtype=np.float32))
+        docnos = docno_lookup.docnos(lucene_docids)
+    if stats is not None:
+        # scoreDocs, then the doc and score of each result
+        stats.add('AnseriniRetriever.jvm_calls_est', 1 + 2 * len(lucene_docids))
+    return docnos, scores, lucene_docids
+
+
+def _has_default_cascade(searcher) -> bool: # noqa: ANN001
+    """Checks whether the searcher's reranker cascade only consists of Anserini's ``ScoreTiesAdjusterReranker``."""
+    rerankers = searcher.cascade.rerankers
+    with _jni_lock:
+        return (rerankers.size() == 1
+            and rerankers.get(0).getClass().getName() == 'io.anserini.rerank.lib.ScoreTiesAdjusterReranker')
+
+
+def _scored_docs_hits(docs, include_fields: Optional[List[str]]) -> _Hits: # noqa: ANN001
+    """Provides the (docnos, scores, Lucene docids) of a ``ScoredDocs`` object.
+
+    The Lucene docids are only needed (and provided) when ``include_fields`` are requested.
+    """
+    # NB: pyjnius converts array fields on access, so avoid (the expensive) lucene_documents where possible
+    if hasattr(docs, 'docids'):
+        docnos = docs.docids
+        lucene_docids = docs.lucene_docids if include_fields else []
+    else:
+        # older versions of Anserini (ScoredDocuments) do not provide the docids directly
+        documents = docs.documents
+        with _jni_lock:
+            docnos = [d.get('id') for d in documents]
+        lucene_docids = docs.ids if include_fields else []
+    return docnos, docs.scores, lucene_docids
+
+
 @pt.java.required
 class AnseriniRetriever(pt.Transformer):
-    """Retrieves from an Anserini index."""
+    """Retrieves from an Anserini index.
+
+    ``fields`` searches several fields, like Anserini's ``-fields`` option: each field is scored separately, and the
+    scores are combined in a single pass, weighted by the fields' weights. The fields must have been indexed
+    separately (see the ``multi_field`` option of :class:`~pyterrier_anserini.AnseriniIndexer`).
+
+    When ``threads > 1``, the queries are searched concurrently (``batch_size`` queries at a time): the queries of each
+    batch are parsed, then searched on ``threads`` threads, which share the index's Lucene searcher. The results are
+    identical to (and in the same order as) those when ``threads=1``.
+
+    By default, every document that matches a query is scored. With ``early_termination``, once more than
+    ``total_hits_threshold`` documents have matched, Lucene skips the documents that cannot enter the top
+    ``num_results`` (using block-max WAND or MaxScore), which can be much faster for long queries and small
+    ``num_results``. The top results are unchanged, except that documents with tied scores are ordered by Lucene's
+    internal docid rather than by docno. Lucene never terminates before ``num_results`` documents have matched, so the
+    default threshold terminates as early as possible; larger thresholds count more of the total hits exactly, at the
+    cost of scoring more documents.
+
+    With ``include_total_hits``, Lucene counts the matching documents exactly up to 1,000 (or ``num_results``, if
+    larger), or up to the threshold with ``early_termination``; beyond that, the count is a lower bound.
+    """
     def __init__(self,
         index: Union[AnseriniIndex, str],
         similarity: Union[AnseriniSimilarity, str] = "BM25",
@@ -34,6 +249,13 @@ class AnseriniRetriever(pt.Transformer):
         *,
         num_results: int = 1000,
         include_fields: Optional[List[str]] = None,
+        fields: Optional[Dict[str, float]] = None,
+        analyze_toks: bool = False,
+        early_termination: bool = False,
+        total_hits_threshold: Optional[int] = None,
+        include_total_hits: bool = False,
+        threads: int = 1,
+        batch_size: int = 1000,
         verbose: bool = False,
     ):
         """Construct an AnseriniRetriever retrieve from pyserini.search.lucene.LuceneSearcher.
@@ -44,6 +266,14 @@ class AnseriniRetriever(pt.Transformer):
             similarity_args: model-specific arguments, like bm25.k1.
             num_results: number of results to return. Default is 1000.
             include_fields: a list of extra stored fields to include for each result. `None` indicates no extra fields.
+            fields: the fields to search, mapped to their weights. `None` (default) searches the ``contents`` field.
+            analyze_toks: analyze (e.g., stem) the tokens of ``query_toks`` inputs? Default is False.
+            early_termination: skip documents that cannot enter the top ``num_results``? Default is False.
+            total_hits_threshold: the matching documents counted exactly before terminating early. Default is None.
+            include_total_hits: include the number of documents that matched each query, as ``total_hits``? Default is
+                False.
+            threads: number of queries to search concurrently. Default is 1.
+            batch_size: number of queries to search together when using multiple threads. Default is 1000.
             verbose: show a progress bar during retrieval?
         """
         if not isinstance(index, AnseriniIndex):
@@ -53,10 +283,28 @@ class AnseriniRetriever(pt.Transformer):
         self.similarity_args = similarity_args
         self.num_results = num_results
         self.include_fields = include_fields
+        self.fields = fields
+        self.analyze_toks = analyze_toks
+        self.early_termination = early_termination
+        self.total_hits_threshold = total_hits_threshold
+        self.include_total_hits = include_total_hits
+        self.threads = threads
+        self.batch_size = batch_size
         self.verbose = verbose
+        self._async_searchers = weakref.WeakKeyDictionary() # (of asearch, by event loop)
 
     __repr__ = pta.transformer_repr
 
+    def __getstate__(self) -> Dict[str, Any]:
+        # (the threads of the async searchers are not shared with copies)
+        state = self.__dict__.copy()
+        state.pop('_async_searchers', None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._async_searchers = weakref.WeakKeyDictionary()
+
     def transform(self, inp: pd.DataFrame) -> pd.DataFrame:
         """Performs retrieval.
 
@@ -66,47 +314,330 @@ class AnseriniRetriever(pt.Transformer):
         Returns:
             pandas.DataFrame with columns=['qid', 'query', 'docno', 'rank', 'score']
         """
+        return self._transform(inp, verbose=self.verbose)
+
+    def transform_iter(self, inp: pt.model.IterDict) -> pt.model.IterDict:
+        """Performs retrieval lazily, over an iterable of query dicts (see :meth:`transform_chunks`).
+
+        Args:
+            inp: The queries, as an iterable of dicts (e.g., a generator).
+
+        Returns:
+            A generator over the result records, in the order of the queries.
+        """
+        for chunk in self.transform_chunks(inp):
+            yield from chunk.to_dict(orient='records')
+
+    def transform_chunks(self,
+        inp: Union[pd.DataFrame, pt.model.IterDict],
+        *,
+        batch_size: Optional[int] = None,
+    ) -> Iterator[pd.DataFrame]:
+        """Performs retrieval lazily, yielding the results of each batch of queries as a separate DataFrame.
+
+        Unlike :meth:`transform`, only the results of a single batch of queries are held in memory at a time, so
+        arbitrarily large query sets (e.g., from a generator) can be processed with bounded memory. Each batch is
+        searched as by :meth:`transform`, so ``threads`` apply within each batch.
+
+        Args:
+            inp: The queries, as a DataFrame or an iterable of dicts (e.g., a generator).
+            batch_size: The number of queries in each batch. Defaults to the ``batch_size`` of this retriever.
+
+        Returns:
+            A generator over the results of each batch, in the order of the queries. Each chunk has the columns of the
+            output of :meth:`transform`.
+        """
+        batch_size = batch_size or self.batch_size
+        if isinstance(inp, pd.DataFrame):
+            batches = (inp.iloc[i:i+batch_size] for i in range(0, len(inp), batch_size))
+        else:
+            it = iter(inp)
+            batches = (pd.DataFrame(b) for b in iter(lambda: list(itertools.islice(it, batch_size)), []))
+        total = len(inp) if hasattr(inp, '__len__') else None
+        with pt.tqdm(desc=str(self), total=total, unit='q', disable=not self.verbose) as progress:
+            for batch in batches:
+                yield self._transform(batch, verbose=False)
+                progress.update(len(batch))
+
+    def async_searcher(self,
+        *,
+        max_batch_size: int = 32,
+        max_wait: float = 0.002,
+        threads: int = 1,
+    ) -> 'pyterrier_anserini.AnseriniAsyncSearcher':
+        """Provides a searcher for ``asyncio`` code, which combines concurrent queries into batches.
+
+        See :class:`~pyterrier_anserini.AnseriniAsyncSearcher`.
+
+        Args:
+            max_batch_size: The maximum number of queries searched together. Defaults to 32.
+            max_wait: The maximum time (in seconds) that a query waits for others to join its batch. Defaults to 0.002.
+            threads: The number of batches that can be searched concurrently. Defaults to 1.
+
+        Returns:
+            The searcher. Use :meth:`~pyterrier_anserini.AnseriniAsyncSearcher.close` (or use it as an asynchronous
+            context manager) to stop its threads.
+        """
+        return pyterrier_anserini.AnseriniAsyncSearcher(self, max_batch_size=max_batch_size, max_wait=max_wait,
+            threads=threads)
+
+    async def asearch(self, query: str, qid: str = '1') -> pd.DataFrame:
+        """Searches for a single query without blocking the event loop, like an asynchronous :meth:`search`.
+
+        Concurrent calls are combined into batches by a searcher with the default settings of :meth:`async_searcher`.
+        This retriever keeps a searcher for each event loop, which is closed once the loop is closed (or by
+        :meth:`close`).
+
+        Args:
+            query: The query text.
+            qid: The query ID given to the results. Defaults to ``'1'``.
+
+        Returns:
+            The results of the query, identical to those of :meth:`search`.
+        """
+        loop = asyncio.get_running_loop()
+        for other in [other for other in self._async_searchers.keys() if other.is_closed()]:
+            self._async_searchers.pop(other).close()
+        if loop not in self._async_searchers:
+            self._async_searchers[loop] = self.async_searcher()
+        return await self._async_searchers[loop].search(query, qid)
+
+    def close(self):
+        """Closes the searchers used by :meth:`asearch`, stopping their threads.
+
+        Queries that are still waiting for their batch are not searched. New searchers are started automatically if
+        :meth:`asearch` is used again.
+        """
+        for searcher in list(self._async_searchers.values()):
+            searcher.close()
+        self._async_searchers.clear()
+
+    def parallel(self, n_workers: int, *, batch_size: Optional[int] = None) -> pt.Transformer:
+        """Provides a transformer that performs this retrieval using a pool of worker processes.
+
+        Each worker runs its own JVM over the (memory-mapped, so shared) index, which avoids contention over the GIL
+        and the JVM of this process. See :class:`~pyterrier_anserini.AnseriniParallelRetriever`.
+
+        Args:
+            n_workers: The number of worker processes.
+            batch_size: The maximum number of queries sent to a worker at a time. Defaults to the ``batch_size`` of this
+                retriever.
+
+        Returns:
+            A transformer whose results are identical to those of this retriever. Use :meth:`close` (or use it as a
+            context manager) to stop the worker processes.
+        """
+        return pyterrier_anserini.AnseriniParallelRetriever(self, n_workers, batch_size=batch_size)
+
+    def write_run(self,
+        inp: Union[pd.DataFrame, pt.model.IterDict],
+        path: str,
+        *,
+        format: Optional[Literal['trec', 'parquet']] = None,
+        run_name: str = 'pyterrier',
+        batch_size: Optional[int] = None,
+    ) -> int:
+        """Performs retrieval and writes the results to a run file, one batch of queries at a time.
+
+        The results are streamed to the file as they are produced (see :meth:`transform_chunks`), so the run can be
+        far larger than the available memory.
+
+        Args:
+            inp: The queries, as a DataFrame or an iterable of dicts (e.g., a generator).
+            path: The path of the run file. TREC run files are compressed if the path ends with ``.gz``.
+            format: The format of the run file: ``'trec'`` (``qid Q0 docno rank score run_name`` lines) or
+                ``'parquet'`` (the columns of the output of :meth:`transform`; requires ``pyarrow``). If None
+                (default), Parquet is used if the path ends with ``.parquet``, and TREC otherwise.
+            run_name: The run name written to TREC run files. Defaults to ``'pyterrier'``.
+            batch_size: The number of queries in each batch. Defaults to the ``batch_size`` of this retriever.
+
+        Returns:
+            The number of results written.
+        """
+        if format is None:
+            format = 'parquet' if path.endswith('.parquet') else 'trec'
+        chunks = self.transform_chunks(inp, batch_size=batch_size)
+        count = 0
+        if format == 'trec':
+            with pt.io.autoopen(path, 'wt') as fout:
+                for chunk in chunks:
+                    run = chunk[['qid', 'docno', 'rank', 'score']]
+                    run.insert(1, 'Q0', 'Q0')
+                    run.insert(5, 'run_name', run_name)
+                    run.to_csv(fout, sep=' ', header=False, index=False)
+                    count += len(chunk)
+        elif format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            writer = None
+            try:
+                for chunk in chunks:
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(path, table.schema)
+                    writer.write_table(table.cast(writer.schema))
+                    count += len(chunk)
+            finally:
+                if writer is not None:
+                    writer.close()
+            if writer is None: # no batches: write an empty run
+                pd.DataFrame(columns=['qid', 'docno', 'score', 'rank']).to_parquet(path, index=False)
+        else:
+            raise ValueError(f'unsupported run format: {format!r}')
+        return count
+
+    def _cache_keys(self, mode: str, queries: List[Any]) -> List[bytes]:
+        """Provides the keys of the queries in the index's result cache (see :class:`AnseriniResultCache`)."""
+        # each commit of the index has a unique id, so the results of earlier versions of the index (or of earlier
+        # indexes at the same path) are never matched
+        settings = [
+            os.path.abspath(self.index.path),
+            self.index._searcher().commit_ids,
+            AnseriniSimilarity(self.similarity).value,
+            sorted((self.similarity_args or {}).items()),
+            self.num_results,
+            self.include_fields,
+            sorted(self.fields.items()) if self.fields is not None else None,
+            self.analyze_toks,
+            mode,
+        ]
+        if self.early_termination or self.include_total_hits:
+            # (only included when used, so that the keys of existing entries are unchanged)
+            settings += [self.early_termination, self.total_hits_threshold, self.include_total_hits]
+        if mode == 'query_toks':
+            # the order of the tokens is kept, since it determines the order in which the scores are summed
+            queries = [[(tok, float(weight)) for tok, weight in q.items()] for q in queries]
+        return [AnseriniResultCache.key(*settings, q) for q in queries]
+
+    def _search(self, queries: List[Any], mode: str) -> Iterator[_Hits]:
+        """Searches for each of the ``queries`` (of the given validation ``mode``), in order."""
+        searcher = self.index._searcher()
+        docno_lookup = self.index._docno_lookup()
+        stats = self.index.stats
+        fields_per_hit = 3 if self.include_fields else 2
+        threshold = None
+        if self.early_termination:
+            # (Lucene raises lower thresholds to num_results)
+            threshold = max(self.total_hits_threshold or 0, self.num_results)
+
+        if mode == 'query_lucene':
+            q_transform = _lucene_query_parser_factory(searcher.analyzer, self.fields)
+        elif mode == 'query_toks':
+            q_transform = _toks_query_factory(searcher.analyzer if self.analyze_toks else None, self.fields)
+        elif mode == 'query_text':
+            q_transform = _bow_query_parser_factory(searcher.analyzer, self.fields)
+
+        index_searcher = self.index._index_searcher(self.similarity, self.similarity_args)
+        if docno_lookup is not None and _has_default_cascade(searcher):
+            # The index has a docno lookup table, so the results do not need to be loaded from the index
+            def search_query(query: Any) -> _Hits:
+                with _phase(stats, 'AnseriniRetriever.search'):
+                    top_docs = _top_docs(index_searcher, query, self.num_results, threshold, stats)
+                hits = _search_docno_lookup(top_docs, docno_lookup, stats)
+                return self._with_total_hits(hits, top_docs, stats)
+        else:
+            def search_query(query: Any) -> _Hits:
+                with _phase(stats, 'AnseriniRetriever.search'):
+                    top_docs = _top_docs(index_searcher, query, self.num_results, threshold, stats)
+                    docs = _search(searcher, index_searcher, query, top_docs, stats)
+                with _phase(stats, 'AnseriniRetriever.convert'):
+                    hits = _scored_docs_hits(docs, self.include_fields)
+                if stats is not None:
+                    stats.add('AnseriniRetriever.jvm_calls_est', fields_per_hit - 1) # (the arrays of the results)
+                return self._with_total_hits(hits, top_docs, stats)
+
+        def search_batch(batch: List[Any]) -> List[_Hits]:
+            # The queries are parsed first (by this thread), then searched by the threads. Searching only calls the
+            # methods of objects that all the threads share (e.g., the index searcher), so it runs concurrently.
+            queries = []
+            for q in batch:
+                with _phase(stats, 'AnseriniRetriever.parse'), _jni_lock:
+                    queries.append(q_transform(q))
+            size = math.ceil(len(queries) / max(self.threads, 1))
+            chunks = [queries[i:i+size] for i in range(0, len(queries), size)]
+            return [h for chunk in _thread_map(lambda c: [search_query(q) for q in c], chunks, self.threads)
+                for h in chunk]
+
+        batches = (queries[i:i+self.batch_size] for i in range(0, len(queries), self.batch_size))
+        return itertools.chain.from_iterable(search_batch(batch) for batch in batches)
+
+    def _with_total_hits(self, hits: _Hits, top_docs: Any, stats: Optional[AnseriniStats]) -> _Hits:
+        """Adds the total hits of ``top_docs`` to ``hits``, if they are included in the results."""
+        if self.include_total_hits:
+            return (*hits, _total_hits(top_docs, stats))
+        if stats is not None:
+            _total_hits(top_docs, stats)
+        return hits
+
+    @_snapshot
+    def _transform(self, inp: pd.DataFrame, *, verbose: bool) -> pd.DataFrame:
         with pta.validate.any(inp) as v:
             v.query_frame(extra_columns=['query_lucene'], mode='query_lucene')
             v.query_frame(extra_columns=['query_toks'], mode='query_toks')
             v.query_frame(extra_columns=['query'], mode='query_text')
 
-        sim = AnseriniSimilarity(self.similarity).to_lucene_sim(self.similarity_args)
-        searcher = self.index._searcher()
-        searcher.object.searcher.setSimilarity(sim)
-
-        if v.mode == 'query_lucene':
-            parser = J.QueryParser("contents", searcher.object.analyzer)
-            q_transform = parser.parse
-            it = enumerate(inp['query_lucene'])
-        elif v.mode == 'query_toks':
-            parser = J.QueryParser("contents", searcher.object.analyzer)
-            q_transform = _toks_query_parser_factory(parser)
-            it = enumerate(inp['query_toks'])
-        elif v.mode == 'query_text':
-            q_transform = _noop_query_parser
-            it = enumerate(inp['query'])
-
-        if self.verbose:
-            it = pt.tqdm(it, desc=str(self), total=len(inp), unit='d')
-
-        result_cols = ['_index', 'docno', 'score', 'rank']
+        query_col = {'query_lucene': 'query_lucene', 'query_toks': 'query_toks', 'query_text': 'query'}[v.mode]
+        queries = list(inp[query_col])
+        stats = self.index.stats
+        if stats is not None:
+            stats.add('AnseriniRetriever.queries', len(queries))
+
+        # Queries whose results are in the index's result cache are not searched
+        hits: List[Optional[_Hits]] = [None] * len(queries)
+        cache = self.index.result_cache
+        if cache is not None:
+            with _phase(stats, 'AnseriniRetriever.result_cache'):
+                keys = self._cache_keys(v.mode, queries)
+                cached = cache.get_many(keys)
+                hits = [cached.get(key) for key in keys]
+        missing = [i for i, h in enumerate(hits) if h is None]
+        if stats is not None and cache is not None:
+            stats.add('AnseriniRetriever.cache_hits', len(queries) - len(missing))
+        if missing:
+            it = self._search([queries[i] for i in missing], v.mode)
+            if verbose:
+                it = pt.tqdm(it, desc=str(self), total=len(missing), unit='q')
+            for i, h in zip(missing, it):
+                hits[i] = h
+            if cache is not None:
+                with _phase(stats, 'AnseriniRetriever.result_cache'):
+                    cache.put_many((keys[i], hits[i]) for i in missing)
+
+        with _phase(stats, 'AnseriniRetriever.assemble'):
+            return self._assemble(inp, hits)
+
+    def _assemble(self, inp: pd.DataFrame, hits: List[_Hits]) -> pd.DataFrame:
+        """Builds the result frame from the ``hits`` of each query of ``inp``."""
+        # Results are assembled column-wise: the per-query values are gathered into flat lists, then combined with
+        # the input frame at the end.
+        lengths, docnos, scores, lucene_docids, total_hits = [], [], [], [], []
+        for h in hits:
+            q_docnos, q_scores, q_lucene_docids = h[:3]
+            lengths.append(len(q_docnos))
+            docnos.extend(q_docnos)
+            scores.extend(q_scores)
+            lucene_docids.extend(q_lucene_docids)
+            if self.include_total_hits:
+                total_hits.append(h[3])
+
+        lengths = np.array(lengths, dtype=np.int64)
+        offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        result = {
+            'docno': np.array(docnos, dtype=object),
+            'score': np.array(scores, dtype=np.float64),
+            'rank': np.arange(len(docnos), dtype=np.int64) - offsets,
+        }
         if self.include_fields:
-            result_cols += self.include_fields
-        result = pta.DataFrameBuilder(result_cols)
-        for i, query in it:
-            hits = searcher.search(q_transform(query), k=self.num_results)
-            records = {
-                '_index': i,
-                'docno': [h.docid for h in hits],
-                'score': [h.score for h in hits],
-                'rank': np.arange(len(hits)),
-            }
-            if self.include_fields:
-                records.update({
-                    f: [h.lucene_document.get(f) for h in hits]
-                    for f in self.include_fields
-                })
-            result.extend(records)
-
-        return result.to_df(merge_on_index=inp)
+            # The fields of each distinct document are loaded together (in index order, and through the text cache)
+            inverse, distinct = pd.factorize(result['docno'])
+            first = np.unique(inverse, return_index=True)[1]
+            fields = self.index._load_text(distinct.tolist(), self.include_fields,
+                lucene_docids=np.array(lucene_docids, dtype=np.int32)[first], component='AnseriniRetriever')
+            for f in self.include_fields:
+                result[f] = fields[f][inverse]
+        if self.include_total_hits:
+            result['total_hits'] = np.repeat(np.array(total_hits, dtype=np.int64), lengths)
+        input_idx = np.repeat(np.arange(len(lengths)), lengths)
+        inp = inp.reset_index(drop=True)
+        res = inp[[c for c in inp.columns if c not in result]].iloc[input_idx].reset_index(drop=True)
+        return res.assign(**result)
@@ -32,9 +32,9 @@ class AnseriniSimilarity(Enum):
             args.update(sim_args)
 
         if self == AnseriniSimilarity.bm25:
-            return J.BM25Similarity(args['bm25.k1'], args['bm25.b'])
+            return J.BM25Similarity(float(args['bm25.k1']), float(args['bm25.b']))
         elif self == AnseriniSimilarity.qld:
-            return J.LMDirichletSimilarity(args['qld.mu'])
+            return J.LMDirichletSimilarity(float(args['qld.mu']))
         elif self == AnseriniSimilarity.tfidf:
             return J.ClassicSimilarity()
         if self == AnseriniSimilarity.impact:
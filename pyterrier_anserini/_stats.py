@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, Literal, Optional
+
+import pandas as pd
+
+_logger = logging.getLogger('pyterrier_anserini.stats')
+
+# the (re-usable) context manager used in place of a timer when statistics are not being recorded
+_DISABLED = nullcontext()
+
+
+class AnseriniStats:
+    """Records where the time of the transformers of an index goes.
+
+    Statistics are only recorded when an instance is provided to an :class:`~pyterrier_anserini.AnseriniIndex` (as
+    ``stats``), in which case the retrievers, re-rankers and text loaders of the index (and the index itself) record:
+
+    - The wall time of each phase of their work, named ``<component>.<phase>`` (e.g., ``AnseriniRetriever.parse``
+      for building Lucene queries, ``AnseriniRetriever.search`` for searching with Lucene, ``AnseriniRetriever.convert``
+      for copying results out of the JVM, and ``AnseriniRetriever.assemble`` for building the result frame). Phases
+      can be nested, e.g., ``AnseriniRetriever.read_text`` (reading ``include_fields``) is part of
+      ``AnseriniRetriever.assemble``.
+    - Counters, named ``<component>.<counter>``: ``jvm_calls_est`` (an estimate of the calls made into the JVM,
+      excluding those made while building queries, which is derived from the work done rather than measured),
+      ``hits_scored`` (the documents scored by Lucene; for retrievers, Lucene may stop counting matching documents
+      beyond 1,000 of them), ``queries``, ``docs``, ``docs_read`` (the documents whose text was read from the index
+      rather than the text cache), ``cache_hits``, and ``AnseriniIndex.searcher_opens``.
+
+    Each record is also passed to the ``callback`` (if any) and logged (at the DEBUG level) to the
+    ``pyterrier_anserini.stats`` logger. When an index has no ``stats``, nothing is recorded, at a negligible cost.
+    """
+    def __init__(self, callback: Optional[Callable[[Literal['time', 'count'], str, float], None]] = None):
+        """Initializes the statistics.
+
+        Args:
+            callback: A function called with each record, as ``callback(kind, name, value)``: ``kind`` is ``'time'``
+                (with the duration of a phase in seconds) or ``'count'`` (with the increment of a counter).
+        """
+        self.callback = callback
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # copies of the statistics (e.g., in other processes) start empty, and without the (possibly unpicklable)
+        # callback
+        return {}
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__init__()
+
+    def __repr__(self) -> str:
+        return f'AnseriniStats(seconds={dict(self.seconds)}, counters={dict(self.counters)})'
+
+    def time(self, name: str) -> ContextManager:
+        """Provides a context manager that records the wall time of its body as the phase ``name``.
+
+        Args:
+            name: The name of the phase, e.g., ``'AnseriniRetriever.search'``.
+
+        Returns:
+            The context manager.
+        """
+        return _Timer(self, name)
+
+    def add(self, name: str, value: int = 1):
+        """Increments the counter ``name`` by ``value``.
+
+        Args:
+            name: The name of the counter, e.g., ``'AnseriniRetriever.jvm_calls_est'``.
+            value: The increment. Defaults to 1.
+        """
+        with self._lock:
+            self.counters[name] += value
+        if self.callback is not None:
+            self.callback('count', name, value)
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug('%s += %d', name, value)
+
+    def _record_time(self, name: str, seconds: float):
+        with self._lock:
+            self.seconds[name] += seconds
+            self.calls[name] += 1
+        if self.callback is not None:
+            self.callback('time', name, seconds)
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug('%s took %.3fms', name, seconds * 1000)
+
+    def summary(self) -> pd.DataFrame:
+        """Summarizes the time spent in each phase.
+
+        Returns:
+            A DataFrame with a row for each phase (``name``), with the number of times that it ran (``calls``), the
+            total time spent in it (``total_ms``) and its mean duration (``mean_ms``), slowest first.
+        """
+        with self._lock:
+            names = list(self.seconds)
+            result = pd.DataFrame({
+                'name': names,
+                'calls': [self.calls[n] for n in names],
+                'total_ms': [self.seconds[n] * 1000 for n in names],
+            })
+        result['mean_ms'] = result['total_ms'] / result['calls']
+        return result.sort_values('total_ms', ascending=False, ignore_index=True)
+
+    def reset(self):
+        """Clears all the recorded statistics."""
+        with self._lock:
+            self.seconds.clear()
+            self.calls.clear()
+            self.counters.clear()
+
+
+class _Timer:
+    # a class (rather than a generator-based context manager), since timers are created for each query
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats: AnseriniStats, name: str):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+        self.stats._record_time(self.name, time.perf_counter() - self.start)
+
+
+def _phase(stats: Optional[AnseriniStats], name: str) -> ContextManager:
+    """Times the phase ``name`` if statistics are being recorded (i.e., ``stats`` is not None)."""
+    return _DISABLED if stats is None else _Timer(stats, name)
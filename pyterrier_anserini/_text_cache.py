@@ -0,0 +1,87 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class AnseriniTextCache:
+    """A bounded, least-recently-used cache of the stored text fields of documents, keyed by (docno, field).
+
+    A cache can be provided to an :class:`~pyterrier_anserini.AnseriniIndex`, in which case it is used by all text
+    loaders and retrievers (with ``include_fields``) of the index. The cache is cleared automatically when the index
+    changes on disk.
+    """
+    def __init__(self, max_bytes: int):
+        """Initializes the cache.
+
+        Args:
+            max_bytes: The (approximate) maximum size of the cached text, in bytes. When exceeded, the least recently
+                used entries are evicted.
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size_bytes = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, int]:
+        # the entries are not pickled, so copies of the cache (e.g., in other processes) start empty
+        return {'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state: Dict[str, int]):
+        self.__init__(state['max_bytes'])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return (f'AnseriniTextCache(max_bytes={self.max_bytes}, size_bytes={self.size_bytes}, entries={len(self)}, '
+                f'hits={self.hits}, misses={self.misses})')
+
+    def get_many(self, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Optional[str]]:
+        """Looks up several (docno, field) keys at once.
+
+        Args:
+            keys: The keys to look up.
+
+        Returns:
+            The values of the keys that are in the cache. Keys that are not in the cache are omitted.
+        """
+        result = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    result[key] = entry[0]
+                    self.hits += 1
+        return result
+
+    def put_many(self, items: Iterable[Tuple[Tuple[str, str], Optional[str]]]):
+        """Adds several (docno, field) keys and their values to the cache, evicting entries if it becomes too large.
+
+        Args:
+            items: The (key, value) pairs to add.
+        """
+        with self._lock:
+            for key, value in items:
+                size = sys.getsizeof(value) + sys.getsizeof(key[0])
+                if size > self.max_bytes:
+                    continue
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self.size_bytes -= old[1]
+                self._entries[key] = (value, size)
+                self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, (_, size) = self._entries.popitem(last=False)
+                self.size_bytes -= size
+
+    def clear(self):
+        """Removes all entries from the cache. The hit and miss counters are retained."""
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
@@ -4,8 +4,9 @@ import pandas as pd
 import pyterrier as pt
 import pyterrier_alpha as pta
 
-import pyterrier_anserini
 from pyterrier_anserini import AnseriniIndex
+from pyterrier_anserini._index import _snapshot
+from pyterrier_anserini._stats import _phase
 
 
 @pt.java.required
@@ -15,41 +16,41 @@ class AnseriniTextLoader(pt.Transformer):
                  index: Union[AnseriniIndex, str],
                  fields: List[str],
                  *,
+                 threads: int = 1,
                  verbose: bool = False):
         """Initializes the text loader.
 
         Args:
             index: The index to provide text from. If a string, an AnseriniIndex object is created for the path.
             fields: The fields to load.
+            threads: The number of threads to use when reading the fields from the index. Defaults to 1.
             verbose: Whether to display a progress bar when providing text.
         """
         self.index = index if isinstance(index, AnseriniIndex) else AnseriniIndex(index)
         self.fields = fields
+        self.threads = threads
         self.verbose = verbose
 
     __repr__ = pta.transformer_repr
 
+    @_snapshot
     def transform(self, inp: pd.DataFrame) -> pd.DataFrame:
         """Provides text from the index for each document in `inp`.
 
+        Each distinct docno is only loaded once, regardless of how many rows (e.g., queries) it appears in. Text is
+        served from the index's ``text_cache``, if it has one.
+
         Args:
             inp: A DataFrame with a 'docno' column containing document IDs.
         """
         pta.validate.columns(inp, includes=['docno'])
+        stats = self.index.stats
 
-        utils = pyterrier_anserini.J.IndexReaderUtils
-        index_reader = self.index._searcher().object.reader
-
-        results = pta.DataFrameBuilder(['_index'] + self.fields)
-
-        it = enumerate(inp['docno'])
-        if self.verbose:
-            it = pt.tqdm(it, unit='d', total=len(inp), desc='AnseriniTextLoader')
-
-        for i, docno in it:
-            doc = utils.document(index_reader, docno)
-            res = {f: doc.get(f) for f in self.fields}
-            res['_index'] = i
-            results.extend(res)
+        inverse, docnos = pd.factorize(inp['docno'])
+        fields = self.index._load_text(docnos.tolist(), self.fields, threads=self.threads, verbose=self.verbose,
+            component='AnseriniTextLoader')
 
-        return results.to_df(merge_on_index=inp)
+        if stats is not None:
+            stats.add('AnseriniTextLoader.docs', len(inp))
+        with _phase(stats, 'AnseriniTextLoader.assemble'):
+            return inp.reset_index(drop=True).assign(**{f: values[inverse] for f, values in fields.items()})
@@ -0,0 +1,70 @@
+import json
+import os
+import shutil
+import tempfile
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_DIR = 'pt_vocab'
+
+
+class _VocabStats:
+    """Memory-mapped statistics of every term in a field of an index.
+
+    The table consists of the (UTF-8 encoded) terms of the field in sorted order, along with their document frequencies
+    and collection frequencies. Like :class:`~pyterrier_anserini._docnos._DocnoLookup`, it records the commit ids of the
+    index that it was built from, and only applies to that commit.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as fin:
+            meta = json.load(fin)
+        self.field = meta['field']
+        self.commit_ids = tuple(meta.get('commit_ids', ()))
+        self.terms = np.load(os.path.join(path, 'terms.npy'), mmap_mode='r')
+        self.df = np.load(os.path.join(path, 'df.npy'), mmap_mode='r')
+        self.cf = np.load(os.path.join(path, 'cf.npy'), mmap_mode='r')
+
+    @staticmethod
+    def load(index_path: str, field: str, commit_ids: Sequence[str]) -> Optional['_VocabStats']:
+        """Loads the table of ``field`` of the index at ``index_path``, if it has one that matches ``commit_ids``."""
+        path = os.path.join(index_path, _DIR, field)
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            return None
+        stats = _VocabStats(path)
+        if stats.commit_ids != tuple(commit_ids):
+            return None
+        return stats
+
+    @staticmethod
+    def write(index_path: str, field: str, vocab: List[Tuple[str, int, int]], commit_ids: Sequence[str]):
+        """Writes the table of ``field`` of an index, given the (term, df, cf) of each term in Lucene's term order."""
+        # Lucene orders terms by their UTF-8 bytes, so the encoded terms are already sorted for binary searches
+        terms = np.array([term.encode() for term, _, _ in vocab], dtype=bytes)
+        os.makedirs(os.path.join(index_path, _DIR), exist_ok=True)
+        # (written like the docno lookup table; see _DocnoLookup.write)
+        tmp_path = tempfile.mkdtemp(prefix=f'.{field}-', dir=os.path.join(index_path, _DIR))
+        try:
+            np.save(os.path.join(tmp_path, 'terms.npy'), terms)
+            np.save(os.path.join(tmp_path, 'df.npy'), np.array([df for _, df, _ in vocab], dtype=np.int64))
+            np.save(os.path.join(tmp_path, 'cf.npy'), np.array([cf for _, _, cf in vocab], dtype=np.int64))
+            with open(os.path.join(tmp_path, 'meta.json'), 'wt') as fout:
+                json.dump({'field': field, 'commit_ids': list(commit_ids), 'num_terms': len(vocab)}, fout)
+            os.chmod(tmp_path, 0o755) # mkdtemp only grants access to the current user
+            path = os.path.join(index_path, _DIR, field)
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.rename(tmp_path, path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    def term_stats(self, terms: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Provides the (df, cf) of the given terms (0 for terms that are not in the field)."""
+        if len(terms) == 0 or len(self.terms) == 0:
+            return np.zeros(len(terms), dtype=np.int64), np.zeros(len(terms), dtype=np.int64)
+        keys = np.char.encode(np.asarray(terms, dtype=str), 'utf-8')
+        idx = np.searchsorted(self.terms, keys).clip(max=len(self.terms) - 1)
+        found = (self.terms[idx] == keys) & (np.char.str_len(keys) <= self.terms.itemsize)
+        return np.where(found, self.df[idx], 0), np.where(found, self.cf[idx], 0)
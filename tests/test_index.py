@@ -1,11 +1,42 @@
+import os
 import unittest
+from unittest import mock
 
 import pyterrier as pt
 import pyterrier_alpha as pta
 
+import pyterrier_anserini
+
 
 class TestAnseriniIndex(unittest.TestCase):
     def test_load_from_anserini_url(self):
         # This tests a few things: that the anserini: parser is working, that the metadata adapter works, etc.
         index = pta.Artifact.from_url('anserini:beir-v1.0.0-scifact.flat')
         self.assertEqual(5183, index.num_docs())
+
+    def test_searcher_is_shared(self):
+        index = pyterrier_anserini.AnseriniIndex.from_url(os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures/vaswani.tar.lz4"))
+        with index:
+            searcher = index._searcher()
+            index.bm25().search("chemical reactions")
+            index.qld().search("chemical reactions")
+            (index.tfidf() >> index.reranker('BM25') >> index.text_loader()).search("chemical reactions")
+            self.assertIs(searcher, index._searcher())
+        self.assertIsNone(index._searcher_obj)
+        self.assertEqual(11429, index.num_docs()) # re-opened on demand
+        index.close()
+
+    def test_index_checked_once_per_transform(self):
+        index = pyterrier_anserini.AnseriniIndex.from_url(os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures/vaswani.tar.lz4"))
+        with index:
+            index.bm25().search("chemical reactions")
+            segments_generation = pyterrier_anserini._index._segments_generation
+            with mock.patch('pyterrier_anserini._index._segments_generation', side_effect=segments_generation) as m, \
+                 mock.patch('builtins.open', side_effect=open) as m_open:
+                res = index.bm25(include_fields=['contents']).search("chemical reactions")
+                self.assertEqual(m.call_count, 1)
+                index.reranker('QLD')(res)
+                index.text_loader(['contents'])(res)
+                self.assertEqual(m.call_count, 3)
+                # (the shards of the index are only read once)
+                self.assertFalse(any(str(c.args[0]).endswith('pt_meta.json') for c in m_open.call_args_list))
@@ -1,6 +1,10 @@
+import shutil
 import tempfile
 import unittest
+from unittest import mock
 
+import numpy as np
+import pandas as pd
 import pyterrier as pt
 
 import pyterrier_anserini
@@ -16,3 +20,318 @@ class TestAnseriniIndexer(unittest.TestCase):
             indexer.index(ds.get_corpus_iter())
             self.assertTrue(index.built())
             # Anything else worth asserting?
+
+    def test_index_threads(self):
+        docs = [
+            {'docno': f'd{i}', 'text': text}
+            for i, text in enumerate(['the cat sat on the mat', 'a dog chased the cat', 'dogs and cats',
+                                       'the mat was red', 'a red cat', 'nothing to see here', 'cat cat cat'])
+        ]
+        topics = pd.DataFrame([{'qid': '1', 'query': 'cat'}, {'qid': '2', 'query': 'red mat'}])
+        results = []
+        with tempfile.TemporaryDirectory() as d:
+            for threads in [1, 3]:
+                index = pyterrier_anserini.AnseriniIndex(f'{d}/index{threads}')
+                index.indexer(threads=threads, batch_size=2, memory_buffer_mb=16).index(docs)
+                self.assertEqual(index.num_docs(), len(docs))
+                results.append(index.bm25()(topics))
+                index.close()
+        pd.testing.assert_frame_equal(results[0], results[1])
+
+    @unittest.skipUnless(pyterrier_anserini.check_version('0.36.0'), "requires pyserini>=0.36.0")
+    def test_index_toks(self):
+        docs = [
+            {'docno': 'd0', 'toks': {'cat': 3, 'Mat': 1}},
+            {'docno': 'd1', 'toks': {'dog': 2., 'cat': 1.5}},
+            {'docno': 'd2', 'toks': {'mat': np.float32(4.2)}},
+        ]
+        with tempfile.TemporaryDirectory() as d:
+            index = pyterrier_anserini.AnseriniIndex(f'{d}/index')
+            index.indexer(batch_size=2).index(docs)
+            self.assertEqual(index.num_docs(), 3)
+            res = index.impact()(pd.DataFrame([{'qid': '1', 'query_toks': {'cat': 2., 'mat': 1.}}]))
+            self.assertEqual(list(res['docno']), ['d0', 'd2', 'd1'])
+            self.assertEqual(list(res['score']), [6., 4., 2.])
+            index.close()
+
+    def test_index_append(self):
+        with tempfile.TemporaryDirectory() as d:
+            index = pyterrier_anserini.AnseriniIndex(f'{d}/index')
+            index.indexer().index([
+                {'docno': 'd0', 'text': 'the cat sat on the mat'},
+                {'docno': 'd1', 'text': 'a dog chased the cat'},
+            ] + [{'docno': f'other{i}', 'text': 'something else'} for i in range(20)])
+            index.indexer(append=True, batch_size=1).index([
+                {'docno': 'd1', 'text': 'a dog chased the mouse'}, # replaces d1
+                {'docno': 'd2', 'text': 'cat food'},
+            ])
+            self.assertEqual(index.num_docs(), 23)
+            # within a batch, the last copy of a docno is kept
+            index.indexer(append=True).index([
+                {'docno': 'd3', 'text': 'first copy'},
+                {'docno': 'd3', 'text': 'last copy'},
+            ])
+            self.assertEqual(index.num_docs(), 24)
+            self.assertEqual(index.text_loader(['contents'])(pd.DataFrame([{'docno': 'd3'}]))['contents'][0], 'last copy')
+            index.delete(['d3'])
+            index.delete([])
+            res = index.bm25()(pd.DataFrame([{'qid': '1', 'query': 'cat'}, {'qid': '2', 'query': 'mouse'}]))
+            self.assertEqual(sorted(res[res['qid'] == '1']['docno']), ['d0', 'd2'])
+            self.assertEqual(list(res[res['qid'] == '2']['docno']), ['d1'])
+
+            index.delete(['d2', 'missing'])
+            self.assertEqual(index.num_docs(), 22)
+            self.assertGreater(index._searcher().object.reader.leaves().size(), 1)
+            index.optimize()
+            self.assertEqual(index._searcher().object.reader.leaves().size(), 1)
+            self.assertEqual(index.num_docs(), 22)
+            res = index.bm25()(pd.DataFrame([{'qid': '1', 'query': 'cat'}]))
+            self.assertEqual(list(res['docno']), ['d0'])
+            index.close()
+
+    def test_index_shards(self):
+        docs = [{'docno': f'd{i}', 'text': f'document {i} about {["cats", "dogs", "red mats"][i % 3]}'}
+                for i in range(30)]
+        topics = pd.DataFrame([{'qid': '1', 'query': 'cats'}, {'qid': '2', 'query': 'red mats document'}])
+        with tempfile.TemporaryDirectory() as d:
+            single = pyterrier_anserini.AnseriniIndex(f'{d}/single')
+            single.indexer().index(docs)
+            sharded = pyterrier_anserini.AnseriniIndex(f'{d}/sharded')
+            # the shards are built by worker processes, rather than by this one
+            with mock.patch.object(pyterrier_anserini.AnseriniIndexer, '_simple_indexer', side_effect=AssertionError):
+                sharded.indexer(shards=3).index(docs)
+            self.assertEqual(len(sharded._shard_paths()), 3)
+            self.assertEqual(sharded.num_docs(), len(docs))
+            # no searcher over a single shard is exposed
+            self.assertIsNone(sharded._searcher().object)
+            self.assertEqual(sharded._searcher().reader.numDocs(), len(docs))
+
+            # collection statistics span all shards, so the results match those of a single index
+            expected = single.bm25()(topics)
+            pd.testing.assert_frame_equal(sharded.bm25()(topics), expected)
+            pd.testing.assert_frame_equal(sharded.bm25(threads=2)(topics), expected)
+            pd.testing.assert_frame_equal(sharded.bm25(include_fields=['contents'])(topics),
+                                          single.bm25(include_fields=['contents'])(topics))
+            pd.testing.assert_frame_equal(sharded.reranker('BM25')(expected), single.reranker('BM25')(expected))
+            pd.testing.assert_frame_equal(sharded.text_loader()(expected), single.text_loader()(expected))
+
+            sharded.indexer(append=True).index([{'docno': 'd0', 'text': 'a mouse'}])
+            sharded.delete(['d1'])
+            self.assertEqual(sharded.num_docs(), len(docs) - 1)
+            res = sharded.bm25()(pd.DataFrame([{'qid': '1', 'query': 'mouse'}]))
+            self.assertEqual(list(res['docno']), ['d0'])
+
+            # the shards of an index cannot be changed when appending
+            with self.assertRaises(ValueError):
+                sharded.indexer(append=True, shards=2).index([{'docno': 'd0', 'text': 'a mouse'}])
+            with self.assertRaises(ValueError):
+                single.indexer(append=True, shards=3).index([{'docno': 'd0', 'text': 'a mouse'}])
+            single.close()
+            sharded.close()
+
+    def test_shards_rolled_back(self):
+        # when a shard fails, none of the shards is committed
+        docs = [{'docno': f'd{i}', 'toks': {'document': 1, f'term{i}': 2}} for i in range(10)]
+        failing = docs[:5] + [{'docno': 'd10'}] + docs[5:] # (which has no toks, so it fails in its shard's worker)
+        with tempfile.TemporaryDirectory() as d:
+            index = pyterrier_anserini.AnseriniIndex(f'{d}/index')
+            with self.assertRaises(KeyError):
+                index.indexer(shards=2, batch_size=2).index(failing)
+            self.assertFalse(index.built())
+            index.indexer(shards=2).index(docs)
+            with self.assertRaises(KeyError):
+                index.indexer(append=True, batch_size=2).index([{'docno': 'd0', 'toks': {'mouse': 1}}] + failing)
+            self.assertEqual(index.num_docs(), len(docs))
+            self.assertEqual(len(index.impact()(pd.DataFrame([{'qid': '1', 'query_toks': {'mouse': 1.}}]))), 0)
+            self.assertEqual(len(index.impact()(pd.DataFrame([{'qid': '1', 'query_toks': {'term0': 1.}}]))), 1)
+            index.close()
+
+    def test_sharded_search(self):
+        docs = [{'docno': f'd{i}', 'text': f'doc {i} about {["cats", "dogs", "red mats", "cats and dogs"][i % 4]}'}
+                for i in range(120)]
+        topics = pd.DataFrame([{'qid': '1', 'query': 'cats'}, {'qid': '2', 'query': 'red dogs'},
+                               {'qid': '3', 'query': 'mats doc'}])
+        with tempfile.TemporaryDirectory() as d:
+            single = pyterrier_anserini.AnseriniIndex(f'{d}/single')
+            single.indexer().index(docs)
+            # appended batches add segments to each shard, which the IndexSearcher groups into several slices
+            sharded = pyterrier_anserini.AnseriniIndex(f'{d}/sharded')
+            sharded.indexer(shards=3).index(docs[:30])
+            for i in range(30, 120, 30):
+                sharded.indexer(append=True).index(docs[i:i+30])
+            self.assertGreater(len(sharded._index_searcher('BM25').getSlices()), 1)
+            for retriever in ['bm25', 'qld']:
+                pd.testing.assert_frame_equal(getattr(sharded, retriever)()(topics), getattr(single, retriever)()(topics))
+            single.close()
+            sharded.close()
+
+    def test_docno_lookup(self):
+        # many identical documents, so that scores are tied
+        docs = [{'docno': f'd{i}', 'text': ['the cat sat on the mat', 'a red cat', 'dogs and cats'][i % 3] * (1 + i % 2)}
+                for i in range(60)]
+        topics = pd.DataFrame([{'qid': '1', 'query': 'cat'}, {'qid': '2', 'query': 'red mat'}])
+        with tempfile.TemporaryDirectory() as d:
+            plain = pyterrier_anserini.AnseriniIndex(f'{d}/plain')
+            plain.indexer(docno_lookup=False).index(docs)
+            self.assertIsNone(plain._docno_lookup())
+            index = pyterrier_anserini.AnseriniIndex(f'{d}/index')
+            index.indexer().index(docs)
+            self.assertIsNotNone(index._docno_lookup())
+
+            expected = plain.bm25()(topics)
+            pd.testing.assert_frame_equal(index.bm25()(topics), expected)
+            pd.testing.assert_frame_equal(index.reranker('BM25')(expected), plain.reranker('BM25')(expected))
+            np.testing.assert_array_equal(index._lucene_docids(['d3', 'missing', 'd0']),
+                                          plain._lucene_docids(['d3', 'missing', 'd0']))
+
+            # the table is kept up to date when the index is modified, only reading the docnos of new documents
+            plain.delete(['d1', 'd2'])
+            plain.indexer(append=True).index([{'docno': 'd0', 'text': 'a red dog'}])
+            load_stored_fields = pyterrier_anserini._index._load_stored_fields
+            with mock.patch('pyterrier_anserini._index._load_stored_fields', wraps=load_stored_fields) as loads:
+                index.delete(['d1', 'd2'])
+                self.assertEqual(loads.call_count, 0)
+                index.indexer(append=True).index([{'docno': 'd0', 'text': 'a red dog'}])
+                self.assertEqual(sum(len(call.args[1]) for call in loads.call_args_list), 1)
+            self.assertIsNotNone(index._docno_lookup())
+            docnos = index._docno_lookup().docnos(np.arange(61))
+            rebuilt = pyterrier_anserini.AnseriniIndex(f'{d}/index')
+            shutil.rmtree(f'{d}/index/pt_docnos')
+            rebuilt.build_docno_lookup() # (from scratch)
+            np.testing.assert_array_equal(rebuilt._docno_lookup().docnos(np.arange(61)), docnos)
+            rebuilt.close()
+            pd.testing.assert_frame_equal(index.bm25()(topics), plain.bm25()(topics))
+            np.testing.assert_array_equal(index._lucene_docids(['d0', 'd1', 'd3']),
+                                          plain._lucene_docids(['d0', 'd1', 'd3']))
+            plain.close()
+            index.close()
+
+    def test_multi_field(self):
+        docs = [
+            {'docno': 'd1', 'title': 'chemistry', 'text': 'a paper about physics and physics experiments'},
+            {'docno': 'd2', 'title': 'physics', 'text': 'a paper about chemistry and chemistry experiments'},
+            {'docno': 'd3', 'title': 'biology', 'text': 'cells and more cells'},
+        ]
+        topics = pd.DataFrame([{'qid': '1', 'query': 'physics'}])
+        with tempfile.TemporaryDirectory() as d:
+            index = pyterrier_anserini.AnseriniIndex(f'{d}/index')
+            index.indexer(fields=['title', 'text'], multi_field=True).index(docs)
+            self.assertIn('title', index.fields())
+            self.assertIn('text', index.fields())
+
+            # searching contents alone matches searching without fields
+            pd.testing.assert_frame_equal(index.bm25(fields={'contents': 1.0})(topics), index.bm25()(topics))
+            self.assertEqual(index.bm25()(topics)['docno'].iloc[0], 'd1')
+            # boosting the title promotes the document with the query in its title
+            boosted = index.bm25(fields={'title': 10.0, 'contents': 1.0})(topics)
+            self.assertEqual(boosted['docno'].iloc[0], 'd2')
+            self.assertEqual(list(index.bm25(fields={'title': 1.0})(topics)['docno']), ['d2'])
+            toks = index.bm25(fields={'title': 1.0})(pd.DataFrame([{'qid': '1', 'query_toks': {'physic': 1.0}}]))
+            self.assertEqual(list(toks['docno']), ['d2'])
+            lucene = index.bm25(fields={'title': 1.0})(pd.DataFrame([{'qid': '1', 'query_lucene': 'physics'}]))
+            self.assertEqual(list(lucene['docno']), ['d2'])
+            reranked = index.reranker('BM25', fields={'title': 1.0})(index.bm25()(topics))
+            self.assertEqual(reranked.sort_values('rank')['docno'].iloc[0], 'd2')
+
+            loaded = index.text_loader(['title'])(pd.DataFrame([{'qid': '1', 'docno': 'd2'}]))
+            self.assertEqual(loaded['title'].iloc[0], 'physics')
+            index.close()
+
+    def test_term_stats(self):
+        docs = [
+            {'docno': 'd1', 'text': 'cats and dogs and cats'},
+            {'docno': 'd2', 'text': 'a dog chased a cat around the garden garden garden'},
+            {'docno': 'd3', 'text': 'birds'},
+        ]
+        with tempfile.TemporaryDirectory() as d:
+            for store_docvectors in [True, False]:
+                index = pyterrier_anserini.AnseriniIndex(f'{d}/index-{store_docvectors}')
+                index.indexer(store_docvectors=store_docvectors).index(docs)
+                df, cf = index.term_stats(['cat', 'garden', 'missing'])
+                np.testing.assert_array_equal(df, [2, 1, 0])
+                np.testing.assert_array_equal(cf, [3, 3, 0])
+                np.testing.assert_array_equal(index.doc_lengths(), [3, 7, 1])
+                (cat_docids, cat_freqs), (missing_docids, _) = index.postings(['cat', 'missing'])
+                self.assertEqual(list(index.docnos(cat_docids)), ['d1', 'd2'])
+                np.testing.assert_array_equal(cat_freqs, [2, 1])
+                self.assertEqual(len(missing_docids), 0)
+
+                terms, vocab_df, vocab_cf = index.vocab_stats()
+                self.assertEqual(list(terms), sorted(terms))
+                self.assertIn(b'garden', list(terms))
+                self.assertEqual(vocab_cf.sum(), index.doc_lengths().sum())
+                # the statistics are looked up in the (memory-mapped) vocabulary statistics once they are built
+                np.testing.assert_array_equal(index.term_stats(['cat', 'garden', 'missing'])[0], df)
+
+                index.delete(['d1'])
+                self.assertEqual(list(index.docnos(index.postings(['cat'])[0][0])), ['d2'])
+                lengths = index.doc_lengths()
+                self.assertEqual(lengths[index._lucene_docids(['d2'])[0]], 7)
+                self.assertEqual(lengths.sum(), 8)
+                np.testing.assert_array_equal(index.vocab_stats()[1], index.term_stats(list(terms.astype(str)))[0])
+                index.close()
+
+    def test_rebuilt_index_sidecars(self):
+        # an index rebuilt at the same path has the same segments generation, but the tables of the earlier index
+        # no longer apply to it
+        with tempfile.TemporaryDirectory() as d:
+            index = pyterrier_anserini.AnseriniIndex(f'{d}/index')
+            index.indexer().index([{'docno': 'd1', 'text': 'cats'}, {'docno': 'd2', 'text': 'dogs'}])
+            index.vocab_stats()
+            index.close()
+            shutil.move(f'{d}/index/pt_docnos', f'{d}/pt_docnos')
+            shutil.move(f'{d}/index/pt_vocab', f'{d}/pt_vocab')
+            shutil.rmtree(f'{d}/index')
+            index.indexer(docno_lookup=False).index([{'docno': 'd3', 'text': 'birds'}, {'docno': 'd4', 'text': 'cats'}])
+            shutil.move(f'{d}/pt_docnos', f'{d}/index/pt_docnos')
+            shutil.move(f'{d}/pt_vocab', f'{d}/index/pt_vocab')
+
+            rebuilt = pyterrier_anserini.AnseriniIndex(f'{d}/index')
+            self.assertIsNone(rebuilt._docno_lookup())
+            self.assertEqual(list(rebuilt.docnos([0, 1])), ['d3', 'd4'])
+            np.testing.assert_array_equal(rebuilt.term_stats(['bird', 'dog'])[0], [1, 0])
+            self.assertIn(b'bird', list(rebuilt.vocab_stats()[0]))
+            rebuilt.close()
+
+    def test_prf(self):
+        from pyserini.search.lucene import LuceneSearcher
+        docs = [
+            {'docno': 'd1', 'text': 'cats chase mice around the house'},
+            {'docno': 'd2', 'text': 'a cat sleeps on the warm house roof'},
+            {'docno': 'd3', 'text': 'dogs chase cats in the garden'},
+            {'docno': 'd4', 'text': 'birds sing in the garden trees'},
+        ]
+        # Anserini only expands with terms that appear in few documents, so the collection is padded with other topics
+        words = ['apple', 'banana', 'cherry', 'grape', 'lemon', 'mango', 'melon', 'peach', 'pear', 'plum']
+        docs += [{'docno': f'f{i}', 'text': f'{a} and {b}'} for i, (a, b) in enumerate(zip(words, words[1:] + words))]
+        docs += [{'docno': f'g{i}', 'text': f'{a} or {b}'} for i, (a, b) in enumerate(zip(words, words[2:] + words))]
+        topics = pd.DataFrame([{'qid': '1', 'query': 'cats'}, {'qid': '2', 'query': 'garden'}])
+        with tempfile.TemporaryDirectory() as d:
+            index = pyterrier_anserini.AnseriniIndex(f'{d}/index')
+            index.indexer(store_docvectors=True).index(docs)
+            for prf, setter in [
+                (index.rm3(fb_docs=2, fb_terms=5), lambda s: s.set_rm3(5, 2, 0.5)),
+                (index.rocchio(fb_docs=2, fb_terms=5), lambda s: s.set_rocchio(5, 2)),
+            ]:
+                expanded = (index.bm25() >> prf)(topics)
+                self.assertEqual(list(expanded['qid']), ['1', '2'])
+                self.assertIn('cat', expanded['query_toks'][0])
+                self.assertIn('hous', expanded['query_toks'][0])
+                results = (index.bm25() >> prf >> index.bm25())(topics)
+                searcher = LuceneSearcher(index.path)
+                setter(searcher)
+                for qid, query in zip(topics['qid'], topics['query']):
+                    self.assertEqual(
+                        list(results[results['qid'] == qid]['docno']),
+                        [hit.docid for hit in searcher.search(query, 1000)])
+                searcher.close()
+            np.testing.assert_array_equal(
+                (index.bm25() >> pyterrier_anserini.AnseriniRM3(index, threads=2, batch_size=1))(topics)['query_toks'],
+                (index.bm25() >> index.rm3())(topics)['query_toks'])
+            index.close()
+
+            index = pyterrier_anserini.AnseriniIndex(f'{d}/index-novectors')
+            index.indexer(store_docvectors=False).index(docs)
+            with self.assertRaises(ValueError):
+                (index.bm25() >> index.rm3())(topics)
+            index.close()
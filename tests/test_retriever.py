@@ -1,6 +1,12 @@
 import os
+import re
+import shutil
+import tempfile
+import threading
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import pandas as pd
 import pyterrier as pt
 
@@ -37,6 +43,15 @@ class TestAnseriniRetriever(unittest.TestCase):
     @unittest.skipUnless(pyterrier_anserini.check_version('0.36.0'), "requires pyserini>=0.36.0")
     def test_vaswani_impact(self):
         impact = self.index.impact()
+        res = impact(pd.DataFrame([
+            {'qid': '1', 'query_toks': {'chemic': 5.3, 'reaction': 1.1}},
+        ]))
+        self.assertEqual(len(res), 52)
+        self.assertAlmostEqual(res['score'][0], 10.6, places=4)
+
+        # un-analyzed tokens only match when analyze_toks is set
+        self.assertEqual(len(impact(pd.DataFrame([{'qid': '1', 'query_toks': {'chemical': 5.3}}]))), 0)
+        impact = self.index.impact(analyze_toks=True)
         res = impact(pd.DataFrame([
             {'qid': '1', 'query_toks': {'chemical': 5.3, 'reactions': 1.1}},
         ]))
@@ -51,3 +66,341 @@ class TestAnseriniRetriever(unittest.TestCase):
         res_then_content = bm25_then_content(topics)
         res_including_content = bm25_including_content(topics)
         pd.testing.assert_frame_equal(res_then_content, res_including_content)
+
+    def test_threads(self):
+        topics = pd.DataFrame([
+            {'qid': '1', 'query': 'chemical reactions', 'query_toks': {'chemic': 5.3, 'reaction': 1.1}},
+            {'qid': '2', 'query': 'aerial photography', 'query_toks': {'aerial': 1.0, 'photographi': 2.5}},
+            {'qid': '3', 'query': 'dielectric constant', 'query_toks': {'dielectr': 0.5, 'constant': 1.0}},
+        ])
+        pd.testing.assert_frame_equal(
+            self.index.bm25()(topics[['qid', 'query']]),
+            self.index.bm25(threads=2, batch_size=2)(topics[['qid', 'query']]))
+        pd.testing.assert_frame_equal(
+            self.index.bm25()(topics[['qid', 'query_toks']]),
+            self.index.bm25(threads=2)(topics[['qid', 'query_toks']]))
+        lucene = topics[['qid', 'query']].rename(columns={'query': 'query_lucene'})
+        pd.testing.assert_frame_equal(
+            self.index.bm25(include_fields=['contents'])(lucene),
+            self.index.bm25(include_fields=['contents'], threads=3, batch_size=2)(lucene))
+        # each similarity has its own index searcher, so the shared searcher is not modified
+        pd.testing.assert_frame_equal(
+            self.index.qld()(topics[['qid', 'query']]),
+            self.index.qld(threads=2)(topics[['qid', 'query']]))
+        pd.testing.assert_frame_equal(
+            self.index.bm25()(topics[['qid', 'query']]),
+            self.index.bm25(threads=2)(topics[['qid', 'query']]))
+
+    def test_concurrent_similarities(self):
+        # retrievers with different similarities (and so different searchers) search concurrently, each with threads
+        topics = pd.DataFrame([{'qid': str(i), 'query': q, 'query_toks': {w: 1.0 for w in q.split()}} for i, q in
+            enumerate(['chemic reaction', 'aerial photographi', 'dielectr constant', 'electron beam', 'solar cell'])])
+        retrievers = [self.index.bm25(threads=2, batch_size=2), self.index.qld(threads=2, batch_size=2),
+                      self.index.tfidf(threads=2, batch_size=2)]
+        inputs = [topics[['qid', 'query']], topics[['qid', 'query_toks']]]
+        expected = [[r(inp) for inp in inputs] for r in retrievers]
+        with ThreadPoolExecutor(len(retrievers)) as executor:
+            for _ in range(5):
+                futures = [[executor.submit(r, inp) for inp in inputs] for r in retrievers]
+                for r_futures, r_expected in zip(futures, expected):
+                    for future, exp in zip(r_futures, r_expected):
+                        pd.testing.assert_frame_equal(future.result(), exp)
+
+    def test_docno_lookup_score_ties(self):
+        # With a docno lookup table, the adjustment of tied scores by Anserini's ScoreTiesAdjusterReranker is
+        # replicated, which must match the reranker itself over a full run
+        rng = np.random.default_rng(0)
+        words = [w for w in re.findall('[a-z]+', ' '.join(self.index.text_loader(['contents'])(pd.DataFrame(
+            {'qid': '1', 'docno': self.index.docnos(np.arange(0, self.index.num_docs(), 97))}))['contents']).lower())
+            if len(w) > 2]
+        topics = pd.DataFrame({'qid': [str(i) for i in range(50)],
+                               'query': [' '.join(rng.choice(words, size=int(rng.integers(1, 5)))) for _ in range(50)]})
+        with tempfile.TemporaryDirectory() as d:
+            shutil.copytree(self.index.path, f'{d}/index', ignore=shutil.ignore_patterns('write.lock'))
+            index = pyterrier_anserini.AnseriniIndex(f'{d}/index')
+            index.build_docno_lookup()
+            self.assertIsNotNone(index._docno_lookup())
+            for retriever in ['bm25', 'qld', 'tfidf']:
+                expected = getattr(self.index, retriever)()(topics)
+                self.assertGreater(len(expected), 10_000)
+                pd.testing.assert_frame_equal(getattr(index, retriever)()(topics), expected)
+            index.close()
+
+    def test_few_results(self):
+        topics = pd.DataFrame([
+            {'qid': '1', 'query': 'chemical reactions'},
+            {'qid': '2', 'query': 'xyzzyplugh'}, # no results
+            {'qid': '3', 'query': 'aerial photography'},
+        ])
+        res = self.index.bm25(num_results=1)(topics)
+        self.assertEqual(list(res['qid']), ['1', '3'])
+        self.assertEqual(list(res['rank']), [0, 0])
+        self.assertEqual(list(res.columns), ['qid', 'query', 'docno', 'score', 'rank'])
+        res = self.index.bm25()(topics[topics['qid'] == '2'])
+        self.assertEqual(len(res), 0)
+        self.assertEqual(list(res.columns), ['qid', 'query', 'docno', 'score', 'rank'])
+
+    def test_reranker(self):
+        res = self.index.bm25(num_results=20)(pd.DataFrame([
+            {'qid': '1', 'query': 'chemical reactions'},
+            {'qid': '2', 'query': 'aerial photography'},
+        ]))
+        res = pd.concat([res, pd.DataFrame([{'qid': '1', 'query': 'chemical reactions', 'docno': 'missing'}])])
+        reranked = self.index.reranker('BM25')(res.sample(frac=1., random_state=42))
+        reranked = reranked.set_index(['qid', 'docno']).loc[list(zip(res['qid'], res['docno']))]
+        np.testing.assert_allclose(reranked['score'].values[:-1], res['score'].values[:-1], atol=1e-4)
+        self.assertEqual(reranked['score'].values[-1], 0.)
+
+    def test_reranker_query_modes(self):
+        topics = pd.DataFrame([
+            {'qid': '1', 'query_toks': {'chemic': 5.3, 'reaction': 1.1}, 'query_lucene': 'chemical OR reactions^2'},
+            {'qid': '2', 'query_toks': {'aerial': 1.0, 'photographi': 2.5}, 'query_lucene': '+aerial photography'},
+        ])
+        for col in ['query_toks', 'query_lucene']:
+            with self.subTest(col):
+                res = self.index.bm25(num_results=20)(topics[['qid', col]])
+                reranked = self.index.reranker('BM25')(res.sample(frac=1., random_state=42))
+                reranked = reranked.set_index(['qid', 'docno']).loc[list(zip(res['qid'], res['docno']))]
+                np.testing.assert_allclose(reranked['score'].values, res['score'].values, atol=1e-4)
+
+    def test_features(self):
+        res = self.index.bm25(num_results=20)(pd.DataFrame([
+            {'qid': '1', 'query': 'chemical reactions'},
+            {'qid': '2', 'query': 'aerial photography'},
+        ]))
+        res = pd.concat([res, pd.DataFrame([{'qid': '1', 'query': 'chemical reactions', 'docno': 'missing'}])])
+        res = res.sample(frac=1., random_state=42).reset_index(drop=True)
+        similarities = ['BM25', ('BM25', {'bm25.k1': 1.2}), 'QLD', 'TFIDF']
+        features = self.index.features(similarities + ['doc_length', 'matched_terms'])(res)
+        self.assertEqual(list(features['docno']), list(res['docno']))
+        features = np.stack(features['features'])
+        self.assertEqual(features.shape, (len(res), 6))
+        for i, similarity in enumerate(similarities):
+            reranker = self.index.reranker(*similarity) if isinstance(similarity, tuple) else self.index.reranker(similarity)
+            np.testing.assert_array_equal(features[:, i], reranker(res)['score'].values)
+        lucene_docids = self.index._lucene_docids(res['docno'])
+        found = lucene_docids >= 0
+        np.testing.assert_array_equal(features[found, 4], self.index.doc_lengths()[lucene_docids[found]])
+        self.assertTrue(((features[:, 5] >= 1) == (features[:, 0] > 0)).all())
+        self.assertTrue((features[:, 5] <= 2).all())
+        self.assertTrue((features[res['docno'] == 'missing'] == 0).all())
+
+    def test_query_toks_many_terms(self):
+        toks = {f'unmatched{i}': 1.0 for i in range(5000)}
+        toks['chemic'] = 5.3
+        res = self.index.bm25(num_results=10)(pd.DataFrame([{'qid': '1', 'query_toks': toks}]))
+        self.assertEqual(len(res), 10)
+        # the clauses of every field count towards the limit
+        toks['unmatched5000'] = 1.0
+        fields = {'contents': 1.0, 'title': 0.5}
+        res = self.index.bm25(num_results=10, fields=fields)(pd.DataFrame([{'qid': '1', 'query_toks': toks}]))
+        self.assertEqual(len(res), 10)
+
+    def test_text_loader(self):
+        res = self.index.bm25(num_results=50, include_fields=['contents'])(pd.DataFrame([
+            {'qid': '1', 'query': 'chemical reactions'},
+            {'qid': '2', 'query': 'chemical compounds'}, # shares some documents with qid 1
+        ]))
+        res.index = res.index + 100
+        inp = res.drop(columns=['contents'])
+        expected = res.reset_index(drop=True)
+        pd.testing.assert_frame_equal(self.index.text_loader(['contents'])(inp), expected)
+        pd.testing.assert_frame_equal(self.index.text_loader(['contents'], threads=3)(inp), expected)
+        # existing columns are replaced
+        pd.testing.assert_frame_equal(self.index.text_loader(['contents'])(inp.assign(contents='')), expected)
+
+    def test_text_cache(self):
+        index = pyterrier_anserini.AnseriniIndex(self.index.path, text_cache=10_000_000)
+        topics = pd.DataFrame([{'qid': '1', 'query': 'chemical reactions'}, {'qid': '2', 'query': 'chemical compounds'}])
+        expected = self.index.bm25(num_results=50, include_fields=['contents'])(topics)
+        pd.testing.assert_frame_equal(index.bm25(num_results=50, include_fields=['contents'])(topics), expected)
+        self.assertEqual(index.text_cache.hits, 0)
+        misses = index.text_cache.misses
+        self.assertEqual(misses, expected['docno'].nunique())
+        # the text loader uses the text that the retriever cached
+        loaded = index.text_loader(['contents'])(expected.drop(columns=['contents']))
+        pd.testing.assert_frame_equal(loaded, expected)
+        self.assertEqual(index.text_cache.hits, misses)
+        self.assertEqual(index.text_cache.misses, misses)
+
+        cache = pyterrier_anserini.AnseriniTextCache(max_bytes=5_000)
+        index = pyterrier_anserini.AnseriniIndex(self.index.path, text_cache=cache)
+        pd.testing.assert_frame_equal(index.text_loader(['contents'])(expected.drop(columns=['contents'])), expected)
+        self.assertLessEqual(cache.size_bytes, 5_000)
+        self.assertLess(len(cache), misses)
+
+    def test_result_cache(self):
+        topics = pd.DataFrame([{'qid': '1', 'query': 'chemical reactions'}, {'qid': '2', 'query': 'aerial photography'}])
+        expected = self.index.bm25(num_results=50)(topics)
+        with tempfile.TemporaryDirectory() as d:
+            cache = pyterrier_anserini.AnseriniResultCache(max_bytes=10_000_000, path=f'{d}/results.sqlite')
+            index = pyterrier_anserini.AnseriniIndex(self.index.path, result_cache=cache)
+            pd.testing.assert_frame_equal(index.bm25(num_results=50)(topics), expected)
+            self.assertEqual((cache.hits, cache.misses), (0, 2))
+            pd.testing.assert_frame_equal(index.bm25(num_results=50)(topics), expected)
+            self.assertEqual((cache.hits, cache.misses), (2, 2))
+            # different settings are cached separately
+            pd.testing.assert_frame_equal(index.qld(num_results=50)(topics), self.index.qld(num_results=50)(topics))
+            index.bm25(num_results=10, include_fields=['contents'])(topics)
+            self.assertEqual((cache.hits, cache.misses), (2, 6))
+            # numpy settings and weights can be part of keys
+            toks = pd.DataFrame([{'qid': '1', 'query_toks': {'chemic': np.float32(1.5)}}])
+            pd.testing.assert_frame_equal(index.bm25(k1=np.float32(0.9))(toks),
+                                          self.index.bm25(k1=np.float32(0.9))(toks))
+            cache.close()
+
+            # the results persist on disk
+            cache = pyterrier_anserini.AnseriniResultCache(max_bytes=10_000_000, path=f'{d}/results.sqlite')
+            index = pyterrier_anserini.AnseriniIndex(self.index.path, result_cache=cache)
+            pd.testing.assert_frame_equal(index.bm25(num_results=50)(topics), expected)
+            self.assertEqual((cache.hits, cache.misses), (2, 0))
+            cache.close()
+
+            # results are not served once the index changes
+            index = pyterrier_anserini.AnseriniIndex(f'{d}/index', result_cache=10_000_000)
+            index.indexer().index([{'docno': 'd1', 'text': 'chemical reactions'}, {'docno': 'd2', 'text': 'aerial'}])
+            self.assertEqual(list(index.bm25()(topics)['docno']), ['d1', 'd2'])
+            index.delete(['d2'])
+            self.assertEqual(list(index.bm25()(topics)['docno']), ['d1'])
+            self.assertEqual(index.result_cache.hits, 0)
+            index.close()
+
+            # nor are the results of an earlier index that was built at the same path
+            for docs in [[{'docno': 'd1', 'text': 'chemical reactions'}], [{'docno': 'd9', 'text': 'chemical aerial'}]]:
+                shutil.rmtree(f'{d}/index')
+                cache = pyterrier_anserini.AnseriniResultCache(max_bytes=10_000_000, path=f'{d}/rebuilt.sqlite')
+                index = pyterrier_anserini.AnseriniIndex(f'{d}/index', result_cache=cache)
+                index.indexer().index(docs)
+                self.assertEqual(set(index.bm25()(topics)['docno']), {docs[0]['docno']})
+                self.assertEqual(cache.hits, 0)
+                index.close()
+                cache.close()
+
+    def test_stats(self):
+        topics = pd.DataFrame([{'qid': '1', 'query': 'chemical reactions'}, {'qid': '2', 'query': 'aerial photography'}])
+        records = []
+        stats = pyterrier_anserini.AnseriniStats(callback=lambda kind, name, value: records.append((kind, name)))
+        index = pyterrier_anserini.AnseriniIndex(self.index.path, stats=stats)
+        pipeline = index.bm25(num_results=20) >> index.reranker('QLD') >> index.text_loader(['contents'])
+        pd.testing.assert_frame_equal(pipeline(topics),
+            (self.index.bm25(num_results=20) >> self.index.reranker('QLD') >> self.index.text_loader(['contents']))(topics))
+        self.assertEqual(stats.counters['AnseriniIndex.searcher_opens'], 1)
+        self.assertEqual(stats.counters['AnseriniRetriever.queries'], 2)
+        self.assertEqual(stats.counters['AnseriniReRanker.docs'], 40)
+        self.assertEqual(stats.counters['AnseriniTextLoader.docs'], 40)
+        self.assertEqual(stats.counters['AnseriniTextLoader.docs_read'], 40)
+        self.assertGreaterEqual(stats.counters['AnseriniRetriever.hits_scored'], 40)
+        self.assertLessEqual(stats.counters['AnseriniReRanker.hits_scored'], 40)
+        for component in ['AnseriniRetriever', 'AnseriniReRanker', 'AnseriniTextLoader']:
+            self.assertGreater(stats.counters[f'{component}.jvm_calls_est'], 0)
+        summary = stats.summary()
+        self.assertEqual(summary.set_index('name')['calls']['AnseriniRetriever.search'], 2)
+        self.assertTrue({'AnseriniIndex.open_searcher', 'AnseriniRetriever.parse', 'AnseriniRetriever.assemble',
+            'AnseriniReRanker.score', 'AnseriniTextLoader.read_text'} <= set(summary['name']))
+        self.assertIn(('time', 'AnseriniRetriever.search'), records)
+        self.assertIn(('count', 'AnseriniIndex.searcher_opens'), records)
+        stats.reset()
+        self.assertEqual(len(stats.summary()), 0)
+        # nothing is recorded without stats
+        self.assertIsNone(self.index.stats)
+
+    def test_parallel(self):
+        topics = pd.DataFrame([
+            {'qid': '1', 'query': 'chemical reactions'},
+            {'qid': '2', 'query': 'aerial photography'},
+            {'qid': '3', 'query': 'dielectric constant'},
+            {'qid': '4', 'query': 'zzzunmatchedzzz'},
+            {'qid': '5', 'query': 'transistor amplifier'},
+        ])
+        retriever = self.index.bm25(num_results=20, include_fields=['contents'])
+        with retriever.parallel(2, batch_size=2) as parallel:
+            pd.testing.assert_frame_equal(parallel(topics), retriever(topics))
+            toks = topics.assign(query_toks=[{'chemic': 1., 'reaction': 2.}, {'aerial': 1.}, {}, {'x': 1.}, {'amplifi': 0.5}])
+            pd.testing.assert_frame_equal(parallel(toks), retriever(toks))
+            pd.testing.assert_frame_equal(parallel(topics.iloc[:0]), retriever(topics.iloc[:0]))
+
+    def test_asearch(self):
+        import asyncio
+        retriever = self.index.bm25(num_results=10)
+        queries = ['chemical reactions', 'aerial photography', 'zzzunmatchedzzz', 'dielectric constant', 'transistor']
+
+        async def run() -> list:
+            async with retriever.async_searcher(max_batch_size=2, max_wait=0.05, threads=2) as searcher:
+                results = await asyncio.gather(*[searcher.search(q, qid=str(i)) for i, q in enumerate(queries)])
+            results.append(await retriever.asearch(queries[0], qid='x'))
+            return results
+        results = asyncio.run(run())
+        for i, query in enumerate(queries):
+            pd.testing.assert_frame_equal(results[i], retriever.search(query, qid=str(i)))
+        pd.testing.assert_frame_equal(results[-1], retriever.search(queries[0], qid='x'))
+
+        # asearch works from a new event loop, and the searcher of a closed loop is closed
+        result = asyncio.run(retriever.asearch(queries[2], qid='y'))
+        pd.testing.assert_frame_equal(result, retriever.search(queries[2], qid='y'))
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(retriever.asearch(queries[1]))
+        loop.close()
+        searcher = retriever._async_searchers[loop]
+        asyncio.run(retriever.asearch(queries[1]))
+        self.assertIsNone(searcher._pool)
+        self.assertNotIn(loop, retriever._async_searchers)
+        retriever.close()
+        self.assertFalse(any(t.name.startswith('AnseriniAsyncSearcher') for t in threading.enumerate()))
+
+    def test_early_termination(self):
+        topics = pd.DataFrame([
+            {'qid': '1', 'query': 'chemical reactions of the dielectric constant in aerial photography'},
+            {'qid': '2', 'query': 'transistor'},
+            {'qid': '3', 'query': 'zzzunmatchedzzz'},
+        ])
+        for num_results in [1, 10, 100]:
+            exact = self.index.bm25(num_results=num_results, include_total_hits=True)(topics)
+            pruned = self.index.bm25(num_results=num_results, early_termination=True, include_total_hits=True)(topics)
+            self.assertEqual(list(pruned['qid']), list(exact['qid']))
+            np.testing.assert_allclose(pruned['score'], exact['score'], rtol=1e-6)
+            for qid, q_exact in exact.groupby('qid'):
+                q_pruned = pruned[pruned['qid'] == qid]
+                # (the documents tied with the last result may differ)
+                threshold = q_exact['score'].min()
+                self.assertEqual(set(q_pruned[q_pruned['score'] > threshold]['docno']),
+                                 set(q_exact[q_exact['score'] > threshold]['docno']))
+                self.assertEqual(q_exact['total_hits'].nunique(), 1)
+                self.assertGreaterEqual(q_pruned['total_hits'].iloc[0], len(q_pruned))
+                self.assertLessEqual(q_pruned['total_hits'].iloc[0], q_exact['total_hits'].iloc[0])
+            self.assertEqual(pruned['total_hits'].dtype, np.int64)
+            # the total hits of the long query are only counted up to the threshold
+            self.assertGreater(exact[exact['qid'] == '1']['total_hits'].iloc[0], 100)
+
+        # below the threshold, the total hits are exact
+        pruned = self.index.bm25(num_results=10, early_termination=True, total_hits_threshold=100_000,
+                                 include_total_hits=True)(topics)
+        self.assertEqual(list(pruned['total_hits']), list(exact[exact['rank'] < 10]['total_hits']))
+        self.assertNotIn('total_hits', self.index.bm25(num_results=10, early_termination=True)(topics).columns)
+        # thresholds below num_results terminate as early as the default
+        pd.testing.assert_frame_equal(
+            self.index.bm25(num_results=10, early_termination=True, total_hits_threshold=1, include_total_hits=True)(topics),
+            self.index.bm25(num_results=10, early_termination=True, include_total_hits=True)(topics))
+
+    def test_streaming(self):
+        topics = pd.DataFrame([
+            {'qid': '1', 'query': 'chemical reactions'},
+            {'qid': '2', 'query': 'aerial photography'},
+            {'qid': '3', 'query': 'dielectric constant'},
+        ])
+        bm25 = self.index.bm25(num_results=10)
+        expected = bm25(topics)
+        chunks = list(bm25.transform_chunks(topics, batch_size=2))
+        self.assertEqual([c['qid'].nunique() for c in chunks], [2, 1])
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected)
+
+        # generators are consumed lazily
+        records = bm25(r for r in topics.to_dict(orient='records'))
+        self.assertNotIsInstance(records, list)
+        pd.testing.assert_frame_equal(pd.DataFrame(list(records)), expected)
+
+        with tempfile.TemporaryDirectory() as d:
+            self.assertEqual(bm25.write_run(topics, f'{d}/run.txt', run_name='test', batch_size=1), len(expected))
+            run = pt.io.read_results(f'{d}/run.txt')
+            self.assertEqual(list(run['docno']), list(expected['docno']))
+            self.assertEqual(bm25.write_run(iter(topics.to_dict(orient='records')), f'{d}/run.parquet'), len(expected))
+            pd.testing.assert_frame_equal(pd.read_parquet(f'{d}/run.parquet'), expected)